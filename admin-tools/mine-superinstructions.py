@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Count the instruction pairs and triples in a corpus of bytecode files
+that xpython could run as superinstructions.
+
+The arguments are .pyc files or directories to search for them, for
+example test/bytecode-*. Counts are kept separately for each bytecode
+version. Only function bodies are counted unless --all-code is given.
+With --table, a SUPERINSTRUCTIONS table for xpython/superinstructions.py
+is printed instead of the counts.
+"""
+import os
+import os.path as osp
+import sys
+from collections import Counter, defaultdict
+
+import click
+from xdis import get_opcode, load_module
+
+sys.path.insert(0, osp.join(osp.dirname(__file__), ".."))
+from xpython.superinstructions import count_sequences  # noqa
+
+
+def pyc_files(paths):
+    for path in paths:
+        if osp.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(".pyc"):
+                        yield osp.join(root, name)
+        else:
+            yield path
+
+
+@click.command()
+@click.option("--top", default=10, help="number of sequences to show per version")
+@click.option("--table", is_flag=True, help="print a SUPERINSTRUCTIONS table")
+@click.option("--all-code", is_flag=True, help="count module and class bodies too")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True), required=True)
+def main(top, table, all_code, paths):
+    counts = defaultdict(Counter)
+    for path in pyc_files(paths):
+        try:
+            version, _, _, code, is_pypy, _, _ = load_module(path)
+        except Exception as e:
+            print(f"# skipping {path}: {e}", file=sys.stderr)
+            continue
+        if is_pypy:
+            continue
+        version = tuple(version[:2])
+        opc = get_opcode(version, is_pypy)
+        counts[version].update(
+            count_sequences(code, opc, functions_only=not all_code)
+        )
+
+    if table:
+        print("SUPERINSTRUCTIONS: Dict[Tuple[int, int], Tuple[Tuple[str, ...], ...]] = {")
+        for version in sorted(counts):
+            print(f"    {version}: (")
+            for sequence, _ in counts[version].most_common(top):
+                print(f"        {sequence!r},")
+            print("    ),")
+        print("}")
+        return
+
+    for version in sorted(counts):
+        print("Python %d.%d:" % version)
+        for sequence, count in counts[version].most_common(top):
+            print("%8d  %s" % (count, " ".join(sequence)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Report the memory used by each of xpython's core runtime objects:
+Frame, Block, Cell, Method, Generator and Traceback.
+
+Each kind of object is made --count times while tracemalloc is on, and
+what is allocated, divided by the count, is reported as the bytes per
+object. This includes the containers an object makes for itself, such
+as a Frame's stack, but not things that objects share, like the code.
+A Frame is made as for a call to a method with two arguments, and a
+Generator is counted together with the Frame it runs.
+"""
+import os.path as osp
+import sys
+import tracemalloc
+
+import click
+
+sys.path.insert(0, osp.join(osp.dirname(__file__), ".."))
+from xpython.pyobj import (  # noqa
+    BLOCK_LOOP,
+    Block,
+    Cell,
+    Method,
+    Traceback,
+)
+from xpython.vm import PyVM  # noqa
+
+SOURCE = """\
+class Point:
+    def norm(self, x, y):
+        total = x * x + y * y
+        return total
+
+def numbers(n):
+    for i in range(n):
+        yield i
+"""
+
+
+def bytes_per_object(make, count: int) -> float:
+    """Return the memory allocated by `make()`, averaged over `count`
+    calls. The objects are kept alive until they are all measured."""
+    objects = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(count):
+        objects.append(make())
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(
+        stat.size_diff
+        for stat in after.compare_to(before, "filename")
+        if stat.size_diff > 0
+    )
+    # Don't count the list of objects itself.
+    allocated -= sys.getsizeof(objects)
+    return allocated / count
+
+
+@click.command()
+@click.option("--count", default=10000, help="number of objects of each kind")
+def main(count):
+    vm = PyVM()
+    namespace = {"__builtins__": __builtins__, "__name__": "__main__"}
+    vm.run_code(compile(SOURCE, "<object-sizes>", "exec"), namespace)
+    Point = namespace["Point"]
+    norm = Point.__dict__["norm"]
+    point = Point()
+    numbers = namespace["numbers"]
+
+    def make_frame():
+        # As for a call to point.norm(3, 4).
+        return norm.make_call_frame((point, 3, 4), {})
+
+    frame = make_frame()
+    makers = (
+        ("Frame", make_frame),
+        ("Block", lambda: Block(BLOCK_LOOP, 10, 0)),
+        ("Cell", lambda: Cell(None)),
+        ("Method", lambda: Method(point, Point, norm)),
+        ("Generator", lambda: numbers(3)),
+        ("Traceback", lambda: Traceback(frame, 0, 1)),
+    )
+    print(f"{'object':<12}{'bytes':>8}")
+    for name, make in makers:
+        print(f"{name:<12}{bytes_per_object(make, count):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# A return in a finally clause leaves code after it that can't be
+# reached. Python 3.8 ends the function with a POP_TOP, and 2.7 with an
+# END_FINALLY. test_verify checks that the verifier accepts this.
+
+
+def g3():
+    try:
+        return 1
+    finally:
+        return 3
+
+
+assert g3() == 3
@@ -0,0 +1,58 @@
+# Functions made of arithmetic, loops, calls and simple try blocks,
+# which can be translated ahead of time into native code.
+
+"""This program is self-checking!"""
+
+
+def checked_divide(a, b):
+    try:
+        return a // b
+    except ZeroDivisionError:
+        return None
+
+
+def running_total(items, scale=2):
+    total = 0
+    for x in items:
+        if x % 3 == 0:
+            total += x * scale
+        elif x > 10:
+            break
+        else:
+            try:
+                total -= checked_divide(10, x - 1)
+            except TypeError:
+                total -= 100
+    return total
+
+
+def count_down(n):
+    steps = []
+    while n > 0:
+        n -= 1
+        if n == 2:
+            continue
+        steps.append(n)
+    return steps
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def scaled(self, k=1):
+        return Point(self.x * k, self.y * k)
+
+
+def make_points(n):
+    return [Point(i, -i).scaled(k=2) for i in range(n)]
+
+
+assert checked_divide(7, 2) == 3
+assert checked_divide(1, 0) is None
+assert running_total(list(range(9))) == -99
+assert running_total([2, 11, 3]) == -10
+assert count_down(5) == [4, 3, 1, 0]
+points = make_points(3)
+assert [(p.x, p.y) for p in points] == [(0, 0), (2, -2), (4, -4)]
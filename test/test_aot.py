@@ -0,0 +1,140 @@
+"""Tests for ahead-of-time translation in x-python."""
+import os.path as osp
+import sys
+import types
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython import execfile
+
+SOURCE = """\
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+def total(items, scale=2, *rest, **kw):
+    t = 0
+    for x in items:
+        if x % 3 == 0:
+            t += x * scale
+        elif x > 10:
+            break
+        else:
+            t -= 1
+    return t, {"a": t}, items[1:3], rest, kw
+
+class P(object):
+    def __init__(self, x):
+        self.x = x
+
+    def m(self, k=1):
+        return self.x + k
+
+def calls():
+    p = P(3)
+    return p.m(), p.m(k=5), sorted([3, 1, 2], reverse=True)
+
+def gen(n):
+    yield n
+
+def maybe(n):
+    for i in range(n):
+        if i > 5:
+            y = i
+    return y
+"""
+
+SRCDIR = osp.dirname(osp.abspath(__file__))
+
+# Bytecode after 3.10 isn't translated.
+skip_if_no_aot = unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] > (3, 10),
+    "no ahead-of-time translation for %d.%d" % sys.version_info[:2],
+)
+
+
+class TestAOT(vmtest.VmTestCase):
+    def run_source(self, aot):
+        return self.run_module(SOURCE, aot=aot)
+
+    def results(self, namespace):
+        return (
+            namespace["fib"](12),
+            namespace["total"](list(range(20))),
+            namespace["total"]([1, 12, 3], 3, 4, k=5),
+            namespace["calls"](),
+            list(namespace["gen"](3)),
+            namespace["maybe"](10),
+        )
+
+    @skip_if_no_aot
+    def test_same_results(self):
+        self.assert_same_results(SOURCE, self.results, dict(aot=False), dict(aot=True))
+
+    @skip_if_no_aot
+    def test_self_checking(self):
+        self.run_self_checking(aot=True)
+
+    @skip_if_no_aot
+    def test_report(self):
+        vm, namespace = self.run_source(aot=True)
+        self.assertIsInstance(namespace["fib"]._aot, types.FunctionType)
+        self.assertIsNone(namespace["gen"]._aot)
+        report = vm.aot.report
+        converted = [name.split()[0] for name in report.converted]
+        for name in ("fib", "total", "__init__", "m", "calls", "maybe"):
+            self.assertIn(name, converted)
+        interpreted = {name.split()[0]: reason for name, reason in report.interpreted}
+        self.assertEqual(interpreted, {"gen": "generator or coroutine"})
+        filename = namespace["fib"].__code__.co_filename
+        self.assertIn("converted:   fib (%s:1)" % filename, report.format())
+
+    @skip_if_no_aot
+    def test_reassigned(self):
+        # A native function is made again for new defaults or code.
+        _, namespace = self.run_source(aot=True)
+        total = namespace["total"]
+        total.__defaults__ = (5,)
+        self.assertEqual(total([3])[0], 15)
+        total.__kwdefaults__ = None
+        total.__code__ = namespace["fib"].__code__
+        self.assertEqual(total(12), 144)
+
+    def test_no_builtins(self):
+        # A function whose globals have no builtins is left interpreted,
+        # since native code could get ours. The program checks that.
+        for version in ("2.7", "3.6", "3.7"):
+            vm = self.run_bytecode(version, "test_no_builtins")
+            if vm.last_exception is not None:
+                self.assertIsNot(vm.last_exception[0], AssertionError)
+
+    @skip_if_no_aot
+    def test_unbound_local(self):
+        _, namespace = self.run_source(aot=True)
+        self.assertRaises(UnboundLocalError, namespace["maybe"], 3)
+
+    def run_bytecode(self, version: str, name: str):
+        path = osp.join(SRCDIR, f"bytecode-{version}", f"{name}.pyc")
+        with redirect_stdout(StringIO()):
+            return execfile.run_python_file(path, [], aot=True)
+
+    def test_cross_version(self):
+        # The program checks its own results.
+        for version in ("2.7", "3.6"):
+            vm = self.run_bytecode(version, "test_native_subset")
+            names = [name.split()[0] for name in vm.aot.report.converted]
+            for name in ("checked_divide", "running_total", "count_down", "scaled"):
+                self.assertIn(name, names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -149,6 +149,37 @@ class TestBasic(vmtest.VmTestCase):
                 raises=NameError,
             )
 
+        def test_name_resolution(self):
+            self.assert_ok(
+                """\
+                def f():
+                    return len("abc")
+                print(f())
+                len = lambda x: "global len"
+                print(f())
+                del len
+                print(f())
+
+                class Namespace(dict):
+                    def __getitem__(self, name):
+                        if name == "magic":
+                            return 42
+                        return dict.__getitem__(self, name)
+
+                class Meta(type):
+                    @classmethod
+                    def __prepare__(metacls, name, bases):
+                        return Namespace()
+                    def __new__(metacls, name, bases, ns):
+                        return type.__new__(metacls, name, bases, dict(ns))
+
+                class C(metaclass=Meta):
+                    x = magic
+                    y = len("ab")
+                print(C.x, C.y)
+                """
+            )
+
         def test_classes(self):
             self.assert_ok(
                 """\
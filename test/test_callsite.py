@@ -0,0 +1,95 @@
+"""Tests for call-site caches in x-python."""
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython.callsite import (
+    CALL_BOUND_METHOD,
+    CALL_INTERPRETED,
+    CALL_NATIVE,
+    CALL_SITE_SIZE,
+    CALL_SPECIAL_BUILTIN,
+    CALL_TYPE,
+)
+from xpython.pyobj import Function, Method
+
+SOURCE = """\
+class Thing:
+    def get(self, x):
+        return x
+
+def call(f, *args):
+    return f(*args)
+
+def apply(f, x):
+    return f(x)
+
+def sites():
+    thing = Thing()
+    get = thing.get
+    return get(1), ord("a"), globals() is not None, type("T", (), {}).__name__
+"""
+
+
+class TestCallSite(vmtest.VmTestCase):
+    def run_source(self, **options):
+        return self.run_module(SOURCE, **options)
+
+    def strategies(self, vm, fn):
+        """The strategies cached by the call sites of `fn`."""
+        decoded = vm.decode_cache.get(fn.__code__)
+        strategies = {}
+        for site in decoded.call_sites.values():
+            strategies.update(site.strategies)
+        return strategies
+
+    def test_strategies(self):
+        vm, namespace = self.run_source()
+        self.assertEqual(namespace["sites"](), (1, 97, True, "T"))
+        strategies = self.strategies(vm, namespace["sites"])
+        if PYTHON_VERSION_TRIPLE[:2] < (3, 11):
+            # Starting in 3.11, PRECALL takes bound methods apart.
+            self.assertEqual(strategies[Method], CALL_BOUND_METHOD)
+        self.assertEqual(strategies[Function], CALL_INTERPRETED)
+        self.assertEqual(strategies[id(globals)], CALL_SPECIAL_BUILTIN)
+        self.assertEqual(strategies[id(type)], CALL_TYPE)
+        # Other built-in functions are cached by their type.
+        self.assertEqual(strategies[type(ord)], CALL_NATIVE)
+        self.assertNotIn(id(ord), strategies)
+
+    def test_type_and_classes(self):
+        # type() is told apart from other classes, which have it as
+        # their type.
+        _, namespace = self.run_source()
+        call = namespace["call"]
+        self.assertEqual(call(str, 5), "5")
+        self.assertEqual(call(type, "T", (), {}).__module__, "__main__")
+
+    def test_megamorphic(self):
+        vm, namespace = self.run_source()
+        apply = namespace["apply"]
+        get = namespace["Thing"]().get
+        for fn in (len, str, list, tuple, set, sorted, get, lambda x: x):
+            self.assertEqual(apply(fn, [2, 1]), fn([2, 1]))
+        (site,) = vm.decode_cache.get(apply.__code__).call_sites.values()
+        self.assertEqual(len(site.strategies), CALL_SITE_SIZE)
+        # Once the site is full, what it hasn't seen is still called
+        # correctly.
+        self.assertEqual(apply(abs, -1), 1)
+        self.assertIs(namespace["call"](globals), namespace)
+        self.assertEqual(len(site.strategies), CALL_SITE_SIZE)
+
+    def test_no_call_sites(self):
+        vm, namespace = self.run_source(call_sites=False)
+        self.assertEqual(namespace["sites"](), (1, 97, True, "T"))
+        decoded = vm.decode_cache.get(namespace["sites"].__code__)
+        self.assertEqual(decoded.call_sites, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
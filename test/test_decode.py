@@ -0,0 +1,74 @@
+"""Tests for the decode-once instruction cache in x-python."""
+import unittest
+
+from xdis import PYTHON_VERSION_TRIPLE, get_opcode
+
+from xpython.decode import DecodeCache, LineTable
+
+
+# Starting in 3.11, code starts with a RESUME on line 0.
+FIRST_LINE = 0 if PYTHON_VERSION_TRIPLE[:2] >= (3, 11) else 1
+
+
+def _code(source):
+    return compile(source, "<test_decode>", "exec")
+
+
+class TestDecodeCache(unittest.TestCase):
+    def setUp(self):
+        self.opc = get_opcode(PYTHON_VERSION_TRIPLE[:2], False)
+
+    def test_decode_once(self):
+        cache = DecodeCache(self.opc, PYTHON_VERSION_TRIPLE)
+        code = _code("x = 1\ny = x + 2\n")
+        entry = cache.get(code)
+        self.assertIs(entry, cache.get(code))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIn(code, cache)
+
+        first = entry.instructions[0]
+        self.assertEqual(first.offset, 0)
+        self.assertEqual(first.line_number, FIRST_LINE)
+        # Every instruction can be reached by following next_offset.
+        offset, seen = 0, 0
+        while offset < len(code.co_code):
+            inst = entry.instructions[offset]
+            self.assertIsNotNone(inst)
+            offset = inst.next_offset
+            seen += 1
+        self.assertEqual(seen, entry.count)
+
+    def test_eviction(self):
+        code1 = _code("a = 1\n")
+        code2 = _code("b = 2\n")
+        cache = DecodeCache(self.opc, PYTHON_VERSION_TRIPLE, max_instructions=1)
+        cache.get(code1)
+        cache.get(code2)
+        # The most recently used entry always stays.
+        self.assertEqual(len(cache), 1)
+        self.assertNotIn(code1, cache)
+        self.assertIn(code2, cache)
+        self.assertEqual(cache.size, cache.get(code2).count)
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_line_table(self):
+        table = LineTable([(0, 1), (6, 2), (10, 4)])
+        self.assertEqual(table.line_number(0), 1)
+        self.assertEqual(table.line_number(4), 1)
+        self.assertEqual(table.line_number(6), 2)
+        self.assertEqual(table.line_number(100), 4)
+        self.assertEqual(table.linestarts[10], 4)
+        with self.assertRaises(TypeError):
+            table.linestarts[12] = 5
+
+        # Every frame of a code object shares one line table.
+        cache = DecodeCache(self.opc, PYTHON_VERSION_TRIPLE)
+        code = _code("x = 1\ny = 2\n")
+        self.assertIs(cache.get(code).line_table, cache.get(code).line_table)
+        self.assertEqual(cache.get(code).line_table.line_number(0), FIRST_LINE)
+
+
+if __name__ == "__main__":
+    unittest.main()
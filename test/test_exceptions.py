@@ -1,5 +1,7 @@
 """Test exceptions."""
 
+import logging
+import textwrap
 import unittest
 
 try:
@@ -9,6 +11,8 @@ except ImportError:
 
 from xdis.version_info import PYTHON_VERSION_TRIPLE, PYTHON3
 
+from xpython.vm import PyVM
+
 PY2 = not PYTHON3
 
 
@@ -35,6 +39,57 @@ class TestExceptions(vmtest.VmTestCase):
     def test_coverage_issue_92(self):
         self.assert_ok("raise ValueError", raises=ValueError)
 
+    def test_traceback(self):
+        code = compile(
+            textwrap.dedent(
+                """\
+                def inner(x):
+                    return 1 // x
+                def outer(x):
+                    return inner(x)
+                try:
+                    outer(0)
+                except ZeroDivisionError:
+                    pass
+                outer(0)
+                """
+            ),
+            "<test_traceback>",
+            "exec",
+        )
+        # The traceback is that of the last exception, whether or not
+        # calls are run in the caller's eval loop.
+        for inline_calls in (True, False):
+            vm = PyVM(vmtest_testing=True, inline_calls=inline_calls)
+            self.assertRaises(ZeroDivisionError, vm.run_code, code)
+            tb = vm.last_traceback
+            self.assertIs(tb, vm.last_traceback)
+            where = []
+            while tb:
+                where.append((tb.tb_frame.f_code.co_name, tb.tb_lineno))
+                tb = tb.tb_next
+            self.assertEqual(where, [("<module>", 9), ("outer", 4), ("inner", 2)])
+
+    def test_exception_logging(self):
+        def format_instruction(*args, **kwargs):
+            return "formatted"
+
+        code = compile(
+            "try:\n    1 // 0\nexcept ZeroDivisionError:\n    pass\n", "<test>", "exec"
+        )
+
+        # With logging off, instructions aren't even formatted.
+        vm = PyVM(vmtest_testing=True, format_instruction_func=None)
+        vm.run_code(code)
+
+        vm = PyVM(vmtest_testing=True, format_instruction_func=format_instruction)
+        with self.assertLogs("xpython.vm", level=logging.INFO) as logs:
+            vm.run_code(code)
+        self.assertIn(
+            "INFO:xpython.vm:exception in the execution of instruction:\n\tformatted",
+            logs.output,
+        )
+
     if PYTHON_VERSION_TRIPLE >= (3, 6):
         print("Test not gone over yet for >= 3.6")
     else:
@@ -0,0 +1,97 @@
+"""Tests for control-flow graphs and dataflow facts in x-python."""
+import sys
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+SOURCE = """\
+def f(a, b=1):
+    if a:
+        x = 1
+    else:
+        x = 2
+    try:
+        y = a / b
+    except ZeroDivisionError:
+        pass
+    for i in range(3):
+        z = i
+    return x, y, z
+
+def maybe(n):
+    for i in range(n):
+        y = i
+    return y
+"""
+
+
+@unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] >= (3, 11),
+    "loops and calls aren't run for %d.%d yet" % sys.version_info[:2],
+)
+class TestFlowGraph(vmtest.VmTestCase):
+    def run_source(self, **options):
+        return self.run_module(SOURCE, **options)
+
+    def test_blocks(self):
+        vm, namespace = self.run_source()
+        cfg = vm.control_flow_graph(namespace["f"].__code__)
+        blocks = list(cfg.blocks.values())
+        self.assertEqual(blocks[0].start, 0)
+        self.assertTrue(all(block.reachable for block in blocks))
+        kinds = {edge.kind for block in blocks for edge in block.successors}
+        self.assertEqual(kinds, {"next", "jump", "handler"})
+        for block in blocks:
+            for edge in block.successors:
+                self.assertIn(block.start, cfg.blocks[edge.target].predecessors)
+        self.assertIs(cfg.block_at(blocks[1].end), blocks[1])
+
+    def test_assigned(self):
+        vm, namespace = self.run_source()
+        code = namespace["f"].__code__
+        self.assertEqual(namespace["f"](1), (1, 1.0, 2))
+        cfg = vm.control_flow_graph(code)
+        x, y, z = (code.co_varnames.index(name) for name in "xyz")
+        (offset,) = (
+            inst.offset
+            for inst in filter(None, vm.decode_cache.get(code).unfused)
+            if inst.opname == "LOAD_FAST" and inst.arguments[0] == x
+        )
+        # x is set on both branches of the "if". y isn't set when the
+        # division raises, and z isn't set when the loop doesn't run.
+        self.assertTrue(cfg.is_assigned(offset, x))
+        self.assertFalse(cfg.is_assigned(offset, y))
+        self.assertFalse(cfg.is_assigned(offset, z))
+
+    def test_unbound_local(self):
+        # A variable that may not be set is still checked.
+        _, namespace = self.run_source()
+        self.assertEqual(namespace["maybe"](3), 2)
+        self.assertRaises(UnboundLocalError, namespace["maybe"], 0)
+
+    @unittest.skipIf(
+        PYTHON_VERSION_TRIPLE[:2] < (3, 8), "needs stack_effect() with jump"
+    )
+    def test_stack_depths(self):
+        vm, namespace = self.run_source()
+        code = namespace["f"].__code__
+        cfg = vm.control_flow_graph(code)
+        self.assertEqual(cfg.stack_depths[0], 0)
+        self.assertTrue(cfg.stack_bounded)
+        self.assertLessEqual(cfg.max_stack_depth, code.co_stacksize)
+
+    def test_no_dataflow(self):
+        vm, namespace = self.run_source(dataflow=False)
+        code = namespace["f"].__code__
+        self.assertIsNone(vm.decode_cache.get(code).cfg)
+        # The graph is still there for those who ask.
+        self.assertTrue(vm.control_flow_graph(code).blocks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,8 +5,232 @@ try:
 except ImportError:
     from . import vmtest
 
+import textwrap
+import unittest
+from unittest import mock
+
 from xdis.version_info import PYTHON_VERSION_TRIPLE
 
+from xpython import pyobj
+from xpython.vm import FRAME_FREE_LIST_SIZE, PyVM
+
+# Exception tables and cells, new in 3.11, aren't run yet.
+skip_if_exception_table = unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] >= (3, 11), "needs 3.11 exception tables and cells"
+)
+
+
+class TestCalls(vmtest.VmTestCase):
+    @skip_if_exception_table
+    def test_fast_locals(self):
+        self.assert_ok(
+            """\
+            def fn(a, b=2):
+                c = a + b
+                del a
+                print(sorted(locals().items()))
+                try:
+                    print(a)
+                except UnboundLocalError:
+                    print("a is unbound")
+                return c
+            print(fn(1))
+            """
+        )
+
+    @skip_if_exception_table
+    def test_argument_binding(self):
+        self.assert_ok(
+            """\
+            def fn(a, b=2, *args, c, d=4, **kwargs):
+                return (a, b, args, c, d, sorted(kwargs.items()))
+            print(fn(1, c=3))
+            print(fn(1, 2, 3, 4, c=5, e=6))
+            print(fn(c=1, a=2, b=3))
+            fn.__defaults__ = (20,)
+            fn.__kwdefaults__ = {"c": 30, "d": 4}
+            print(fn(1))
+            fn.__kwdefaults__["d"] = 40
+            print(fn(1))
+            try:
+                fn(1, a=2, c=3)
+            except TypeError as e:
+                print(e)
+            """
+        )
+
+    def test_deep_recursion(self):
+        self.assert_ok(
+            """\
+            def count(n):
+                if n == 0:
+                    return 0
+                return 1 + count(n - 1)
+            print(count(500))
+            """
+        )
+
+    @skip_if_exception_table
+    def test_exception_through_calls(self):
+        self.assert_ok(
+            """\
+            def inner(x):
+                try:
+                    result = 1 // x
+                finally:
+                    print("inner finally")
+                return result
+            def middle(x):
+                return inner(x) + 1
+            def outer(x):
+                try:
+                    return middle(x)
+                except ZeroDivisionError:
+                    return "caught"
+            print(outer(1))
+            print(outer(0))
+            """
+        )
+
+    @skip_if_exception_table
+    def test_method_calls(self):
+        self.assert_ok(
+            """\
+            class Base:
+                def __init__(self, x):
+                    self.x = x
+                def get(self, y=0):
+                    return self.x + y
+            class Derived(Base):
+                def get(self, y=0):
+                    return Base.get(self, y) * 2
+                def __getattr__(self, name):
+                    return lambda: name
+            d = Derived(3)
+            print(d.get(), d.get(1), Base.get(d, 1), d.missing())
+            d.get = len
+            print(d.get("shadowed"), "-".join(["a", "b"]).upper())
+            try:
+                Base(1).nothing()
+            except AttributeError as e:
+                print(e)
+            """
+        )
+
+    @unittest.skipIf(PYTHON_VERSION_TRIPLE[:2] < (3, 7), "needs LOAD_METHOD")
+    def test_method_call_binds_nothing(self):
+        # A method of an interpreted class is called with self,
+        # as LOAD_METHOD leaves them, without a bound Method.
+        made = []
+        init = pyobj.Method.__init__
+
+        def counting_init(method, obj, _class, func):
+            made.append(func.__name__)
+            init(method, obj, _class, func)
+
+        with mock.patch.object(pyobj.Method, "__init__", counting_init):
+            _, namespace = self.run_module(
+                """\
+                class Counter:
+                    def __init__(self):
+                        self.n = 0
+                    def add(self, k):
+                        self.n += k
+                        return self.n
+                c = Counter()
+                total = c.add(1) + c.add(2)
+                bound = c.add
+                """
+            )
+        self.assertEqual(namespace["total"], 4)
+        # type() gets __init__ as an attribute, as does the
+        # last line with add().
+        self.assertEqual(made, ["__init__", "add"])
+
+    def test_compact_frames(self):
+        # Frames have no __dict__, and one for a function makes its
+        # f_locals dictionary only when that is asked for, and not
+        # when a function is made in it.
+        code = compile(
+            textwrap.dedent(
+                """\
+                def f(x):
+                    y = x + 1
+                    add = lambda z: z + 1
+                    return add(y) - 1
+                def g(x):
+                    y = x + 1
+                    return locals()
+                result = f(1), g(1)
+                """
+            ),
+            "<test_compact_frames>",
+            "exec",
+        )
+        # Frames that are reused have their f_locals cleared.
+        vm = PyVM(vmtest_testing=True, frame_free_lists=False)
+        frames = {}
+        make_frame = vm.make_frame
+
+        def recording_make_frame(code, *args, **kwargs):
+            frame = frames[code.co_name] = make_frame(code, *args, **kwargs)
+            return frame
+
+        vm.make_frame = recording_make_frame
+        namespace = {"__builtins__": __builtins__, "__name__": "__main__"}
+        vm.run_code(code, namespace)
+        self.assertEqual(namespace["result"], (2, {"x": 1, "y": 2}))
+        self.assertFalse(hasattr(frames["f"], "__dict__"))
+        self.assertIsNone(frames["f"]._f_locals)
+        self.assertIsNone(frames["f"].brkpt)
+        self.assertEqual(frames["g"]._f_locals, {"x": 1, "y": 2})
+
+    @skip_if_exception_table
+    def test_frame_free_lists(self):
+        code = compile(
+            textwrap.dedent(
+                """\
+                def fib(n):
+                    return n if n < 2 else fib(n - 1) + fib(n - 2)
+                def g(x):
+                    return locals()
+                def fails(x):
+                    try:
+                        return 1 // x
+                    except ZeroDivisionError:
+                        return "failed"
+                results = fib(15), g(1), g(2), fails(0), fails(0), fails(1)
+                """
+            ),
+            "<test_frame_free_lists>",
+            "exec",
+        )
+        for free_lists in (True, False):
+            vm, namespace = self.run_module(code, frame_free_lists=free_lists)
+            # A frame reused for the second call of g() doesn't
+            # change what locals() gave the first.
+            self.assertEqual(
+                namespace["results"],
+                (610, {"x": 1}, {"x": 2}, "failed", "failed", 1),
+            )
+
+            def free_frames(name):
+                code = namespace[name].__code__
+                return vm.decode_cache.get(code).free_frames
+
+            if free_lists:
+                self.assertEqual(len(free_frames("fib")), FRAME_FREE_LIST_SIZE)
+                for frame in free_frames("fib"):
+                    self.assertIsNone(frame.f_back)
+                    self.assertEqual(frame.stack_pointer, 0)
+                # Frames a traceback has passed through, or that
+                # gave out their locals(), aren't kept.
+                self.assertEqual(len(free_frames("fails")), 1)
+                self.assertEqual(free_frames("g"), [])
+            else:
+                self.assertEqual(free_frames("fib"), [])
+
+
 if PYTHON_VERSION_TRIPLE >= (3, 10):
     print("Test not gone over yet for >= 3.10")
 else:
@@ -0,0 +1,112 @@
+"""Tests for intrinsic built-in function calls in x-python."""
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython.quicken import QUICKEN_MAX_MISSES
+
+SOURCE = """\
+class Point:
+    x = 1
+
+def builtins_used(items):
+    p = Point()
+    return (
+        len(items),
+        isinstance(items, list),
+        list(range(1, 7, 2)),
+        min(items),
+        max(3, 4),
+        abs(-5),
+        getattr(p, "x"),
+        getattr(p, "y", 2),
+        hasattr(p, "z"),
+    )
+
+def size(items):
+    return len(items)
+
+def local_len(items):
+    len = lambda x: -1
+    return len(items)
+
+def bad_size(x):
+    try:
+        return len(x)
+    except TypeError:
+        return "TypeError"
+"""
+
+# CALL_FUNCTION is gone in 3.11.
+skip_if_no_call_function = unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] >= (3, 11), "needs CALL_FUNCTION"
+)
+
+
+class TestIntrinsics(vmtest.VmTestCase):
+    def setUp(self, **options):
+        self.vm, self.namespace = self.run_module(SOURCE, **options)
+
+    def call(self, name, *args):
+        return self.namespace[name](*args)
+
+    def intrinsics(self, name):
+        code = self.namespace[name].__code__
+        return sorted(self.vm.decode_cache.get(code).intrinsics.values())
+
+    @skip_if_no_call_function
+    def test_intrinsics(self):
+        expected = (3, True, [1, 3, 5], 1, 4, 5, 1, 2, False)
+        for _ in range(2):
+            self.assertEqual(self.call("builtins_used", [3, 1, 2]), expected)
+        self.assertEqual(
+            self.intrinsics("builtins_used"),
+            [
+                "CALL_FUNCTION_ABS",
+                "CALL_FUNCTION_GETATTR",
+                "CALL_FUNCTION_GETATTR",
+                "CALL_FUNCTION_HASATTR",
+                "CALL_FUNCTION_ISINSTANCE",
+                "CALL_FUNCTION_LEN",
+                "CALL_FUNCTION_MAX",
+                "CALL_FUNCTION_MIN",
+                "CALL_FUNCTION_RANGE",
+            ],
+        )
+
+    @skip_if_no_call_function
+    def test_rebound(self):
+        self.assertEqual(self.call("size", "abc"), 3)
+        self.assertEqual(self.intrinsics("size"), ["CALL_FUNCTION_LEN"])
+        # Rebinding the global is seen by the intrinsic's guard.
+        self.namespace["len"] = lambda x: 0
+        for _ in range(QUICKEN_MAX_MISSES):
+            self.assertEqual(self.call("size", "abc"), 0)
+        self.assertEqual(self.intrinsics("size"), [])
+        del self.namespace["len"]
+        self.assertEqual(self.call("size", "abc"), 3)
+        self.assertEqual(self.intrinsics("size"), ["CALL_FUNCTION_LEN"])
+
+    def test_shadowed(self):
+        self.assertEqual(self.call("local_len", "abc"), -1)
+        self.assertEqual(self.intrinsics("local_len"), [])
+
+    @skip_if_no_call_function
+    def test_type_error(self):
+        for _ in range(2):
+            self.assertEqual(self.call("bad_size", 5), "TypeError")
+            self.assertEqual(self.call("bad_size", "ab"), 2)
+
+    def test_no_intrinsics(self):
+        self.setUp(intrinsics=False)
+        self.assertEqual(self.call("size", "abc"), 3)
+        self.assertEqual(self.intrinsics("size"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Tests for the JIT in x-python."""
+import sys
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import IS_PYPY, PYTHON_VERSION_TRIPLE
+
+from xpython.jit import JIT, JIT_VERSIONS
+
+SOURCE = """\
+def total(items):
+    t = 0
+    for x in items:
+        if x % 3 == 0:
+            t += x * 2
+        else:
+            t -= 1
+    return t, [x for x in items if x > 5]
+
+def countdown(n):
+    while n > 0:
+        n -= 1
+    return n
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+def names(n):
+    for i in range(n):
+        x = i
+    return sorted(locals())
+
+def maybe(n):
+    for i in range(n):
+        if i > 5:
+            y = i
+    return y
+
+def fail(items):
+    t = 0
+    for x in items:
+        t += 10 // x
+    return t
+
+class Counter:
+    def __init__(self):
+        self.n = 0
+    def add(self, k):
+        self.n += k
+        return self.n
+
+def methods(n):
+    c = Counter()
+    for i in range(n):
+        c.add(i)
+    c.show = str
+    return c.add(0), c.show(n), "-".join(["a", "b"]).upper()
+"""
+
+
+@unittest.skipIf(
+    IS_PYPY or PYTHON_VERSION_TRIPLE[:2] not in JIT_VERSIONS,
+    "no JIT for %d.%d" % sys.version_info[:2],
+)
+class TestJIT(vmtest.VmTestCase):
+    def make_vm(self, jit=True, **options):
+        vm = super().make_vm(jit=False, **options)
+        if jit:
+            # Translate everything the first time it is run.
+            vm.decode_cache.passes = list(vm.decode_cache.passes) + [JIT(vm, 1)]
+        return vm
+
+    def run_source(self, **options):
+        return self.run_module(SOURCE, **options)
+
+    def results(self, namespace):
+        return (
+            namespace["total"](list(range(20))),
+            namespace["countdown"](30),
+            namespace["fib"](12),
+            namespace["names"](4),
+            namespace["methods"](5),
+        )
+
+    def test_same_results(self):
+        for inline_calls in (True, False):
+            self.assert_same_results(
+                SOURCE,
+                self.results,
+                dict(jit=False, inline_calls=inline_calls),
+                dict(inline_calls=inline_calls),
+            )
+
+    def test_self_checking(self):
+        self.run_self_checking()
+
+    def test_translated(self):
+        vm, namespace = self.run_source()
+        self.assertEqual(namespace["countdown"](10), 0)
+        jit = vm.decode_cache.get(namespace["countdown"].__code__).jit
+        self.assertTrue(callable(jit.function))
+        self.assertIn("def jitted(frame, pc):", jit.source)
+
+        # Not while instructions are being logged.
+        vm, namespace = self.run_source(engine="threaded")
+        vm.log_info = True
+        self.assertEqual(namespace["countdown"](10), 0)
+        jit = vm.decode_cache.get(namespace["countdown"].__code__).jit
+        self.assertIsNone(jit.function)
+
+    def test_unbound_local(self):
+        _, namespace = self.run_source()
+        self.assertEqual(namespace["maybe"](10), 9)
+        self.assertRaises(UnboundLocalError, namespace["maybe"], 3)
+
+    def test_traceback(self):
+        vm, namespace = self.run_source()
+        self.assertEqual(namespace["fail"]([1, 2]), 15)
+        self.assertRaises(ZeroDivisionError, namespace["fail"], [1, 0])
+        tb = vm.last_traceback
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        self.assertEqual(tb.tb_frame.f_code.co_name, "fail")
+        self.assertEqual(tb.tb_lineno, 34)
+        decoded = vm.decode_cache.get(namespace["fail"].__code__)
+        self.assertEqual(decoded.unfused[tb.tb_lasti].opname, "BINARY_FLOOR_DIVIDE")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Tests for the peephole optimizer in x-python."""
+import dis
+import os.path as osp
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython import execfile
+
+SRCDIR = osp.dirname(osp.abspath(__file__))
+
+SOURCE = """\
+def f(x, y):
+    return x
+"""
+
+# The bytecode we give f(): the kind of thing an old compiler might
+# leave.
+#
+#    if x:
+#        return 60 * 60 / y
+#    return None
+F_BYTECODE = (
+    ("LOAD_FAST", 0),  # 0
+    ("POP_JUMP_IF_FALSE", 16),  # 2
+    ("LOAD_CONST", 1),  # 4
+    ("LOAD_CONST", 1),  # 6
+    ("BINARY_MULTIPLY", 0),  # 8
+    ("LOAD_FAST", 1),  # 10
+    ("BINARY_TRUE_DIVIDE", 0),  # 12
+    ("RETURN_VALUE", 0),  # 14
+    ("JUMP_ABSOLUTE", 20),  # 16
+    ("RETURN_VALUE", 0),  # 18
+    ("LOAD_CONST", 0),  # 20
+    ("RETURN_VALUE", 0),  # 22
+)
+
+
+def assemble(instructions) -> bytes:
+    co_code = bytearray()
+    for opname, arg in instructions:
+        opcode = dis.opmap[opname]
+        if opcode in dis.hasjabs and PYTHON_VERSION_TRIPLE >= (3, 10):
+            # Jumps are to instructions rather than to bytes.
+            arg //= 2
+        co_code += bytes((opcode, arg))
+    return bytes(co_code)
+
+
+# code.replace() is new in 3.8, and 3.11 has neither JUMP_ABSOLUTE nor
+# BINARY_MULTIPLY.
+skip_unless_assembled = unittest.skipUnless(
+    (3, 8) <= PYTHON_VERSION_TRIPLE[:2] < (3, 11), "needs Python 3.8 to 3.10"
+)
+
+
+class TestPeephole(vmtest.VmTestCase):
+    def run_source(self, **options):
+        code = compile(SOURCE, "<%s>" % self.id(), "exec")
+        f_code = code.co_consts[0]
+        new_f_code = f_code.replace(
+            co_code=assemble(F_BYTECODE), co_consts=(None, 60), co_stacksize=2
+        )
+        code = code.replace(
+            co_consts=tuple(new_f_code if c is f_code else c for c in code.co_consts)
+        )
+        vm, namespace = self.run_module(code, **options)
+        return vm, namespace, new_f_code
+
+    @skip_unless_assembled
+    def test_optimize(self):
+        vm, namespace, f_code = self.run_source(peephole=True)
+        f = namespace["f"]
+        self.assertEqual(f(1, 2), 1800.0)
+        self.assertIsNone(f(0, 2))
+
+        decoded = vm.decode_cache.get(f_code)
+        self.assertEqual(
+            decoded.peephole,
+            {
+                2: "jump to 16 threaded to 20",
+                4: "folded 4-8 into LOAD_CONST 3600",
+                6: "dropped",
+                8: "dropped",
+                16: "dropped",
+                18: "dropped",
+            },
+        )
+        load = decoded.instructions[4]
+        self.assertEqual((load.arguments, load.next_offset), ((3600,), 10))
+        self.assertEqual(decoded.instructions[2].arguments, (20,))
+        self.assertIsNone(decoded.instructions[18])
+
+    @skip_unless_assembled
+    def test_traceback(self):
+        # Offsets in tracebacks are those of the original bytecode.
+        vm, namespace, _ = self.run_source(peephole=True)
+        self.assertRaises(ZeroDivisionError, namespace["f"], 1, 0)
+        tb = vm.last_traceback
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        self.assertEqual((tb.tb_lasti, tb.tb_lineno), (12, 2))
+
+    @skip_unless_assembled
+    def test_no_peephole(self):
+        vm, namespace, f_code = self.run_source()
+        self.assertEqual(namespace["f"](1, 2), 1800.0)
+        self.assertEqual(vm.decode_cache.get(f_code).peephole, {})
+
+    def test_self_checking(self):
+        self.run_self_checking(peephole=True)
+
+    def run_bytecode(self, version: str, name: str):
+        path = osp.join(SRCDIR, f"bytecode-{version}", f"{name}.pyc")
+        with redirect_stdout(StringIO()):
+            vm = execfile.run_python_file(path, [], peephole=True)
+        return {
+            decoded.code.co_name: decoded.peephole
+            for decoded in vm.decode_cache._entries.values()
+        }
+
+    def test_legacy_bytecode(self):
+        # The program checks its own results. fact() ends with a
+        # return that can't be reached.
+        changes = self.run_bytecode("2.7", "test_recursion")
+        self.assertEqual(changes["fact"], {34: "dropped", 37: "dropped"})
+
+if __name__ == "__main__":
+    unittest.main()
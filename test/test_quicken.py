@@ -0,0 +1,85 @@
+"""Tests for quickening of instructions in x-python."""
+import sys
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython.quicken import QUICKEN_MAX_MISSES, QUICKEN_WARMUP
+
+# The name of the instruction for "+".
+if PYTHON_VERSION_TRIPLE[:2] < (3, 11):
+    ADD = "BINARY_ADD"
+else:
+    ADD = "BINARY_OP"
+
+SOURCE = """\
+def add(x, y):
+    return x + y
+
+def total(items):
+    result = 0
+    for i in range(len(items)):
+        if items[i] > 0:
+            result += items[i]
+    return result
+"""
+
+
+@unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] >= (3, 11),
+    "loops and calls aren't run for %d.%d yet" % sys.version_info[:2],
+)
+class TestQuicken(vmtest.VmTestCase):
+    def setUp(self):
+        self.vm, self.namespace = self.run_module(SOURCE)
+
+    def call(self, name, *args):
+        return self.namespace[name](*args)
+
+    def specializations(self, name):
+        code = self.namespace[name].__code__
+        return sorted(self.vm.decode_cache.get(code).specializations.values())
+
+    def test_specialize(self):
+        items = list(range(-5, 20))
+        self.assertEqual(self.call("total", items), sum(range(20)))
+        names = self.specializations("total")
+        if PYTHON_VERSION_TRIPLE[:2] < (3, 11):
+            self.assertIn("BINARY_SUBSCR_LIST_INT", names)
+            self.assertIn("COMPARE_OP_INT_INT", names)
+            self.assertIn("INPLACE_ADD_INT_INT", names)
+        else:
+            self.assertIn("BINARY_OP_INT_INT", names)
+        # The guards still let other types through.
+        self.assertEqual(self.call("total", [0.5, 1.5, -2.0]), 2.0)
+
+    def test_deoptimize(self):
+        for i in range(QUICKEN_WARMUP):
+            self.assertEqual(self.call("add", i, 1), i + 1)
+        self.assertEqual(self.specializations("add"), [ADD + "_INT_INT"])
+
+        # After enough guard failures, the instruction starts over
+        # and is specialized for the new types.
+        for i in range(QUICKEN_MAX_MISSES + QUICKEN_WARMUP):
+            self.assertEqual(self.call("add", "a", "b"), "ab")
+        self.assertEqual(self.specializations("add"), [ADD + "_STR_STR"])
+
+        # Types there is no specialization for stay generic.
+        for i in range(QUICKEN_MAX_MISSES + QUICKEN_WARMUP):
+            self.assertEqual(self.call("add", [1], [2]), [1, 2])
+        self.assertEqual(self.specializations("add"), [])
+
+    def test_no_quicken(self):
+        vm, namespace = self.run_module(SOURCE, quicken=False)
+        self.assertEqual(namespace["total"](list(range(20))), sum(range(20)))
+        code = namespace["total"].__code__
+        self.assertEqual(vm.decode_cache.get(code).specializations, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
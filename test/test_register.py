@@ -0,0 +1,126 @@
+"""Tests for the register-code engine in x-python."""
+import sys
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython.register import CALL2, MOVE, RETURN
+
+SOURCE = """\
+def count(n):
+    i = 0
+    while i < n:
+        i += 1
+    return i
+
+def mixed(items):
+    total = 0
+    seen = []
+    for x in items:
+        if 0 < x <= 5 and x not in seen:
+            total += x * 2
+        else:
+            total -= 1
+        seen.append(x)
+    point = P()
+    point.x, point.y = total, -total
+    pair = [point.x, point.y]
+    pair[0] = pair[1] // 3
+    return (pair, seen[-1], {"a": total}["a"] ** 2, not total)
+
+class P:
+    pass
+
+def folded():
+    a = 2
+    b = a * 3
+    return b + 1
+
+def maybe(n):
+    for i in range(n):
+        if i > 5:
+            y = i
+    return y
+
+def fail(items):
+    t = 0
+    for x in items:
+        t += 10 // x
+    return t
+"""
+
+
+@unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] >= (3, 11),
+    "loops and calls aren't run for %d.%d yet" % sys.version_info[:2],
+)
+class TestRegister(vmtest.VmTestCase):
+    def make_vm(self, **options):
+        # The JIT would take over hot functions.
+        return super().make_vm(jit=False, **options)
+
+    def run_source(self, engine):
+        return self.run_module(SOURCE, engine=engine)
+
+    def blocks(self, vm, function):
+        registers = vm.decode_cache.get(function.__code__).registers
+        return [block for block in registers.blocks if getattr(block, "ops", None)]
+
+    def results(self, namespace):
+        return (
+            namespace["count"](50),
+            namespace["mixed"]([3, 1, 3, 9, -2, 5]),
+            namespace["folded"](),
+            namespace["maybe"](10),
+        )
+
+    def test_same_results(self):
+        self.assert_same_results(
+            SOURCE, self.results, dict(engine="classic"), dict(engine="register")
+        )
+
+    def test_self_checking(self):
+        self.run_self_checking(engine="register")
+
+    def test_optimized(self):
+        vm, namespace = self.run_source("register")
+        self.assertEqual(namespace["count"](10), 10)
+        # i += 1 is one instruction that adds to i directly.
+        i = namespace["count"].__code__.co_varnames.index("i")
+        ops = [op for block in self.blocks(vm, namespace["count"]) for op in block.ops]
+        self.assertIn(i, [op[1] for op in ops if op[0] == CALL2])
+        self.assertNotIn(MOVE, [op[0] for op in ops if op[2] == i])
+
+        # The constants are worked out ahead of time.
+        self.assertEqual(namespace["folded"](), 7)
+        (block,) = self.blocks(vm, namespace["folded"])
+        registers = vm.decode_cache.get(namespace["folded"].__code__).registers
+        kind, _, a, _, _, _ = block.ops[-1]
+        self.assertEqual(kind, RETURN)
+        self.assertEqual(registers.constant(a), 7)
+
+    def test_unbound_local(self):
+        _, namespace = self.run_source("register")
+        self.assertEqual(namespace["maybe"](10), 9)
+        self.assertRaises(UnboundLocalError, namespace["maybe"], 3)
+
+    def test_traceback(self):
+        vm, namespace = self.run_source("register")
+        self.assertEqual(namespace["fail"]([1, 2]), 15)
+        self.assertRaises(ZeroDivisionError, namespace["fail"], [1, 0])
+        tb = vm.last_traceback
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        self.assertEqual(tb.tb_frame.f_code.co_name, "fail")
+        self.assertEqual(tb.tb_lineno, 39)
+        decoded = vm.decode_cache.get(namespace["fail"].__code__)
+        self.assertEqual(decoded.unfused[tb.tb_lasti].opname, "BINARY_FLOOR_DIVIDE")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Tests for superinstructions in x-python."""
+import logging
+import re
+import sys
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython.superinstructions import SUPERINSTRUCTIONS, Fuser
+
+SOURCE = """\
+def scale(x, y):
+    return x * y
+
+def fail(items, i):
+    n = len(items)
+    return items[i] / n
+"""
+
+
+class TestSuperinstructions(vmtest.VmTestCase):
+    def make_vm(self, fuse=(), **options):
+        vm = super().make_vm(**options)
+        if fuse:
+            vm.decode_cache.passes = list(vm.decode_cache.passes) + [Fuser(vm, fuse)]
+        return vm
+
+    def run_source(self, **options):
+        return self.run_module(SOURCE, **options)
+
+    def fused(self, vm, function):
+        return vm.decode_cache.get(function.__code__).superinstructions
+
+    @unittest.skipIf(
+        PYTHON_VERSION_TRIPLE[:2] not in SUPERINSTRUCTIONS,
+        "no superinstructions for %d.%d" % sys.version_info[:2],
+    )
+    def test_fuse(self):
+        vm, namespace = self.run_source()
+        self.assertEqual(namespace["scale"](6, 7), 42)
+        fused = self.fused(vm, namespace["scale"])
+        self.assertIn(("LOAD_FAST", "LOAD_FAST"), fused.values())
+
+    def test_exception_offset(self):
+        # Fuse a sequence whose last instruction raises, whatever the
+        # sequences fused for the host version are.
+        sequence = ("LOAD_FAST", "LOAD_FAST", "BINARY_SUBSCR")
+        vm, namespace = self.run_source(superinstructions=False, fuse=[sequence])
+        self.assertEqual(namespace["fail"]([3, 6], 1), 3.0)
+        decoded = vm.decode_cache.get(namespace["fail"].__code__)
+        self.assertEqual(list(decoded.superinstructions.values()), [sequence])
+
+        # The traceback points at the instruction that raised, not at
+        # the start of the superinstruction.
+        (start,) = decoded.superinstructions
+        subscr = decoded.unfused[decoded.unfused[start].next_offset].next_offset
+        self.assertEqual(decoded.unfused[subscr].opname, "BINARY_SUBSCR")
+        self.assertRaises(IndexError, namespace["fail"], [3, 6], 5)
+        tb = vm.last_traceback
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        self.assertEqual((tb.tb_lasti, tb.tb_lineno), (subscr, 6))
+
+    def test_unfusible(self):
+        # RETURN_VALUE's "why" result would be dropped.
+        vm = self.make_vm(superinstructions=False)
+        with self.assertRaises(ValueError):
+            Fuser(vm, [("LOAD_FAST", "LOAD_FAST"), ("RETURN_VALUE", "LOAD_CONST")])
+        Fuser(vm, [("LOAD_CONST", "RETURN_VALUE")])
+
+    def test_logged(self):
+        # Each instruction that is run is logged, even when it is part of
+        # a superinstruction.
+        logged = []
+        for superinstructions in (True, False):
+            with self.assertLogs("xpython.vm", level=logging.INFO) as logs:
+                vm, namespace = self.run_source(superinstructions=superinstructions)
+                self.assertEqual(namespace["scale"](6, 7), 42)
+            # Each run compiles its own code objects.
+            logged.append([re.sub(" at 0x[0-9a-f]+", "", line) for line in logs.output])
+        self.assertEqual(logged[0], logged[1])
+        self.assertTrue(any("RETURN_VALUE" in line for line in logged[0]))
+
+    def test_no_superinstructions(self):
+        vm, namespace = self.run_source(superinstructions=False)
+        self.assertEqual(namespace["scale"](6, 7), 42)
+        self.assertEqual(self.fused(vm, namespace["scale"]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
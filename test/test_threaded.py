@@ -0,0 +1,103 @@
+"""Tests for the threaded-code engine in x-python."""
+import sys
+import unittest
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE
+
+from xpython.threaded import UNTHREADED_OPS
+from xpython.vm import PyVM
+
+SOURCE = """\
+def collatz(n):
+    steps = 0
+    while n != 1:
+        if n % 2:
+            n = 3 * n + 1
+        else:
+            n //= 2
+        steps += 1
+    return steps
+
+def squares(n):
+    for i in range(n):
+        yield i * i
+
+def safe_div(items):
+    result = []
+    for x in items:
+        try:
+            result.append(10 // x)
+        except ZeroDivisionError:
+            result.append(None)
+    return result
+
+def fail(x):
+    y = x + 1
+    return y // 0
+"""
+
+
+@unittest.skipIf(
+    PYTHON_VERSION_TRIPLE[:2] >= (3, 11),
+    "loops and calls aren't run for %d.%d yet" % sys.version_info[:2],
+)
+class TestThreaded(vmtest.VmTestCase):
+    def run_source(self, engine):
+        return self.run_module(SOURCE, engine=engine)
+
+    def results(self, namespace):
+        return (
+            [namespace["collatz"](n) for n in range(1, 30)],
+            list(namespace["squares"](10)),
+            namespace["safe_div"]([1, 0, 3, 0, 5]),
+        )
+
+    def test_same_results(self):
+        self.assert_same_results(
+            SOURCE, self.results, dict(engine="classic"), dict(engine="threaded")
+        )
+
+    def test_self_checking(self):
+        self.run_self_checking(engine="threaded")
+
+    def test_threaded_code(self):
+        vm, namespace = self.run_source("threaded")
+        namespace["collatz"](7)
+        decoded = vm.decode_cache.get(namespace["collatz"].__code__)
+        self.assertEqual(len(decoded.threaded), len(decoded.instructions) + 1)
+        # JIT entry points go through the classic loop too.
+        entries = decoded.jit.entries if decoded.jit is not None else ()
+        for offset, inst in enumerate(decoded.unfused):
+            if inst is None:
+                self.assertIsNone(decoded.threaded[offset])
+            elif inst.opname in UNTHREADED_OPS or inst.offset in entries:
+                self.assertIsNone(decoded.threaded[offset], inst.opname)
+            else:
+                self.assertIsNotNone(decoded.threaded[offset], inst.opname)
+
+        # The classic engine doesn't make threaded code.
+        vm, namespace = self.run_source("classic")
+        namespace["collatz"](7)
+        decoded = vm.decode_cache.get(namespace["collatz"].__code__)
+        self.assertIsNone(decoded.threaded)
+
+    def test_traceback(self):
+        vm, namespace = self.run_source("threaded")
+        self.assertRaises(ZeroDivisionError, namespace["fail"], 1)
+        tb = vm.last_traceback
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        self.assertEqual(tb.tb_frame.f_code.co_name, "fail")
+        self.assertEqual(tb.tb_lineno, 26)
+
+    def test_bad_engine(self):
+        self.assertRaises(ValueError, PyVM, engine="jit")
+
+
+if __name__ == "__main__":
+    unittest.main()
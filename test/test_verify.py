@@ -0,0 +1,217 @@
+"""Tests for the bytecode verifier in x-python."""
+import dis
+import os.path as osp
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+try:
+    import vmtest
+except ImportError:
+    from . import vmtest
+
+from xdis import PYTHON_VERSION_TRIPLE, iscode, load_module
+
+from xpython import execfile
+from xpython.verify import VerifyError
+from xpython.vm import PyVM
+from xpython.vmtrace import PyVMTraced
+
+SRCDIR = osp.dirname(osp.abspath(__file__))
+
+SOURCE = """\
+ran = True
+
+def f(x):
+    return x
+"""
+
+# f()'s bytecode is replaced by these, with co_consts (None,) and
+# co_stacksize 1.
+GOOD = (("LOAD_FAST", 0), ("RETURN_VALUE", 0))
+
+
+def assemble(instructions) -> bytes:
+    co_code = bytearray()
+    for opname, arg in instructions:
+        opcode = dis.opmap[opname]
+        if opcode in dis.hasjabs and PYTHON_VERSION_TRIPLE >= (3, 10):
+            # Jumps are to instructions rather than to bytes.
+            arg //= 2
+        co_code += bytes((opcode, arg))
+    return bytes(co_code)
+
+
+# code.replace() is new in 3.8, and 3.11 isn't verified.
+skip_unless_assembled = unittest.skipUnless(
+    (3, 8) <= PYTHON_VERSION_TRIPLE[:2] < (3, 11), "needs Python 3.8 to 3.10"
+)
+
+
+class TestVerify(vmtest.VmTestCase):
+    def make_code(self, instructions, co_code=None):
+        code = compile(SOURCE, "<%s>" % self.id(), "exec")
+        (f_code,) = (c for c in code.co_consts if isinstance(c, type(code)))
+        if co_code is None:
+            co_code = assemble(instructions)
+        new_f_code = f_code.replace(
+            co_code=co_code, co_consts=(None,), co_stacksize=1
+        )
+        return code.replace(
+            co_consts=tuple(new_f_code if c is f_code else c for c in code.co_consts)
+        )
+
+    def assertRejected(self, instructions, offset, opname, message, co_code=None):
+        code = self.make_code(instructions, co_code)
+        namespace = {}
+        with self.assertRaises(VerifyError) as cm:
+            self.run_module(code, namespace)
+        error = cm.exception
+        self.assertEqual((error.offset, error.opname), (offset, opname))
+        self.assertEqual(error.code.co_name, "f")
+        self.assertEqual(
+            str(error),
+            f"f ({code.co_filename}:3): offset {offset}, {opname}: {message}",
+        )
+        # Nothing was run.
+        self.assertNotIn("ran", namespace)
+
+    @skip_unless_assembled
+    def test_good(self):
+        _, namespace = self.run_module(self.make_code(GOOD))
+        self.assertEqual(namespace["f"](5), 5)
+
+    @skip_unless_assembled
+    def test_operands(self):
+        self.assertRejected(
+            (("LOAD_CONST", 1), ("RETURN_VALUE", 0)),
+            0,
+            "LOAD_CONST",
+            "constant index 1 is out of range; there are 1",
+        )
+        self.assertRejected(
+            (("LOAD_GLOBAL", 3), ("RETURN_VALUE", 0)),
+            0,
+            "LOAD_GLOBAL",
+            "name index 3 is out of range; there are 0",
+        )
+        self.assertRejected(
+            (
+                ("LOAD_FAST", 0),
+                ("STORE_FAST", 1),
+                ("LOAD_FAST", 0),
+                ("RETURN_VALUE", 0),
+            ),
+            2,
+            "STORE_FAST",
+            "local variable index 1 is out of range; there are 1",
+        )
+        self.assertRejected(
+            (("LOAD_DEREF", 0), ("RETURN_VALUE", 0)),
+            0,
+            "LOAD_DEREF",
+            "cell index 0 is out of range; there are 0",
+        )
+
+    @skip_unless_assembled
+    def test_jumps(self):
+        self.assertRejected(
+            (("LOAD_FAST", 0), ("POP_JUMP_IF_FALSE", 8), ("LOAD_FAST", 0)),
+            2,
+            "POP_JUMP_IF_FALSE",
+            "jump target 8 is past the end of the code",
+        )
+        if PYTHON_VERSION_TRIPLE < (3, 10):
+            # Starting in 3.10, jumps can only go to instructions.
+            self.assertRejected(
+                (("LOAD_FAST", 0), ("JUMP_ABSOLUTE", 1)),
+                2,
+                "JUMP_ABSOLUTE",
+                "jump target 1 is in the middle of an instruction",
+            )
+        self.assertRejected(
+            GOOD,
+            2,
+            "RETURN_VALUE",
+            "instruction is truncated",
+            co_code=assemble(GOOD)[:3],
+        )
+        self.assertRejected(
+            (("LOAD_FAST", 0),),
+            0,
+            "LOAD_FAST",
+            "goes on past the end of the code",
+        )
+
+    @skip_unless_assembled
+    def test_unreachable_end(self):
+        # Going on past the end is only wrong for an instruction that can
+        # be reached.
+        code = self.make_code((("LOAD_FAST", 0), ("RETURN_VALUE", 0), ("POP_TOP", 0)))
+        _, namespace = self.run_module(code)
+        self.assertEqual(namespace["f"](5), 5)
+
+    # A 3.8 VM removes, from the byteop classes they share, opcodes which
+    # the older VMs the rest of the tests run need.
+    @unittest.skipIf(PYTHON_VERSION_TRIPLE[:2] < (3, 8), "needs Python 3.8 or later")
+    def test_return_in_finally(self):
+        # Python 3.8 leaves a POP_TOP that can't be reached at the end of
+        # g3().
+        path = osp.join(SRCDIR, "examples", "exceptions", "return_in_finally-3.8.pyc")
+        version, _, _, code, is_pypy, _, _ = load_module(path)
+        vm = PyVM(version, is_pypy, vmtest_testing=True)
+        (g3,) = (c for c in code.co_consts if iscode(c))
+        self.assertEqual(g3.co_code[-2], vm.opc.opmap["POP_TOP"])
+        vm.verifier.verify_tree(code)
+
+    @skip_unless_assembled
+    def test_stack(self):
+        self.assertRejected(
+            (
+                ("LOAD_FAST", 0),
+                ("LOAD_FAST", 0),
+                ("BINARY_ADD", 0),
+                ("RETURN_VALUE", 0),
+            ),
+            2,
+            "LOAD_FAST",
+            "needs a stack of 2 entries; co_stacksize is 1",
+        )
+        self.assertRejected(
+            (("RETURN_VALUE", 0),),
+            0,
+            "RETURN_VALUE",
+            "takes the stack below empty; it has 0 entries",
+        )
+
+    @skip_unless_assembled
+    def test_no_verify(self):
+        # Without verification the error shows up only when f() is run.
+        code = self.make_code((("LOAD_CONST", 1), ("RETURN_VALUE", 0)))
+        _, namespace = self.run_module(code, verify=False)
+        self.assertTrue(namespace["ran"])
+
+    def test_nothing_kept(self):
+        # f() is verified but never run, so it isn't decoded either. It
+        # isn't kept once the module has run.
+        vm, _ = self.run_module(SOURCE)
+        self.assertEqual(vm.verifier.verified, {})
+
+    def test_traced(self):
+        # The tracer runs code undecoded, so there is no decode pass to
+        # verify with and nothing is kept for one.
+        vm = PyVMTraced(lambda *args: None, vmtest_testing=True)
+        vm.run_code(compile(SOURCE, "<%s>" % self.id(), "exec"), {})
+        self.assertEqual(vm.verifier.verified, {})
+
+    def test_legacy_bytecode(self):
+        # Bytecode for other Pythons is checked when it is loaded. The
+        # program checks its own results.
+        path = osp.join(SRCDIR, "bytecode-2.7", "test_recursion.pyc")
+        with redirect_stdout(StringIO()):
+            vm = execfile.run_python_file(path, [])
+        self.assertIsNotNone(vm.verifier)
+
+
+if __name__ == "__main__":
+    unittest.main()
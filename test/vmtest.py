@@ -5,6 +5,7 @@ import os.path as osp
 import sys
 import textwrap
 import unittest
+from contextlib import redirect_stdout
 from io import StringIO
 
 from xdis import load_module
@@ -35,6 +36,28 @@ def parent_function_name():
 
 LINE_STR = "-" * 25
 
+# Programs in bytecode-<version> that check their own results, for
+# running under different VM options.
+SELF_CHECKING_PROGRAMS = (
+    "test_attribute_access",
+    "test_attributes",
+    "test_building_stuff",
+    "test_callback",
+    "test_calling_methods_wrong",
+    "test_catching_exceptions",
+    "test_comparisons",
+    "test_comprehensions",
+    "test_different_globals_may_have_different_builtins",
+    "test_eval",
+    "test_exec",
+    "test_for_loop",
+    "test_fstring",
+    "test_function_calls",
+    "test_generator_expression",
+    "test_global",
+    "test_native_subset",
+)
+
 supported_versions = frozenset(
     [
         (2, 7),
@@ -84,6 +107,45 @@ class VmTestCase(unittest.TestCase):
         )
         self.assert_runs_ok(path, arg_type="bytecode-file")
 
+    def make_vm(self, **options):
+        """The VM run_module() runs code in. Tests override this to add
+        passes or change the defaults."""
+        return PyVM(vmtest_testing=True, **options)
+
+    def run_module(self, code, namespace=None, **options):
+        """Run `code`, source or a code object, as the module __main__ in
+        a VM made with `options`. Returns the VM and the module's
+        namespace, which is `namespace` if one is given."""
+        if isinstance(code, str):
+            code = compile(textwrap.dedent(code), "<%s>" % self.id(), "exec")
+        if namespace is None:
+            namespace = {}
+        namespace.setdefault("__builtins__", __builtins__)
+        namespace.setdefault("__name__", "__main__")
+        vm = self.make_vm(**options)
+        vm.run_code(code, namespace)
+        return vm, namespace
+
+    def assert_same_results(self, code, results, baseline, options):
+        """`results(namespace)` is the same after running `code` with
+        the VM options in `baseline` as with those in `options`."""
+        _, namespace = self.run_module(code, **baseline)
+        expected = results(namespace)
+        _, namespace = self.run_module(code, **options)
+        self.assertEqual(results(namespace), expected)
+
+    def run_self_checking(self, **options):
+        """Run the SELF_CHECKING_PROGRAMS there is bytecode for with the
+        VM options in `options`."""
+        bytecode_dir = osp.join(srcdir, "bytecode-%s" % version_tuple_to_str(end=2))
+        for name in SELF_CHECKING_PROGRAMS:
+            path = osp.join(bytecode_dir, name + ".pyc")
+            if not osp.exists(path):
+                continue
+            code = load_module(path)[3]
+            with self.subTest(name), redirect_stdout(StringIO()):
+                self.run_module(code, **options)
+
     def assert_ok(self, path_or_code, raises=None, arg_type="string"):
         """Run `code` in our VM and in real Python: they behave the same."""
 
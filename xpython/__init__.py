@@ -10,7 +10,7 @@ See the documentation for the full license.
 __docformat__ = "restructuredtext"
 
 from xpython.pyobj import (Cell, Function, Generator, Method, Traceback,
-                           traceback_from_frame)
+                           TracebackRecord, traceback_from_frame)
 from xpython.version import __version__  # noqa
 from xpython.vm import PyVM, PyVMError, PyVMRuntimeError
 from xpython.vmtrace import PyVMTraced, pretty_event_flags
@@ -25,6 +25,7 @@ __all__ = [
     "PyVMRuntimeError",
     "PyVMTraced",
     "Traceback",
+    "TracebackRecord",
     "pretty_event_flags",
     "traceback_from_frame",
 ]
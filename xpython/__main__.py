@@ -7,8 +7,9 @@ import click
 from xdis.version_info import IS_PYPY, version_tuple_to_str
 
 from xpython import execfile
+from xpython.verify import VerifyError
 from xpython.version import __version__
-from xpython.vm import PyVMRuntimeError
+from xpython.vm import ENGINES, PyVMRuntimeError
 
 
 def version_message():
@@ -35,9 +36,37 @@ def version_message():
 @click.option(
     "-c", "--command-to-run", help="program passed in as a string", required=False
 )
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="classic",
+    help="how instructions are run: by the classic dispatch loop, "
+    "as threaded code, or as optimized register code",
+)
+@click.option(
+    "--aot/--no-aot",
+    default=False,
+    help="translate functions ahead of time into native code where "
+    "that can be done, and report which were",
+)
+@click.option(
+    "--peephole/--no-peephole",
+    default=False,
+    help="thread jumps, fold constants and drop unreachable code as "
+    "bytecode is loaded; this helps most with bytecode from older Pythons",
+)
+@click.option(
+    "--verify/--no-verify",
+    default=True,
+    help="check bytecode as it is loaded, and reject bytecode that indexes "
+    "past the end of its tables, jumps to no instruction or overflows its stack",
+)
 @click.argument("path", nargs=1, type=click.Path(readable=True), required=False)
 @click.argument("args", nargs=-1)
-def main(module, verbose, command_to_run, path, args):
+def main(
+    module, verbose, command_to_run, engine, aot, peephole, verify, path, args
+):
     """
     Runs Python programs or bytecode using a bytecode interpreter written in Python.
     """
@@ -65,7 +94,11 @@ def main(module, verbose, command_to_run, path, args):
         sys.exit(4)
 
     try:
-        run_fn(path, args)
+        vm = run_fn(
+            path, args, engine=engine, aot=aot, peephole=peephole, verify=verify
+        )
+        if vm.aot is not None:
+            print(vm.aot.report.format(), file=sys.stderr)
     except PyVMRuntimeError:
         # Tracebacks and error messages should been previously printed
         sys.exit(10)
@@ -83,6 +116,11 @@ def main(module, verbose, command_to_run, path, args):
         print(e)
         sys.exit(3)
         pass
+    except VerifyError as e:
+        if verbose > 1:
+            raise
+        print(e)
+        sys.exit(5)
     except SystemExit:
         # Program ran sys.exit();
         # Respect that.
@@ -0,0 +1,870 @@
+"""Ahead-of-time translation of functions, for bytecode of any version up
+to 3.10, into native code for the Python running us."""
+
+import keyword
+import linecache
+import logging
+import types
+from typing import Dict, List, Optional, Tuple
+
+from xdis import (
+    CO_ASYNC_GENERATOR,
+    CO_COROUTINE,
+    CO_GENERATOR,
+    CO_ITERABLE_COROUTINE,
+    CO_NEWLOCALS,
+    CO_OPTIMIZED,
+    CO_VARARGS,
+    CO_VARKEYWORDS,
+    iscode,
+)
+from xdis.version_info import version_tuple_to_str
+
+from xpython.decode import LineTable, decode_code
+
+log = logging.getLogger(__name__)
+
+# Code with these flags doesn't run to completion when it is called.
+NOT_AOT_FLAGS = CO_GENERATOR | CO_COROUTINE | CO_ITERABLE_COROUTINE | CO_ASYNC_GENERATOR
+
+# Python operators for the operator instruction families. Python 2's
+# classic division, BINARY_DIVIDE, has no operator that means the same
+# thing now, and is left out.
+BINARY_OPERATORS = {
+    "POWER": "**",
+    "MULTIPLY": "*",
+    "MATRIX_MULTIPLY": "@",
+    "FLOOR_DIVIDE": "//",
+    "TRUE_DIVIDE": "/",
+    "MODULO": "%",
+    "ADD": "+",
+    "SUBTRACT": "-",
+    "LSHIFT": "<<",
+    "RSHIFT": ">>",
+    "AND": "&",
+    "XOR": "^",
+    "OR": "|",
+}
+
+UNARY_OPERATORS = {
+    "POSITIVE": "+",
+    "NEGATIVE": "-",
+    "NOT": "not ",
+    "INVERT": "~",
+}
+
+# COMPARE_OP's operators, by their name in the opcode module's cmp_op.
+COMPARE_OPERATORS = {
+    "<": "<",
+    "<=": "<=",
+    "==": "==",
+    "!=": "!=",
+    "<>": "!=",
+    ">": ">",
+    ">=": ">=",
+    "in": "in",
+    "not in": "not in",
+    "is": "is",
+    "is not": "is not",
+}
+
+# Instructions whose only effect on control flow and the block stack is
+# to go on to the next instruction, with the change they make to the
+# stack depth.
+SIMPLE_EFFECTS = {
+    "NOP": 0,
+    "POP_TOP": -1,
+    "ROT_TWO": 0,
+    "ROT_THREE": 0,
+    "ROT_FOUR": 0,
+    "DUP_TOP": 1,
+    "DUP_TOP_TWO": 2,
+    "LOAD_CONST": 1,
+    "LOAD_FAST": 1,
+    "STORE_FAST": -1,
+    "DELETE_FAST": 0,
+    "LOAD_GLOBAL": 1,
+    "LOAD_ATTR": 0,
+    "STORE_ATTR": -2,
+    "BINARY_SUBSCR": -1,
+    "STORE_SUBSCR": -3,
+    "DELETE_SUBSCR": -2,
+    "SLICE+0": 0,
+    "SLICE+1": -1,
+    "SLICE+2": -1,
+    "SLICE+3": -2,
+    "COMPARE_OP": -1,
+    "IS_OP": -1,
+    "CONTAINS_OP": -1,
+    "STORE_MAP": -2,
+    "LIST_APPEND": -1,
+    "LIST_EXTEND": -1,
+    "GET_ITER": 0,
+    "LOAD_METHOD": 1,
+}
+SIMPLE_EFFECTS.update(("BINARY_" + name, -1) for name in BINARY_OPERATORS)
+SIMPLE_EFFECTS.update(("INPLACE_" + name, -1) for name in BINARY_OPERATORS)
+SIMPLE_EFFECTS.update(("UNARY_" + name, 0) for name in UNARY_OPERATORS)
+
+# Instructions whose effect on the stack depth depends on their operand.
+COUNTED_OPS = frozenset(
+    """
+    DUP_TOPX BUILD_TUPLE BUILD_LIST BUILD_SET BUILD_MAP BUILD_SLICE
+    CALL_FUNCTION CALL_FUNCTION_KW CALL_METHOD
+    """.split()
+)
+
+# Instructions that jump or change the block stack.
+CONTROL_OPS = frozenset(
+    """
+    JUMP_ABSOLUTE JUMP_FORWARD POP_JUMP_IF_FALSE POP_JUMP_IF_TRUE
+    JUMP_IF_FALSE_OR_POP JUMP_IF_TRUE_OR_POP JUMP_IF_FALSE JUMP_IF_TRUE
+    FOR_ITER SETUP_LOOP SETUP_EXCEPT POP_BLOCK POP_EXCEPT BREAK_LOOP
+    CONTINUE_LOOP END_FINALLY RETURN_VALUE RAISE_VARARGS
+    """.split()
+)
+
+# Instructions with a jump target operand.
+TARGET_OPS = frozenset(
+    """
+    JUMP_ABSOLUTE JUMP_FORWARD POP_JUMP_IF_FALSE POP_JUMP_IF_TRUE
+    JUMP_IF_FALSE_OR_POP JUMP_IF_TRUE_OR_POP JUMP_IF_FALSE JUMP_IF_TRUE
+    FOR_ITER SETUP_LOOP SETUP_EXCEPT CONTINUE_LOOP
+    """.split()
+)
+
+# Instructions that we translate.
+AOT_OPS = frozenset(SIMPLE_EFFECTS) | COUNTED_OPS | CONTROL_OPS
+
+# Built-in functions that look at the frame that calls them, which for
+# a native function isn't an interpreter Frame. Functions that use them
+# are left to the interpreter.
+FRAME_BUILTINS = frozenset(
+    """
+    compile dir eval exec execfile globals input locals super vars
+    """.split()
+)
+
+# The prefix of names in translated functions that aren't the original
+# function's variables.
+PREFIX = "_aot_"
+
+# Constant types that are written into the translated source as literals.
+LITERAL_TYPES = (type(None), bool, int, str, bytes)
+
+# End-of-iteration marker for FOR_ITER.
+DONE = object()
+
+
+def exception_match(exc_type, spec) -> bool:
+    """What COMPARE_OP's "exception match" does."""
+    return issubclass(exc_type, BaseException) and issubclass(exc_type, spec)
+
+
+# Values the translated code uses that aren't the original function's
+# constants or globals.
+HELPERS = {
+    PREFIX + "match": exception_match,
+    PREFIX + "iter": iter,
+    PREFIX + "next": next,
+    PREFIX + "done": DONE,
+    PREFIX + "slice": slice,
+    PREFIX + "set": set,
+    PREFIX + "BaseException": BaseException,
+    PREFIX + "type": type,
+}
+
+
+class Untranslatable(Exception):
+    """Raised when a function can't be translated; `reason` says why."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Translation(object):
+    """A translated code object: the native code and the cells it
+    needs for its closure."""
+
+    __slots__ = ("code", "closure", "source")
+
+    def __init__(self, code: types.CodeType, closure: tuple, source: str):
+        self.code = code
+        self.closure = closure
+        self.source = source
+
+
+class AOTReport(object):
+    """Which functions have been translated, and which have been left
+    to the interpreter and why."""
+
+    def __init__(self, version: tuple):
+        self.version = version
+        # Descriptions of the functions translated.
+        self.converted: List[str] = []
+        # (description, reason) for the functions left interpreted.
+        self.interpreted: List[Tuple[str, str]] = []
+
+    def format(self) -> str:
+        lines = [
+            "Ahead-of-time translation of Python %s bytecode: "
+            "%d functions converted, %d left interpreted"
+            % (
+                version_tuple_to_str(self.version),
+                len(self.converted),
+                len(self.interpreted),
+            )
+        ]
+        lines.extend(f"  converted:   {name}" for name in self.converted)
+        lines.extend(
+            f"  interpreted: {name}: {reason}" for name, reason in self.interpreted
+        )
+        return "\n".join(lines)
+
+
+def describe(code) -> str:
+    """How the report refers to the function with code `code`."""
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class FunctionTranslator(object):
+    """Translates the bytecode of a function into the source of an
+    ordinary Python function with the same parameters, much as
+    xpython.jit's Translator does. The block stack is worked out ahead
+    of time, so BREAK_LOOP is a jump, and an exception in a try block
+    goes to its handler through a `try` statement around the loop that
+    runs the blocks."""
+
+    def __init__(self, vm, code, instructions):
+        self.vm = vm
+        self.version = tuple(vm.version[:2])
+        self.code = code
+        self.instructions = instructions
+        # The name of each local variable in the translated function.
+        self.local_names = [
+            name
+            if is_name(name) and not name.startswith(PREFIX)
+            else f"{PREFIX}l{i}"
+            for i, name in enumerate(code.co_varnames)
+        ]
+        # The function's constants that aren't written as literals, and
+        # the helpers it uses, by the name the translated code uses.
+        self.free_values: Dict[str, object] = {}
+        self.lines: List[str] = []
+
+    def emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def translate(self) -> str:
+        """Return the source of a function that makes the translated
+        function, given `free_values` as keyword arguments."""
+        self.states = self.analyze()
+        leaders = self.leaders()
+        handlers = self.handlers(leaders)
+
+        body: List[str] = []
+        self.lines = body
+        leader_set = frozenset(leaders)
+        indent = 5 if handlers else 3
+        for leader in leaders:
+            self.emit(indent, f"if {PREFIX}pc == {leader}:")
+            self.translate_block(indent + 1, leader, leader_set)
+        if handlers:
+            self.translate_handlers(handlers)
+
+        code = self.code
+        self.lines = []
+        self.emit(0, f"def {PREFIX}make({', '.join(sorted(self.free_values))}):")
+        self.emit(1, f"def {PREFIX}function({self.parameters()}):")
+        self.emit(2, f"{PREFIX}pc = 0")
+        self.emit(2, "while True:")
+        if handlers:
+            self.emit(3, "try:")
+            self.emit(4, "while True:")
+        self.lines.extend(body)
+        self.emit(1, f"return {PREFIX}function")
+        log.debug("AOT translation of %s:\n%s", code.co_name, "\n".join(self.lines))
+        return "\n".join(self.lines) + "\n"
+
+    def translate_handlers(self, handlers: Dict[tuple, List[int]]):
+        """Emit the `except` clause that sends an exception to the
+        handler for the block that raised it."""
+        self.emit(3, f"except {self.helper('BaseException')} as {PREFIX}e:")
+        exc_type = self.helper("type")
+        keyword_ = "if"
+        for (handler, level), blocks in sorted(handlers.items()):
+            self.emit(4, f"{keyword_} {PREFIX}pc in {tuple(blocks)!r}:")
+            keyword_ = "elif"
+            if self.version >= (3, 0):
+                # The exception being handled before, which POP_EXCEPT
+                # would put back.
+                for i in range(level, level + 3):
+                    self.emit(5, f"{self.slot(i)} = None")
+                level += 3
+            self.emit(5, f"{self.slot(level)} = {PREFIX}e.__traceback__")
+            self.emit(5, f"{self.slot(level + 1)} = {PREFIX}e")
+            self.emit(5, f"{self.slot(level + 2)} = {exc_type}({PREFIX}e)")
+            self.emit(5, f"{PREFIX}pc = {handler}")
+        self.emit(4, "else:")
+        self.emit(5, "raise")
+
+    def parameters(self) -> str:
+        code = self.code
+        names = self.local_names
+        nargs = code.co_argcount
+        params = names[:nargs]
+        posonly = getattr(code, "co_posonlyargcount", 0)
+        if posonly:
+            params.insert(posonly, "/")
+        kwonly = getattr(code, "co_kwonlyargcount", 0)
+        i = nargs + kwonly
+        if code.co_flags & CO_VARARGS:
+            params.append("*" + names[i])
+            i += 1
+        elif kwonly:
+            params.append("*")
+        params.extend(names[nargs : nargs + kwonly])
+        if code.co_flags & CO_VARKEYWORDS:
+            params.append("**" + names[i])
+        return ", ".join(params)
+
+    def slot(self, i: int) -> str:
+        return f"{PREFIX}s{i}"
+
+    def helper(self, name: str) -> str:
+        name = PREFIX + name
+        self.free_values[name] = HELPERS[name]
+        return name
+
+    def constant(self, value, index: int) -> str:
+        if type(value) in LITERAL_TYPES:
+            return repr(value)
+        name = f"{PREFIX}k{index}"
+        self.free_values[name] = value
+        return name
+
+    # Control flow and the block stack.
+
+    def target(self, inst) -> int:
+        target = inst.arguments[0]
+        instructions = self.instructions
+        if target >= len(instructions) or instructions[target] is None:
+            raise Untranslatable(f"{inst.opname} to a bad offset")
+        return instructions[target].offset
+
+    def successors(self, inst, depth: int, blocks: tuple) -> list:
+        """Return (offset, depth, blocks) for each place control can go
+        after `inst`, which starts with the stack depth `depth` and the
+        block stack `blocks`. Each block is (type, target, depth)."""
+        opname = inst.opname
+        arg = inst.int_arg
+        following = inst.next_offset
+        if opname in SIMPLE_EFFECTS:
+            return [(following, depth + SIMPLE_EFFECTS[opname], blocks)]
+        elif opname in COUNTED_OPS:
+            if opname == "DUP_TOPX":
+                effect = arg
+            elif opname == "BUILD_MAP":
+                effect = 1 - 2 * arg if self.version >= (3, 5) else 1
+            elif opname == "CALL_FUNCTION" and self.version < (3, 6):
+                effect = -((arg & 0xFF) + 2 * ((arg >> 8) & 0xFF))
+            elif opname == "CALL_FUNCTION_KW":
+                effect = -arg - 1
+            elif opname == "CALL_METHOD":
+                effect = -arg - 1
+            elif opname == "CALL_FUNCTION":
+                effect = -arg
+            else:
+                effect = 1 - arg
+            return [(following, depth + effect, blocks)]
+        elif opname in ("JUMP_ABSOLUTE", "JUMP_FORWARD"):
+            return [(self.target(inst), depth, blocks)]
+        elif opname in ("POP_JUMP_IF_FALSE", "POP_JUMP_IF_TRUE"):
+            return [
+                (self.target(inst), depth - 1, blocks),
+                (following, depth - 1, blocks),
+            ]
+        elif opname in ("JUMP_IF_FALSE_OR_POP", "JUMP_IF_TRUE_OR_POP"):
+            return [(self.target(inst), depth, blocks), (following, depth - 1, blocks)]
+        elif opname in ("JUMP_IF_FALSE", "JUMP_IF_TRUE"):
+            return [(self.target(inst), depth, blocks), (following, depth, blocks)]
+        elif opname == "FOR_ITER":
+            return [
+                (self.target(inst), depth - 1, blocks),
+                (following, depth + 1, blocks),
+            ]
+        elif opname == "SETUP_LOOP":
+            return [(following, depth, blocks + (("loop", self.target(inst), depth),))]
+        elif opname == "SETUP_EXCEPT":
+            handler = self.target(inst)
+            if self.version >= (3, 0):
+                handler_blocks = blocks + (("except-handler", None, depth),)
+                handler_depth = depth + 6
+            else:
+                handler_blocks = blocks
+                handler_depth = depth + 3
+            return [
+                (following, depth, blocks + (("except", handler, depth),)),
+                (handler, handler_depth, handler_blocks),
+            ]
+        elif opname == "POP_BLOCK":
+            if not blocks or blocks[-1][0] == "except-handler":
+                raise Untranslatable("POP_BLOCK with no block")
+            return [(following, depth, blocks[:-1])]
+        elif opname == "POP_EXCEPT":
+            if not blocks or blocks[-1][0] != "except-handler":
+                raise Untranslatable("POP_EXCEPT outside of an exception handler")
+            return [(following, blocks[-1][2], blocks[:-1])]
+        elif opname in ("BREAK_LOOP", "CONTINUE_LOOP"):
+            for i in range(len(blocks) - 1, -1, -1):
+                kind, target, level = blocks[i]
+                if kind == "loop":
+                    break
+            else:
+                raise Untranslatable(f"{opname} outside of a loop")
+            if opname == "BREAK_LOOP":
+                return [(target, level, blocks[:i])]
+            # A continue leaves the loop's iterator on the stack.
+            if i + 1 < len(blocks):
+                depth = blocks[i + 1][2]
+            return [(self.target(inst), depth, blocks[: i + 1])]
+        elif opname == "END_FINALLY":
+            # In a try/except, END_FINALLY is reached only when no
+            # handler matches, with the exception on the stack.
+            if depth < 3 or (
+                self.version >= (3, 0)
+                and (not blocks or blocks[-1][0] != "except-handler")
+            ):
+                raise Untranslatable("END_FINALLY outside of an exception handler")
+            return []
+        elif opname == "RAISE_VARARGS":
+            if arg == 1 or (arg == 2 and self.version >= (3, 0)):
+                return []
+            raise Untranslatable(f"RAISE_VARARGS {arg}")
+        elif opname == "RETURN_VALUE":
+            return []
+        raise Untranslatable(f"unsupported instruction {opname}")
+
+    def analyze(self) -> Dict[int, tuple]:
+        """Return the stack depth and block stack before each
+        instruction reachable from the start of the code, keyed by
+        offset."""
+        instructions = self.instructions
+        states = {0: (0, ())}
+        pending = [0]
+        while pending:
+            offset = pending.pop()
+            inst = instructions[offset]
+            if inst.opname not in AOT_OPS:
+                raise Untranslatable(f"unsupported instruction {inst.opname}")
+            depth, blocks = states[offset]
+            for target, target_depth, target_blocks in self.successors(
+                inst, depth, blocks
+            ):
+                if target >= len(instructions) or instructions[target] is None:
+                    raise Untranslatable("control goes past the end of the code")
+                target = instructions[target].offset
+                state = (target_depth, target_blocks)
+                if target not in states:
+                    states[target] = state
+                    pending.append(target)
+                elif states[target] != state:
+                    raise Untranslatable("stack depths don't agree")
+        return states
+
+    def handler(self, offset: int) -> Optional[tuple]:
+        """The (offset, depth) of the exception handler for the
+        instruction at `offset`, or None."""
+        for kind, target, level in reversed(self.states[offset][1]):
+            if kind == "except":
+                return target, level
+        return None
+
+    def leaders(self) -> List[int]:
+        """The offsets that start a basic block: the first instruction,
+        jump targets, exception handlers, and instructions with a
+        different exception handler from the instruction before them."""
+        instructions = self.instructions
+        states = self.states
+        leaders = {0}
+        for offset, (depth, blocks) in states.items():
+            inst = instructions[offset]
+            opname = inst.opname
+            if opname == "BREAK_LOOP":
+                leaders.add(self.successors(inst, depth, blocks)[0][0])
+            elif opname in TARGET_OPS:
+                leaders.add(self.target(inst))
+            following = inst.next_offset
+            if following in states and self.handler(following) != self.handler(
+                offset
+            ):
+                leaders.add(following)
+        return sorted(leader for leader in leaders if leader in states)
+
+    def handlers(self, leaders: List[int]) -> Dict[tuple, List[int]]:
+        """Map each exception handler to the blocks it handles."""
+        handlers: Dict[tuple, List[int]] = {}
+        for leader in leaders:
+            handler = self.handler(leader)
+            if handler is not None:
+                handlers.setdefault(handler, []).append(leader)
+        return handlers
+
+    # Code for the instructions.
+
+    def translate_block(self, indent: int, offset: int, leaders: frozenset):
+        instructions = self.instructions
+        states = self.states
+        previous = None
+        while True:
+            inst = instructions[offset]
+            depth = states[offset][0]
+            if inst.line_number is not None:
+                self.emit(indent, f"# line {inst.line_number}")
+            if not self.translate_instruction(indent, inst, depth, previous):
+                return
+            previous = inst
+            offset = inst.next_offset
+            if offset not in states:
+                return
+            if offset in leaders:
+                # The block for `offset` comes next in the loop.
+                self.emit(indent, f"{PREFIX}pc = {offset}")
+                return
+
+    def jump(self, indent: int, target: int):
+        self.emit(indent, f"{PREFIX}pc = {target}")
+        self.emit(indent, "continue")
+
+    def translate_instruction(self, indent: int, inst, d: int, previous) -> bool:
+        """Emit code for `inst`, which has `d` entries on the stack
+        before it. Return False if control doesn't go on to the next
+        instruction."""
+        emit = self.emit
+        opname = inst.opname
+        arg = inst.int_arg
+        s = self.slot
+
+        if opname in (
+            "NOP",
+            "POP_TOP",
+            "SETUP_LOOP",
+            "SETUP_EXCEPT",
+            "POP_BLOCK",
+            "POP_EXCEPT",
+        ):
+            pass
+        elif opname == "ROT_TWO":
+            emit(indent, f"{s(d - 2)}, {s(d - 1)} = {s(d - 1)}, {s(d - 2)}")
+        elif opname == "ROT_THREE":
+            emit(
+                indent,
+                f"{s(d - 3)}, {s(d - 2)}, {s(d - 1)} = "
+                f"{s(d - 1)}, {s(d - 3)}, {s(d - 2)}",
+            )
+        elif opname == "ROT_FOUR":
+            emit(
+                indent,
+                f"{s(d - 4)}, {s(d - 3)}, {s(d - 2)}, {s(d - 1)} = "
+                f"{s(d - 1)}, {s(d - 4)}, {s(d - 3)}, {s(d - 2)}",
+            )
+        elif opname == "DUP_TOP":
+            emit(indent, f"{s(d)} = {s(d - 1)}")
+        elif opname in ("DUP_TOP_TWO", "DUP_TOPX"):
+            count = 2 if opname == "DUP_TOP_TWO" else arg
+            for i in range(count):
+                emit(indent, f"{s(d + i)} = {s(d - count + i)}")
+        elif opname == "LOAD_CONST":
+            emit(indent, f"{s(d)} = {self.constant(inst.arguments[0], arg)}")
+        elif opname == "LOAD_FAST":
+            emit(indent, f"{s(d)} = {self.local_names[arg]}")
+        elif opname == "STORE_FAST":
+            emit(indent, f"{self.local_names[arg]} = {s(d - 1)}")
+        elif opname == "DELETE_FAST":
+            emit(indent, f"del {self.local_names[arg]}")
+        elif opname == "LOAD_GLOBAL":
+            name = inst.arguments[0]
+            if name in ("None", "True", "False"):
+                # Python 2 loads these as globals, but code that rebinds
+                # them is rare enough that we take them to be constants.
+                emit(indent, f"{s(d)} = {name}")
+                return True
+            if not is_name(name) or name.startswith(PREFIX):
+                raise Untranslatable(f"global name {name!r}")
+            if name in self.code.co_varnames:
+                raise Untranslatable(f"global {name} is also a local variable")
+            if name in FRAME_BUILTINS:
+                raise Untranslatable(f"uses {name}()")
+            emit(indent, f"{s(d)} = {name}")
+        elif opname in ("LOAD_ATTR", "LOAD_METHOD"):
+            emit(indent, f"{s(d - 1)} = {self.attribute(s(d - 1), inst)}")
+        elif opname == "STORE_ATTR":
+            emit(indent, f"{self.attribute(s(d - 1), inst)} = {s(d - 2)}")
+        elif opname.startswith("BINARY_") and opname[7:] in BINARY_OPERATORS:
+            operator = BINARY_OPERATORS[opname[7:]]
+            emit(indent, f"{s(d - 2)} = {s(d - 2)} {operator} {s(d - 1)}")
+        elif opname.startswith("INPLACE_"):
+            operator = BINARY_OPERATORS[opname[8:]]
+            emit(indent, f"{s(d - 2)} {operator}= {s(d - 1)}")
+        elif opname.startswith("UNARY_"):
+            operator = UNARY_OPERATORS[opname[6:]]
+            emit(indent, f"{s(d - 1)} = {operator}{s(d - 1)}")
+        elif opname == "BINARY_SUBSCR":
+            emit(indent, f"{s(d - 2)} = {s(d - 2)}[{s(d - 1)}]")
+        elif opname == "STORE_SUBSCR":
+            emit(indent, f"{s(d - 2)}[{s(d - 1)}] = {s(d - 3)}")
+        elif opname == "DELETE_SUBSCR":
+            emit(indent, f"del {s(d - 2)}[{s(d - 1)}]")
+        elif opname == "SLICE+0":
+            emit(indent, f"{s(d - 1)} = {s(d - 1)}[:]")
+        elif opname == "SLICE+1":
+            emit(indent, f"{s(d - 2)} = {s(d - 2)}[{s(d - 1)}:]")
+        elif opname == "SLICE+2":
+            emit(indent, f"{s(d - 2)} = {s(d - 2)}[:{s(d - 1)}]")
+        elif opname == "SLICE+3":
+            emit(indent, f"{s(d - 3)} = {s(d - 3)}[{s(d - 2)}:{s(d - 1)}]")
+        elif opname == "BUILD_SLICE":
+            items = ", ".join(s(i) for i in range(d - arg, d))
+            emit(indent, f"{s(d - arg)} = {self.helper('slice')}({items})")
+        elif opname == "COMPARE_OP":
+            name = self.vm.opc.cmp_op[arg]
+            if name in ("exception match", "exception-match"):
+                match = self.helper("match")
+                emit(indent, f"{s(d - 2)} = {match}({s(d - 2)}, {s(d - 1)})")
+            elif name in COMPARE_OPERATORS:
+                operator = COMPARE_OPERATORS[name]
+                emit(indent, f"{s(d - 2)} = {s(d - 2)} {operator} {s(d - 1)}")
+            else:
+                raise Untranslatable(f"COMPARE_OP {name}")
+        elif opname in ("IS_OP", "CONTAINS_OP"):
+            operator = "is" if opname == "IS_OP" else "in"
+            if arg:
+                operator = "is not" if opname == "IS_OP" else "not in"
+            emit(indent, f"{s(d - 2)} = {s(d - 2)} {operator} {s(d - 1)}")
+        elif opname in ("BUILD_TUPLE", "BUILD_LIST"):
+            items = "".join(f"{s(i)}, " for i in range(d - arg, d))
+            if opname == "BUILD_TUPLE":
+                emit(indent, f"{s(d - arg)} = ({items})")
+            else:
+                emit(indent, f"{s(d - arg)} = [{items}]")
+        elif opname == "BUILD_SET":
+            if arg:
+                items = ", ".join(s(i) for i in range(d - arg, d))
+                emit(indent, f"{s(d - arg)} = {{{items}}}")
+            else:
+                emit(indent, f"{s(d)} = {self.helper('set')}()")
+        elif opname == "BUILD_MAP":
+            if self.version >= (3, 5):
+                items = ", ".join(
+                    f"{s(i)}: {s(i + 1)}" for i in range(d - 2 * arg, d, 2)
+                )
+                emit(indent, f"{s(d - 2 * arg)} = {{{items}}}")
+            else:
+                emit(indent, f"{s(d)} = {{}}")
+        elif opname == "STORE_MAP":
+            emit(indent, f"{s(d - 3)}[{s(d - 1)}] = {s(d - 2)}")
+        elif opname == "LIST_APPEND":
+            emit(indent, f"{s(d - 1 - arg)}.append({s(d - 1)})")
+        elif opname == "LIST_EXTEND":
+            emit(indent, f"{s(d - 1 - arg)}.extend({s(d - 1)})")
+        elif opname == "GET_ITER":
+            emit(indent, f"{s(d - 1)} = {self.helper('iter')}({s(d - 1)})")
+        elif opname in ("CALL_FUNCTION", "CALL_FUNCTION_KW", "CALL_METHOD"):
+            self.translate_call(indent, inst, d, previous)
+        elif opname in ("JUMP_ABSOLUTE", "JUMP_FORWARD", "CONTINUE_LOOP"):
+            self.jump(indent, self.target(inst))
+            return False
+        elif opname == "BREAK_LOOP":
+            successors = self.successors(inst, d, self.states[inst.offset][1])
+            self.jump(indent, successors[0][0])
+            return False
+        elif opname in (
+            "POP_JUMP_IF_FALSE",
+            "POP_JUMP_IF_TRUE",
+            "JUMP_IF_FALSE_OR_POP",
+            "JUMP_IF_TRUE_OR_POP",
+            "JUMP_IF_FALSE",
+            "JUMP_IF_TRUE",
+        ):
+            test = "" if "TRUE" in opname else "not "
+            emit(indent, f"if {test}{s(d - 1)}:")
+            self.jump(indent + 1, self.target(inst))
+        elif opname == "FOR_ITER":
+            done = self.helper("done")
+            emit(indent, f"{s(d)} = {self.helper('next')}({s(d - 1)}, {done})")
+            emit(indent, f"if {s(d)} is {done}:")
+            self.jump(indent + 1, self.target(inst))
+        elif opname == "RETURN_VALUE":
+            emit(indent, f"return {s(d - 1)}")
+            return False
+        elif opname == "RAISE_VARARGS":
+            if arg == 2:
+                emit(indent, f"raise {s(d - 2)} from {s(d - 1)}")
+            else:
+                emit(indent, f"raise {s(d - 1)}")
+            return False
+        elif opname == "END_FINALLY":
+            # Raise the exception again.
+            emit(indent, f"raise {s(d - 2)}")
+            return False
+        else:  # pragma: no cover
+            raise Untranslatable(f"unsupported instruction {opname}")
+        return True
+
+    def attribute(self, obj: str, inst) -> str:
+        name = inst.arguments[0]
+        if is_name(name):
+            return f"{obj}.{name}"
+        raise Untranslatable(f"attribute name {name!r}")
+
+    def translate_call(self, indent: int, inst, d: int, previous):
+        opname = inst.opname
+        arg = inst.int_arg
+        s = self.slot
+        if opname == "CALL_METHOD":
+            # LOAD_METHOD left the bound method below an unused entry.
+            function = d - arg - 2
+            args = [s(i) for i in range(d - arg, d)]
+        elif opname == "CALL_FUNCTION_KW":
+            # The keyword names are a constant tuple on top of the stack.
+            if previous is None or previous.opname != "LOAD_CONST":
+                raise Untranslatable("CALL_FUNCTION_KW without constant names")
+            names = previous.arguments[0]
+            if not all(is_name(name) for name in names):
+                raise Untranslatable(f"keyword names {names!r}")
+            function = d - arg - 2
+            npos = arg - len(names)
+            args = [s(i) for i in range(function + 1, function + 1 + npos)]
+            args.extend(
+                f"{name}={s(function + 1 + npos + i)}" for i, name in enumerate(names)
+            )
+        elif self.version < (3, 6):
+            npos = arg & 0xFF
+            nkw = (arg >> 8) & 0xFF
+            function = d - npos - 2 * nkw - 1
+            args = [s(i) for i in range(function + 1, function + 1 + npos)]
+            if nkw:
+                pairs = ", ".join(
+                    f"{s(i)}: {s(i + 1)}" for i in range(function + 1 + npos, d, 2)
+                )
+                args.append(f"**{{{pairs}}}")
+        else:
+            function = d - arg - 1
+            args = [s(i) for i in range(function + 1, d)]
+        self.emit(indent, f"{s(function)} = {s(function)}({', '.join(args)})")
+
+
+def is_function_code(code) -> bool:
+    """Return True if `code` is the code of an optimized function."""
+    flags = code.co_flags & (CO_OPTIMIZED | CO_NEWLOCALS)
+    return flags == CO_OPTIMIZED | CO_NEWLOCALS
+
+
+def is_name(name) -> bool:
+    """Return True if `name` can be written as a name in Python source."""
+    return isinstance(name, str) and name.isidentifier() and not keyword.iskeyword(name)
+
+
+class AOT(object):
+    """Translates the functions of code run by `vm` into native code,
+    and keeps the translations. Functions that can't be translated are
+    left interpreted, and the `report` lists which were which."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        # Translation or None for each code object seen, keyed by
+        # id(code). The code object is kept so its id isn't reused.
+        self.translations: Dict[int, Tuple[object, Optional[Translation]]] = {}
+        self.report = AOTReport(vm.version)
+
+    def translate_tree(self, code):
+        """Translate the functions among `code` and the code objects
+        in its constants, recursively."""
+        pending = [code]
+        while pending:
+            code = pending.pop()
+            if is_function_code(code):
+                self.translation(code)
+            pending.extend(const for const in code.co_consts if iscode(const))
+
+    def translation(self, code) -> Optional[Translation]:
+        """Return the Translation of function code `code`, or None if
+        it is run by the interpreter."""
+        entry = self.translations.get(id(code))
+        if entry is not None and entry[0] is code:
+            return entry[1]
+        try:
+            translation = self.translate(code)
+        except Untranslatable as exc:
+            log.info("%s left interpreted: %s", describe(code), exc.reason)
+            self.report.interpreted.append((describe(code), exc.reason))
+            translation = None
+        else:
+            self.report.converted.append(describe(code))
+        self.translations[id(code)] = (code, translation)
+        return translation
+
+    def translate(self, code) -> Translation:
+        vm = self.vm
+        if vm.is_pypy:
+            raise Untranslatable("PyPy bytecode")
+        if tuple(vm.version[:2]) > (3, 10):
+            raise Untranslatable(
+                f"Python {version_tuple_to_str(vm.version)} bytecode"
+            )
+        flags = code.co_flags
+        if flags & NOT_AOT_FLAGS:
+            raise Untranslatable("generator or coroutine")
+        if not is_function_code(code):
+            raise Untranslatable("not an optimized function")
+        if code.co_cellvars or code.co_freevars:
+            raise Untranslatable("has a closure")
+
+        line_table = LineTable(vm.opc.findlinestarts(code, dup_lines=True))
+        instructions = decode_code(vm.opc, vm.version, code, line_table.linestarts)
+        translator = FunctionTranslator(vm, code, instructions)
+        source = translator.translate()
+
+        filename = f"<aot {describe(code)}>"
+        # So that tracebacks through native code show the source.
+        lines = source.splitlines(True)
+        linecache.cache[filename] = (len(source), None, lines, filename)
+        namespace: dict = {}
+        try:
+            exec(compile(source, filename, "exec"), namespace)
+        except SyntaxError as exc:
+            raise Untranslatable(f"translated code doesn't compile: {exc}")
+        made = namespace[PREFIX + "make"](**translator.free_values)
+        native_code = made.__code__
+        if hasattr(native_code, "replace"):
+            # For tracebacks.
+            native_code = native_code.replace(co_name=code.co_name)
+        return Translation(native_code, made.__closure__, source)
+
+    def function(self, func, plan) -> Optional[types.FunctionType]:
+        """Return a native function that does what interpreter
+        Function `func` does, with the code and defaults of its
+        BindingPlan `plan`, or None if its code isn't translated."""
+        if not is_function_code(plan.code):
+            # A class body, or Python 2 code that uses exec.
+            return None
+        if "__builtins__" not in func.func_globals:
+            # A native function would get our builtins, where the
+            # interpreter gives next to none; see frame_builtins().
+            return None
+        translation = self.translation(plan.code)
+        if translation is None:
+            return None
+        native = types.FunctionType(
+            translation.code,
+            func.func_globals,
+            func.__name__,
+            plan.defaults or None,
+            translation.closure,
+        )
+        if self.vm.version >= (3, 0):
+            native.__kwdefaults__ = plan.kwdefaults or None
+            native.__qualname__ = getattr(func, "__qualname__", func.__name__)
+        native.__doc__ = func.__doc__
+        return native
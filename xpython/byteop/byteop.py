@@ -4,16 +4,33 @@
 Note: this is subclassed. Later versions use operations from here.
 """
 
+import functools
 import inspect
 import logging
 import operator
 import sys
-from typing import Any, Callable
+from typing import Any, Callable, List, Optional
 
+from xdis import CO_ASYNC_GENERATOR, CO_COROUTINE, CO_GENERATOR, CO_ITERABLE_COROUTINE
 from xdis.version_info import PYTHON_VERSION_TRIPLE, version_tuple_to_str
 
 from xpython.builtins import build_class, builtin_super
-from xpython.pyobj import Function
+from xpython.callsite import (
+    CALL_BOUND_METHOD,
+    CALL_INTERPRETED,
+    CALL_NATIVE_FUNCTION,
+    CALL_SPECIAL_BUILTIN,
+    CALL_SUPER,
+    CALL_TYPE,
+    classify,
+)
+from xpython.pyobj import (
+    UNBOUND,
+    WHY_CALL,
+    WHY_EXCEPTION,
+    WHY_RERAISE,
+    Function,
+)
 from xpython.vm import PyVM
 
 
@@ -67,6 +84,10 @@ INPLACE_OPERATORS = frozenset(
 if PYTHON_VERSION_TRIPLE >= (3, 5):
     BINARY_OPERATORS["MATRIX_MULTIPLY"] = operator.matmul
 
+# Calls to code with these flags set don't run the code to completion,
+# so they are never run inline in the caller's eval loop.
+NOT_INLINE_FLAGS = CO_GENERATOR | CO_COROUTINE | CO_ITERABLE_COROUTINE | CO_ASYNC_GENERATOR
+
 
 def fmt_binary_op(vm: PyVM, arg=None, repr=repr):
     """returns a string of the repr() for each of the first two
@@ -91,13 +112,17 @@ def fmt_unary_op(vm: PyVM, arg=None, repr=repr):
     # as opposed to a RETURN_VALUE, callback can return the value has
     # been popped, and if the return values was the only one on the
     # stack, it will be empty here.
-    if len(vm.frame.stack):
+    if vm.frame.stack_pointer:
         return f" ({repr(vm.top())})"
     else:
         raise vm.PyVMError("Empty stack in unary op")
 
 
 class ByteOpBase(object):
+    # Opcode dispatch templates, keyed by ByteOp class and opcode names.
+    # See dispatch_template().
+    _dispatch_templates = {}
+
     def __init__(self, vm):
         self.vm = vm
         # Convenience variables
@@ -116,6 +141,10 @@ class ByteOpBase(object):
         for op in INPLACE_OPERATORS:
             self.stack_fmt["INPLACE_" + op] = fmt_binary_op
 
+        # The CallSite of the call instruction being run, if it has
+        # one; see xpython.callsite.
+        self.call_site = None
+
         # Set this lazily in "convert_method_native_func
         self.method_func_access = None
         self.cross_bytecode_eval_warning_shown = False
@@ -130,8 +159,19 @@ class ByteOpBase(object):
         self.vm.push(container_fn(elts))
 
     def call_function_with_args_resolved(self, func, pos_args, named_args):
-        frame = self.vm.frame
-        if hasattr(func, "im_func"):
+        vm = self.vm
+        # How to call `func` depends on what it is. The call
+        # instruction being run may have cached that; see
+        # xpython.callsite.
+        site = self.call_site
+        if site is None:
+            same_version = self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]
+            strategy = classify(func, same_version)
+        else:
+            self.call_site = None
+            strategy = site.strategy(func)
+
+        if strategy == CALL_BOUND_METHOD:
             # Methods get self as an implicit first parameter.
             if func.im_self is not None:
                 pos_args.insert(0, func.im_self)
@@ -147,151 +187,38 @@ class ByteOpBase(object):
                     )
                 )
             func = func.im_func
-
-        # FIXME: put this in a separate routine.
-        if inspect.isbuiltin(func):
-            log.debug(f"handling built-in function {func.__name__}")
-            if func == globals:
-                # Use the frame's globals(), not the interpreter's
-                self.vm.push(frame.f_globals)
-                return
-            elif func == locals:
-                # Use the frame's locals(), not the interpreter's
-                self.vm.push(frame.f_locals)
+            if site is None:
+                strategy = classify(func, same_version)
+            else:
+                strategy = site.strategy(func)
+
+        if strategy == CALL_INTERPRETED:
+            if (
+                vm.inline_calls
+                and func._vm is vm
+                and (vm.aot is None or func.aot_function() is None)
+                and not func.__code__.co_flags & NOT_INLINE_FLAGS
+            ):
+                # Have the eval loop run the function's frame directly,
+                # rather than calling it and nesting another eval loop.
+                if len(vm.frames) >= sys.getrecursionlimit():
+                    raise RecursionError("maximum recursion depth exceeded")
+                vm.call_frame = func.make_call_frame(pos_args, named_args)
+                return WHY_CALL
+        elif strategy == CALL_SPECIAL_BUILTIN:
+            if self.vm.log_debug:
+                log.debug("handling built-in function %s", func.__name__)
+            if self.call_special_builtin(func, pos_args, named_args):
                 return
-            elif func == compile:
-                # Set dont_inherit parameter.  FIXME: we should set
-                # other flags too based on the interpreted
-                # environment?
-                if len(pos_args) < 5 and "dont_inherit" not in named_args:
-                    named_args["dont_inherit"] = True
-                    pass
-            # In Python 3.0 or greater, "exec()" is a builtin.  In
-            # Python 2.7 it was an opcode EXEC_STMT and is not a
-            # built-in function.
-            #
-            # FIXME: a better test would be nice. There can be
-            # other builtin "exec"s. Tk has a built-in "eval". See 3.6.10
-            # test_tcl.py.
-            # If we drop the requirement of supporting 2.7 we can do the simpler
-            # and more reliable:
-            #   func == exec
-            elif func.__name__ == "exec":
-                if not 1 <= len(pos_args) <= 3:
-                    raise self.vm.PyVMError(
-                        "exec() builtin should have 1..3 positional arguments; got %d"
-                        % (len(pos_args))
-                    )
-                n = len(pos_args)
-                assert 1 <= n <= 3
-
-                # Note that in contrast to `eval()` handled below, if
-                # the `locals` parameter is not provided, the
-                # `globals` parameter value (whether provided or
-                # default value) is used for the `locals`
-                # parameter. So we shouldn't use the frame's `locals`.
-                if len(pos_args) == 1:
-                    pos_args.append(self.vm.frame.f_globals)
-
-                if self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]:
-                    source = pos_args[0]
-                    if isinstance(source, str) or isinstance(source, bytes):
-                        try:
-                            pos_args[0] = compile(
-                                source, "<string>", mode="exec", dont_inherit=True
-                            )
-                        except (TypeError, SyntaxError, ValueError):
-                            raise
-                    self.vm.push(self.vm.run_code(*pos_args, toplevel=False))
-                    return
-                else:
-                    if not self.cross_bytecode_exec_warning_shown:
-                        log.warning(
-                            "Running built-in `exec()` because we are cross-version "
-                            "interpreting version %s from version %s."
-                            % (
-                                version_tuple_to_str(self.version_info, end=2),
-                                version_tuple_to_str(PYTHON_VERSION_TRIPLE, end=2),
-                            )
-                        )
-                        self.cross_bytecode_exec_warning_shown = True
-
-            elif func == eval:
-                if not 1 <= len(pos_args) <= 3:
-                    raise self.vm.PyVMError(
-                        "eval() builtin should have 1..3 positional arguments; got %d"
-                        % (len(pos_args))
-                    )
-                assert 1 <= len(pos_args) <= 3
-                # Use the frame's globals(), not the interpreter's
-                n = len(pos_args)
-                if n < 2:
-                    pos_args.append(self.vm.frame.f_globals)
-                # Likewise for locals()
-                if n < 3:
-                    pos_args.append(self.vm.frame.f_locals)
-                assert len(pos_args) == 3
-
-                if self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]:
-                    source = pos_args[0]
-                    if isinstance(source, str) or isinstance(source, unicode):
-                        try:
-                            pos_args[0] = compile(
-                                source, "<string>", mode="eval", dont_inherit=True
-                            )
-                        except (TypeError, SyntaxError, ValueError):
-                            raise
-                    self.vm.push(self.vm.run_code(*pos_args, toplevel=False))
-                    return
-                else:
-                    if not self.cross_bytecode_eval_warning_shown:
-                        log.warning(
-                            "Running built-in `eval()` because we are cross-version "
-                            "interpreting version %s from version %s."
-                            % (
-                                version_tuple_to_str(self.version_info, end=2),
-                                version_tuple_to_str(PYTHON_VERSION_TRIPLE, end=2),
-                            )
-                        )
-                        self.cross_bytecode_eval_warning_shown = True
-
-            elif PYTHON_VERSION_TRIPLE >= (3, 0) and func == __build_class__:
-                assert len(pos_args) > 0, (
-                    "__build_class__() should have at least one argument, an "
-                    "__init__() function."
+        elif strategy == CALL_TYPE:
+            if len(pos_args) == 3:
+                # Set __module__
+                assert not named_args
+                namespace = pos_args[2]
+                namespace["__module__"] = namespace.get(
+                    "__name__", self.vm.frame.f_globals["__name__"]
                 )
-                init_fn = pos_args[0]
-                if (
-                    isinstance(init_fn, Function)
-                    or self.is_pypy
-                    or self.version_info[:2] != PYTHON_VERSION_TRIPLE[:2]
-                ) and PYTHON_VERSION_TRIPLE >= (3, 3):
-                    # 3.3+ __build_class__() works only on bytecode
-                    # that matches the CPython interpreter, so use
-                    # Darius' version instead.  Down the line we will
-                    # try to do this universally, but it is tricky:
-                    retval = build_class(self.vm.opc, *pos_args, **named_args)
-                    self.vm.push(retval)
-                    return
-                else:
-                    # Use builtin __build_class__(). However for that,
-                    # we need a native function.  This is wrong though
-                    # in that we won't trace into __init__().
-                    init_fn = pos_args[0]
-                    if isinstance(init_fn, Function) and init_fn in self.vm.fn2native:
-                        pos_args[0] = self.vm.fn2native[init_fn]
-        elif func == type and len(pos_args) == 3:
-            # Set __module__
-            assert not named_args
-            namespace = pos_args[2]
-            namespace["__module__"] = namespace.get(
-                "__name__", self.vm.frame.f_globals["__name__"]
-            )
-
-        if (
-            inspect.isfunction(func)
-            and self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]
-        ):
+        elif strategy == CALL_NATIVE_FUNCTION:
             # Try to convert to an interpreter function, so we can interpret it.
             if func in self.vm.fn2native:
                 func = self.vm.fn2native[func]
@@ -304,21 +231,149 @@ class ByteOpBase(object):
                 # In Python 2.X we work around a similar problem by
                 # not tying to handle functions with closures.
                 assert len(pos_args) > 0
-                pos_args[0] = self.convert_native_to_Function(frame, pos_args[0])
-
-        if (
-            inspect.isfunction(func)
-            and self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]
-        ):
-            log.debug(f"calling native function {func.__name__}")
-        elif inspect.isclass(func):
-            if func.__name__ == "super":
-                pos_args = [self.vm.frame] + pos_args
-                func = builtin_super
+                pos_args[0] = self.convert_native_to_Function(
+                    self.vm.frame, pos_args[0]
+                )
+            elif self.vm.log_debug:
+                log.debug("calling native function %s", func.__name__)
+        elif strategy == CALL_SUPER:
+            pos_args = [self.vm.frame] + pos_args
+            func = builtin_super
 
         retval = func(*pos_args, **named_args)
         self.vm.push(retval)
 
+    def call_special_builtin(self, func, pos_args, named_args) -> bool:
+        """Run the built-in function `func` for the frame being
+        interpreted, if that is called for, pushing what it returns,
+        and return True. Otherwise, return False after adjusting
+        `pos_args` and `named_args` for calling `func`."""
+        frame = self.vm.frame
+        if func is globals:
+            # Use the frame's globals(), not the interpreter's
+            self.vm.push(frame.f_globals)
+            return True
+        elif func is locals:
+            # Use the frame's locals(), not the interpreter's
+            frame.escape()
+            self.vm.push(frame.f_locals)
+            return True
+        elif func is compile:
+            # Set dont_inherit parameter.  FIXME: we should set
+            # other flags too based on the interpreted
+            # environment?
+            if len(pos_args) < 5 and "dont_inherit" not in named_args:
+                named_args["dont_inherit"] = True
+                pass
+        # In Python 3.0 or greater, "exec()" is a builtin.  In
+        # Python 2.7 it was an opcode EXEC_STMT and is not a
+        # built-in function.
+        elif func is exec:
+            if not 1 <= len(pos_args) <= 3:
+                raise self.vm.PyVMError(
+                    "exec() builtin should have 1..3 positional arguments; got %d"
+                    % (len(pos_args))
+                )
+            n = len(pos_args)
+            assert 1 <= n <= 3
+
+            # Note that in contrast to `eval()` handled below, if
+            # the `locals` parameter is not provided, the
+            # `globals` parameter value (whether provided or
+            # default value) is used for the `locals`
+            # parameter. So we shouldn't use the frame's `locals`.
+            if len(pos_args) == 1:
+                pos_args.append(self.vm.frame.f_globals)
+
+            if self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]:
+                source = pos_args[0]
+                if isinstance(source, str) or isinstance(source, bytes):
+                    try:
+                        pos_args[0] = compile(
+                            source, "<string>", mode="exec", dont_inherit=True
+                        )
+                    except (TypeError, SyntaxError, ValueError):
+                        raise
+                self.vm.push(self.vm.run_code(*pos_args, toplevel=False))
+                return True
+            else:
+                if not self.cross_bytecode_exec_warning_shown:
+                    log.warning(
+                        "Running built-in `exec()` because we are cross-version "
+                        "interpreting version %s from version %s."
+                        % (
+                            version_tuple_to_str(self.version_info, end=2),
+                            version_tuple_to_str(PYTHON_VERSION_TRIPLE, end=2),
+                        )
+                    )
+                    self.cross_bytecode_exec_warning_shown = True
+
+        elif func is eval:
+            if not 1 <= len(pos_args) <= 3:
+                raise self.vm.PyVMError(
+                    "eval() builtin should have 1..3 positional arguments; got %d"
+                    % (len(pos_args))
+                )
+            assert 1 <= len(pos_args) <= 3
+            # Use the frame's globals(), not the interpreter's
+            n = len(pos_args)
+            if n < 2:
+                pos_args.append(self.vm.frame.f_globals)
+            # Likewise for locals()
+            if n < 3:
+                pos_args.append(self.vm.frame.f_locals)
+            assert len(pos_args) == 3
+
+            if self.version_info[:2] == PYTHON_VERSION_TRIPLE[:2]:
+                source = pos_args[0]
+                if isinstance(source, str) or isinstance(source, unicode):
+                    try:
+                        pos_args[0] = compile(
+                            source, "<string>", mode="eval", dont_inherit=True
+                        )
+                    except (TypeError, SyntaxError, ValueError):
+                        raise
+                self.vm.push(self.vm.run_code(*pos_args, toplevel=False))
+                return True
+            else:
+                if not self.cross_bytecode_eval_warning_shown:
+                    log.warning(
+                        "Running built-in `eval()` because we are cross-version "
+                        "interpreting version %s from version %s."
+                        % (
+                            version_tuple_to_str(self.version_info, end=2),
+                            version_tuple_to_str(PYTHON_VERSION_TRIPLE, end=2),
+                        )
+                    )
+                    self.cross_bytecode_eval_warning_shown = True
+
+        elif func is __build_class__:
+            assert len(pos_args) > 0, (
+                "__build_class__() should have at least one argument, an "
+                "__init__() function."
+            )
+            init_fn = pos_args[0]
+            if (
+                isinstance(init_fn, Function)
+                or self.is_pypy
+                or self.version_info[:2] != PYTHON_VERSION_TRIPLE[:2]
+            ) and PYTHON_VERSION_TRIPLE >= (3, 3):
+                # 3.3+ __build_class__() works only on bytecode
+                # that matches the CPython interpreter, so use
+                # Darius' version instead.  Down the line we will
+                # try to do this universally, but it is tricky:
+                retval = build_class(self.vm.opc, *pos_args, **named_args)
+                self.vm.push(retval)
+                return True
+            else:
+                # Use builtin __build_class__(). However for that,
+                # we need a native function.  This is wrong though
+                # in that we won't trace into __init__().
+                init_fn = pos_args[0]
+                if isinstance(init_fn, Function) and init_fn in self.vm.fn2native:
+                    pos_args[0] = self.vm.fn2native[init_fn]
+        return False
+
     def call_function(self, argc: int, var_args, keyword_args: dict) -> Any:
         named_args = {}
         len_kw, len_pos = divmod(argc, 256)
@@ -383,13 +438,64 @@ class ByteOpBase(object):
             self.vm.fn2native[native_func] = func
         return func
 
+    @classmethod
+    def dispatch_template(cls, opc) -> list:
+        """Return a list indexed by opcode number whose entries are
+        either None, when this class has no method for the opcode,
+        or a (function, args) pair. `function` is an unbound method
+        and `args` are leading arguments to pass it. The operator
+        families, e.g. BINARY_ADD, UNARY_NOT, have the operator
+        name filled in as an argument.
+
+        The template is computed once per class and set of opcode names.
+        """
+        opnames = tuple(opc.opname)
+        key = (cls, opnames)
+        template = ByteOpBase._dispatch_templates.get(key)
+        if template is None:
+            template = [cls._dispatch_entry(opname) for opname in opnames]
+            ByteOpBase._dispatch_templates[key] = template
+        return template
+
+    @classmethod
+    def _dispatch_entry(cls, opname: str):
+        if opname.startswith("UNARY_"):
+            return cls.unaryOperator, (opname[6:],)
+        elif opname.startswith("BINARY_") and opname != "BINARY_OP":
+            return cls.binaryOperator, (opname[7:],)
+        elif opname.startswith("INPLACE_"):
+            return cls.inplaceOperator, (opname[8:],)
+        elif "SLICE+" in opname:
+            return cls.sliceOperator, (opname,)
+        fn = getattr(cls, opname, None)
+        if not callable(fn):
+            return None
+        return fn, ()
+
+    def dispatch_table(self, opc) -> List[Optional[Callable]]:
+        """Return a list indexed by opcode number of the methods, bound
+        to this instance, which implement each opcode. Entries for
+        opcodes that we don't implement are None.
+        """
+        table = []
+        for entry in self.dispatch_template(opc):
+            if entry is None:
+                table.append(None)
+                continue
+            fn, args = entry
+            bytecode_fn = fn.__get__(self, type(self))
+            if args:
+                bytecode_fn = functools.partial(bytecode_fn, *args)
+            table.append(bytecode_fn)
+        return table
+
     def do_raise(self, exc, cause):
         if exc is None:  # reraise
             exc_type, val, tb = self.vm.last_exception
             if exc_type is None:
-                return "exception"  # error
+                return WHY_EXCEPTION  # error
             else:
-                return "reraise"
+                return WHY_RERAISE
 
         elif type(exc) is type:
             # As in `raise ValueError`
@@ -400,7 +506,7 @@ class ByteOpBase(object):
             exc_type = type(exc)
             val = exc
         else:
-            return "exception"  # error
+            return WHY_EXCEPTION  # error
 
         # If you reach this point, you're guaranteed that
         # val is a valid exception instance and exc_type is its class.
@@ -409,12 +515,12 @@ class ByteOpBase(object):
             if type(cause) is type:
                 cause = cause()
             elif not isinstance(cause, BaseException):
-                return "exception"  # error
+                return WHY_EXCEPTION  # error
 
             val.__cause__ = cause
 
         self.vm.last_exception = exc_type, val, val.__traceback__
-        return "exception"
+        return WHY_EXCEPTION
 
     def inplaceOperator(self, op):
         x, y = self.vm.popn(2)
@@ -460,14 +566,27 @@ class ByteOpBase(object):
     def lookup_name(self, name):
         """Returns the value in the current frame associated for name"""
         frame = self.vm.frame
-        if name in frame.f_locals:
-            val = frame.f_locals[name]
-        elif name in frame.f_globals:
-            val = frame.f_globals[name]
-        elif name in frame.f_builtins:
-            val = frame.f_builtins[name]
-        else:
-            raise NameError(f"name '{name}' is not defined")
+        f_locals = frame.f_locals
+        f_globals = frame.f_globals
+        # At module level the locals are the globals, so there is no
+        # need to look there twice.
+        if f_locals is not f_globals:
+            if type(f_locals) is dict:
+                val = f_locals.get(name, UNBOUND)
+            else:
+                # A class body namespace from __prepare__() can be any
+                # mapping; it only has to support [].
+                try:
+                    val = f_locals[name]
+                except KeyError:
+                    val = UNBOUND
+            if val is not UNBOUND:
+                return val
+        val = f_globals.get(name, UNBOUND)
+        if val is UNBOUND:
+            val = frame.f_builtins.get(name, UNBOUND)
+            if val is UNBOUND:
+                raise NameError(f"name '{name}' is not defined")
         return val
 
     def print_item(self, item, to=None):
@@ -508,6 +627,27 @@ class ByteOpBase(object):
         if hasattr(to, "softspace"):
             to.softspace = 0
 
+    def sliceOperator(self, op):
+        start = 0
+        end = None  # we will take this to mean end
+        op, count = op[:-2], int(op[-1])
+        if count == 1:
+            start = self.vm.pop()
+        elif count == 2:
+            end = self.vm.pop()
+        elif count == 3:
+            end = self.vm.pop()
+            start = self.vm.pop()
+        slice_len = self.vm.pop()
+        if end is None:
+            end = len(slice_len)
+        if op.startswith("STORE_"):
+            slice_len[start:end] = self.vm.pop()
+        elif op.startswith("DELETE_"):
+            del slice_len[start:end]
+        else:
+            self.vm.push(slice_len[start:end])
+
     def unaryOperator(self, op):
         x = self.vm.pop()
         self.vm.push(UNARY_OPERATORS[op](x))
@@ -28,7 +28,23 @@ from xpython.byteop.byteop import (
     fmt_ternary_op,
     fmt_unary_op,
 )
-from xpython.pyobj import Cell, Function, traceback_from_frame
+from xpython.pyobj import (
+    BLOCK_EXCEPT_HANDLER,
+    BLOCK_FINALLY,
+    BLOCK_LOOP,
+    BLOCK_SETUP_EXCEPT,
+    UNBOUND,
+    WHY_BREAK,
+    WHY_CODES,
+    WHY_CONTINUE,
+    WHY_EXCEPTION,
+    WHY_RERAISE,
+    WHY_RETURN,
+    WHY_SILENCED,
+    WHY_YIELD,
+    Cell,
+    Function,
+)
 from xpython.vmtrace import PyVMEVENT_RETURN, PyVMEVENT_YIELD
 
 Version_info = namedtuple("version_info", "major minor micro releaselevel serial")
@@ -134,7 +150,7 @@ class ByteOp24(ByteOpBase):
         last_i = frame.f_lasti
         orig_opcode = frame.brkpt[last_i]
         orig_opname = vm.opc.opname[orig_opcode]
-        log.info("Breakpoint at offset %d instruction %s" % (last_i, orig_opname))
+        log.info("Breakpoint at offset %d instruction %s", last_i, orig_opname)
         (
             byte_name,
             byte_code,
@@ -148,6 +164,7 @@ class ByteOp24(ByteOpBase):
             result = vm.callback(
                 "breakpoint", last_i, byte_name, byte_code, line_number, None, [], vm
             )
+            frame.locals_to_fast()
 
             # FIXME: DRY with vmtrace code
             if result:
@@ -161,7 +178,7 @@ class ByteOp24(ByteOpBase):
                     # Don't run instruction
                     return result
 
-        if log.isEnabledFor(logging.INFO):
+        if vm.log_info:
             vm.log(byte_name, int_arg, arguments, opoffset, line_number)
         return vm.dispatch(byte_name, int_arg, arguments, opoffset, line_number)
 
@@ -254,7 +271,7 @@ class ByteOp24(ByteOpBase):
 
     def BREAK_LOOP(self):
         """Terminates a loop due to a break statement."""
-        return "break"
+        return WHY_BREAK
 
     def CONTINUE_LOOP(self, dest):
         """
@@ -268,7 +285,7 @@ class ByteOp24(ByteOpBase):
         # pushed on the stack for both, so continue puts the jump destination
         # into return_value.
         self.vm.return_value = dest
-        return "continue"
+        return WHY_CONTINUE
 
     def LIST_APPEND(self):
         """Calls list.append(TOS1, TOS). Used to implement list
@@ -291,14 +308,14 @@ class ByteOp24(ByteOpBase):
         self.vm.return_value = self.vm.pop()
         if self.vm.frame.generator:
             self.vm.frame.generator.finished = True
-        return "return"
+        return WHY_RETURN
 
     def YIELD_VALUE(self):
         """
         Pops TOS and yields it from a generator.
         """
         self.vm.return_value = self.vm.pop()
-        return "yield"
+        return WHY_YIELD
 
     def IMPORT_STAR(self):
         """Loads all symbols not starting with '_' directly from the module
@@ -340,12 +357,13 @@ class ByteOp24(ByteOpBase):
         """
         v = self.vm.pop()
         if isinstance(v, str):
-            why = v
-            if why in ("return", "continue"):
+            # A why value pushed by manage_block_stack() or WITH_CLEANUP.
+            why = WHY_CODES[v]
+            if why == WHY_RETURN or why == WHY_CONTINUE:
                 self.vm.return_value = self.vm.pop()
-            if why == "silenced":  # self.version_info[:2] >= (3, 0)
+            if why == WHY_SILENCED:  # self.version_info[:2] >= (3, 0)
                 block = self.vm.pop_block()
-                assert block.type == "except-handler"
+                assert block.type == BLOCK_EXCEPT_HANDLER
                 self.vm.unwind_block(block)
                 why = None
         elif v is None:
@@ -357,11 +375,11 @@ class ByteOp24(ByteOpBase):
             self.vm.last_exception = (exctype, val, tb)
             if self.version_info[:2] >= (3, 5):
                 block = self.vm.top_block()
-                while len(self.vm.frame.stack) > block.level:
-                    self.vm.pop()
+                if self.vm.frame.stack_pointer > block.level:
+                    self.vm.stack_truncate(block.level)
                 self.vm.push(tb, val, exctype)
 
-            why = "reraise"
+            why = WHY_RERAISE
         else:  # pragma: no cover
             raise self.vm.PyVMError("Confused END_FINALLY")
         return why
@@ -450,7 +468,7 @@ class ByteOp24(ByteOpBase):
         #     self.vm.last_exception = (NameError,
         #                               NameError("name '%s' is not defined" % name),
         #                               tb)
-        #     return "exception"
+        #     return WHY_EXCEPTION
         # else:
         #     self.vm.push(self.lookup_name(name))
 
@@ -564,7 +582,7 @@ class ByteOp24(ByteOpBase):
                 )
 
             self.vm.last_exception = (ImportError, value, None)
-            return "exception"
+            return WHY_EXCEPTION
 
         self.vm.push(getattr(mod, name))
 
@@ -631,12 +649,13 @@ class ByteOp24(ByteOpBase):
         Note: name = co_names[namei] set in parse_byte_and_args()
         """
         f = self.vm.frame
-        if name in f.f_globals:
-            val = f.f_globals[name]
-        elif name in f.f_builtins:
-            val = f.f_builtins[name]
-        else:
-            raise NameError(f"global name '{name}' is not defined")
+        # A single probe of each namespace, rather than a membership
+        # test followed by a fetch.
+        val = f.f_globals.get(name, UNBOUND)
+        if val is UNBOUND:
+            val = f.f_builtins.get(name, UNBOUND)
+            if val is UNBOUND:
+                raise NameError(f"global name '{name}' is not defined")
         self.vm.push(val)
 
     def SETUP_LOOP(self, jump_offset):
@@ -646,7 +665,7 @@ class ByteOp24(ByteOpBase):
 
         Note: jump = delta + f.f_lasti set in parse_byte_and_args()
         """
-        self.vm.push_block("loop", jump_offset)
+        self.vm.push_block(BLOCK_LOOP, jump_offset)
 
     def SETUP_EXCEPT(self, jump_offset):
         """
@@ -656,7 +675,7 @@ class ByteOp24(ByteOpBase):
         Note: jump = delta + f.f_lasti set in parse_byte_and_args()
         """
 
-        self.vm.push_block("setup-except", jump_offset)
+        self.vm.push_block(BLOCK_SETUP_EXCEPT, jump_offset)
 
     def SETUP_FINALLY(self, jump_offset):
         """
@@ -665,7 +684,7 @@ class ByteOp24(ByteOpBase):
 
         Note: jump = delta + f.f_lasti set in parse_byte_and_args()
         """
-        self.vm.push_block("finally", jump_offset)
+        self.vm.push_block(BLOCK_FINALLY, jump_offset)
 
     def STORE_MAP(self):
         """Store a key and value pair in a dictionary. Pops the key
@@ -677,13 +696,18 @@ class ByteOp24(ByteOpBase):
 
     # some (but not all) Names
 
-    def LOAD_FAST(self, name):
+    def LOAD_FAST(self, var_num):
         """
         Pushes a reference to the local co_varnames[var_num] onto the stack.
         """
-        if name in self.vm.frame.f_locals:
-            val = self.vm.frame.f_locals[name]
+        frame = self.vm.frame
+        if frame.fastlocals is None:
+            name = frame.f_code.co_varnames[var_num]
+            val = frame.f_locals.get(name, UNBOUND)
         else:
+            val = frame.fastlocals[var_num]
+        if val is UNBOUND:
+            name = frame.f_code.co_varnames[var_num]
             raise UnboundLocalError(
                 f"local variable '{name}' referenced before assignment"
             )
@@ -691,11 +715,24 @@ class ByteOp24(ByteOpBase):
 
     def STORE_FAST(self, var_num):
         """Stores TOS into the local co_varnames[var_num]."""
-        self.vm.frame.f_locals[var_num] = self.vm.pop()
+        frame = self.vm.frame
+        if frame.fastlocals is None:
+            frame.f_locals[frame.f_code.co_varnames[var_num]] = self.vm.pop()
+        else:
+            frame.fastlocals[var_num] = self.vm.pop()
 
     def DELETE_FAST(self, var_num):
         """Deletes local co_varnames[var_num]."""
-        del self.vm.frame.f_locals[var_num]
+        frame = self.vm.frame
+        if frame.fastlocals is None:
+            del frame.f_locals[frame.f_code.co_varnames[var_num]]
+        elif frame.fastlocals[var_num] is UNBOUND:
+            name = frame.f_code.co_varnames[var_num]
+            raise UnboundLocalError(
+                f"local variable '{name}' referenced before assignment"
+            )
+        else:
+            frame.fastlocals[var_num] = UNBOUND
 
     def LOAD_CLOSURE(self, i):
         """Pushes a reference to the cell contained in slot i of the
@@ -833,9 +870,9 @@ class ByteOp24(ByteOpBase):
         self.vm.last_exception = (exctype, val, tb)
 
         if tb:
-            return "reraise"
+            return WHY_RERAISE
         else:
-            return "exception"
+            return WHY_EXCEPTION
 
     def CALL_FUNCTION(self, argc: int):
         """
@@ -859,9 +896,9 @@ class ByteOp24(ByteOpBase):
         try:
             return self.call_function(argc, var_args=[], keyword_args={})
         except TypeError as exc:
-            tb = self.vm.last_traceback = traceback_from_frame(self.vm.frame)
+            tb = self.vm.traceback_here(self.vm.frame, exc)
             self.vm.last_exception = (TypeError, exc, tb)
-            return "exception"
+            return WHY_EXCEPTION
 
     def CALL_FUNCTION_VAR(self, argc: int):
         """
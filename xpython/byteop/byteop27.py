@@ -7,6 +7,7 @@ from xdis.version_info import PYTHON_VERSION_TRIPLE
 
 from xpython.byteop.byteop24 import ByteOp24, Version_info
 from xpython.byteop.byteop26 import ByteOp26
+from xpython.pyobj import BLOCK_FINALLY, BLOCK_WITH
 
 # Gone since 2.6
 del ByteOp24.JUMP_IF_FALSE
@@ -139,9 +140,9 @@ class ByteOp27(ByteOp26):
             self.convert_method_native_func(self.vm.frame, context_manager.__enter__)
         finally_block = context_manager.__enter__()
         if self.version_info[:2] < (3, 0):
-            self.vm.push_block("with", delta)
+            self.vm.push_block(BLOCK_WITH, delta)
         else:
-            self.vm.push_block("finally", delta)
+            self.vm.push_block(BLOCK_FINALLY, delta)
         self.vm.push(finally_block)
 
     def BUILD_SET(self, count):
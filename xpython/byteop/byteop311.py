@@ -10,6 +10,7 @@
 import inspect
 from typing import Any
 
+from xdis.opcodes.opcode_311 import _nb_ops
 from xdis.version_info import PYTHON_VERSION_TRIPLE
 
 from xpython.byteop.byteop24 import Version_info
@@ -19,7 +20,11 @@ from xpython.byteop.byteop36 import (
     MAKE_FUNCTION_SLOTS,
 )
 from xpython.byteop.byteop310 import ByteOp310
-from xpython.pyobj import Function, traceback_from_frame
+from xpython.pyobj import NULL, WHY_EXCEPTION, Function, Method
+
+
+# BINARY_OP operand to operator name, e.g. 0 -> "ADD", 13 -> "INPLACE_ADD"
+BINARY_OP_NAMES = tuple(nb_op[0][3:] for nb_op in _nb_ops)
 
 
 def fmt_make_function(vm, arg=None, repr_fn=repr) -> str:
@@ -38,17 +43,34 @@ class ByteOp311(ByteOp310):
         self.hexversion = 0x30A00F0
         self.version = "3.11.0 (default, Oct 27 1955, 00:00:00)\n[x-python]"
         self.version_info = Version_info(3, 11, 0, "final", 0)
-
-    def call_function38(self, argc: int) -> Any:
-        func = self.vm.peek(argc + 1)
-        named_args = self.vm.pop()
-        pos_args = self.vm.popn(argc - 1)
-
-        func = self.vm.pop()
+        # The names that KW_NAMES has given for the next CALL.
+        self.kw_names = ()
+
+    def call_function311(self, argc: int) -> Any:
+        kw_names = self.kw_names
+        self.kw_names = ()
+        func, pos_args = self.pop_method_call(argc)
+        named_args = {}
+        if kw_names:
+            named_args = dict(zip(kw_names, pos_args[-len(kw_names) :]))
+            del pos_args[-len(kw_names) :]
         return self.call_function_with_args_resolved(func, pos_args, named_args)
 
     # Changed in 3.11...
 
+    def LOAD_GLOBAL(self, name, push_null: int):
+        """
+        Loads the global named co_names[namei>>1] onto the stack.
+
+        Changed in version 3.11: If the low bit of namei is set, then a
+        NULL is pushed to the stack before the global variable.
+
+        Note: name and push_null are set in decode_instruction()
+        """
+        if push_null:
+            self.vm.push(NULL)
+        super(ByteOp311, self).LOAD_GLOBAL(name)
+
     # New in 3.11.  Note: below, when the parameter is "delta", the
     # value has been adjusted from a relative number into and absolute
     # one.
@@ -62,24 +84,21 @@ class ByteOp311(ByteOp310):
         """
         return
 
-    # This is handled by the caller.
-    # def BINARY_OP(self, op: int):
-    #     """
-    #       Implements the binary and in-place operators (depending on the value of op):
-
-    #       rhs = STACK.pop()
-    #       lhs = STACK.pop()
-    #       STACK.append(lhs op rhs)
-
-    #       New in version 3.11.
-    #       TOS is a tuple of mapping keys, and TOS1 is the match
-    #       subject. Replace TOS with a dict formed from the items of TOS1, but
-    #       without any of the keys in TOS.
-    #     """
-    #     rhs = self.vm.pop()
-    #     lhs = self.vm.pop()
-    #     self.vm.push(len(self.vm.pop()))
-    #     raise self.vm.PyVMError("MATCH_COPY_DICT_WITHOUT_KEYS not implemented")
+    def BINARY_OP(self, op: int):
+        """
+        Implements the binary and in-place operators (depending on the value of op):
+
+        rhs = STACK.pop()
+        lhs = STACK.pop()
+        STACK.append(lhs op rhs)
+
+        New in version 3.11.
+        """
+        name = BINARY_OP_NAMES[op]
+        if name.startswith("INPLACE_"):
+            self.inplaceOperator(name[8:])
+        else:
+            self.binaryOperator(name)
 
     def CALL(self, argc: int):
         """Calls a callable object with the number of arguments
@@ -110,11 +129,11 @@ class ByteOp311(ByteOp310):
 
         """
         try:
-            return self.call_function38(argc)
+            return self.call_function311(argc)
         except TypeError as exc:
-            tb = self.vm.last_traceback = traceback_from_frame(self.vm.frame)
+            tb = self.vm.traceback_here(self.vm.frame, exc)
             self.vm.last_exception = (TypeError, exc, tb)
-            return "exception"
+            return WHY_EXCEPTION
 
     def KW_NAMES(self, consti: int):
         """
@@ -123,8 +142,7 @@ class ByteOp311(ByteOp310):
 
         Replaces CALL_FUNCTION_KW
         """
-        # FIXME
-        raise self.vm.PyVMError("KW_NAMES not implemented")
+        self.kw_names = consti
 
     # Changed in 3.11...
     def MAKE_FUNCTION(self, argc: int):
@@ -223,15 +241,23 @@ class ByteOp311(ByteOp310):
          We'll be passing `oparg + 1` to call_function, to
          make it accept the `self` as a first argument.
 
+        rocky: As in C Python, a bound method of ours with NULL below
+        it is split into its function and self, so that CALL can call
+        the function without going through the Method.
         """
-        raise self.vm.PyVMError("PRECALL not implemented")
+        vm = self.vm
+        if vm.peek(argc + 2) is NULL:
+            func = vm.peek(argc + 1)
+            if type(func) is Method and func.im_self is not None:
+                vm.set(argc + 2, func.im_func)
+                vm.set(argc + 1, func.im_self)
 
     def PUSH_NULL(self):
         """Pushes a NULL to the stack. Used in the call sequence to
         match the NULL pushed by LOAD_METHOD for non-method calls.
 
         """
-        self.vm.push(None)
+        self.vm.push(NULL)
 
     def COPY(self, i: int):
         """
@@ -248,7 +274,7 @@ class ByteOp311(ByteOp310):
         tos = self.vm.top()
         stack_i = self.vm.peek(i)
         self.vm.set(i, tos)
-        self.vm.set(0, stack_i)
+        self.vm.set(1, stack_i)
 
     def CHECK_EXC_MATCH(self):
         """
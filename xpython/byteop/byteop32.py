@@ -6,7 +6,7 @@ import inspect
 from xdis.opcodes.opcode_3x import parse_fn_counts_30_35
 from xpython.byteop.byteop24 import ByteOp24, Version_info
 from xpython.byteop.byteop27 import ByteOp27
-from xpython.pyobj import Function
+from xpython.pyobj import BLOCK_EXCEPT_HANDLER, Function
 
 # FIXME: investigate does "del" remove an attribute here?
 # have an effect on what another module sees as ByteOp27's attributes?
@@ -59,7 +59,7 @@ class ByteOp32(ByteOp27):
         stack, the last three popped values are used to restore the exception
         state."""
         block = self.vm.pop_block()
-        if block.type != "except-handler":
+        if block.type != BLOCK_EXCEPT_HANDLER:
             raise self.vm.PyVMError(
                 f"popped block is not an except handler; is {block}"
             )
@@ -225,7 +225,7 @@ class ByteOp32(ByteOp27):
             self.vm.push(None)
             self.vm.push(w, v, u)
             block = self.vm.pop_block()
-            assert block.type == "except-handler"
+            assert block.type == BLOCK_EXCEPT_HANDLER
             self.vm.push_block(block.type, block.handler, block.level - 1)
         else:  # pragma: no cover
             raise self.vm.PyVMError("Confused WITH_CLEANUP")
@@ -5,7 +5,7 @@
 from xdis.opcodes.opcode_3x import parse_fn_counts_30_35
 from xpython.byteop.byteop24 import Version_info
 from xpython.byteop.byteop32 import ByteOp32
-from xpython.pyobj import Function, Generator
+from xpython.pyobj import WHY_YIELD, Function, Generator
 
 
 class ByteOp33(ByteOp32):
@@ -153,7 +153,7 @@ class ByteOp33(ByteOp32):
                 self.vm.jump(self.vm.frame.f_lasti - 2)
             else:
                 self.vm.jump(self.vm.frame.f_lasti - 1)
-            return "yield"
+            return WHY_YIELD
 
     # Python 3.3 docs describe a 3.4 MAKE_FUNCTION but seem to follow pre-3.3
     # conventions (which go back to Python 2.x days).
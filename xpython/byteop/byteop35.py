@@ -3,6 +3,7 @@
 from xpython.byteop.byteop24 import ByteOp24, Version_info
 from xpython.byteop.byteop32 import ByteOp32
 from xpython.byteop.byteop34 import ByteOp34
+from xpython.pyobj import BLOCK_EXCEPT_HANDLER, WHY_SILENCED
 from xpython.stdlib.inspect3 import iscoroutinefunction, isgeneratorfunction
 
 # Gone in 3.5
@@ -172,7 +173,7 @@ class ByteOp35(ByteOp34):
             self.vm.push(None)
             self.vm.push(fourth, third, second)
             block = self.vm.pop_block()
-            assert block.type == "except-handler"
+            assert block.type == BLOCK_EXCEPT_HANDLER
             self.vm.push_block(block.type, block.handler, block.level - 1)
         exit_ret = exit_method(second, third, fourth)
         self.vm.push(second)
@@ -197,7 +198,7 @@ class ByteOp35(ByteOp34):
             # Pop the exception and replace with "silenced".
             self.vm.popn(1)
             self.vm.push("silenced")
-            return "silenced"
+            return WHY_SILENCED
 
     # All of the following opcodes expect arguments. An argument is
     # two bytes, with the more significant byte last.
@@ -294,6 +295,6 @@ class ByteOp35(ByteOp34):
         pos_args = self.vm.popn(len_pos)
         pos_args.extend(var_args)
         func = self.vm.pop()
-        self.call_function_with_args_resolved(
+        return self.call_function_with_args_resolved(
             func, pos_args=pos_args, named_args=keyword_args
         )
@@ -86,7 +86,7 @@ class ByteOp36(ByteOp35):
         lenPos = argc - len(namedargs_tup)
         posargs = self.vm.popn(lenPos)
         func = self.vm.pop()
-        self.call_function_with_args_resolved(func, posargs, namedargs)
+        return self.call_function_with_args_resolved(func, posargs, namedargs)
 
     ##############################################################################
     # Order of function here is the same as in:
@@ -286,7 +286,7 @@ class ByteOp36(ByteOp35):
         namedargs = self.vm.pop() if flags & 1 else {}
         posargs = self.vm.pop()
         func = self.vm.pop()
-        self.call_function_with_args_resolved(func, posargs, namedargs)
+        return self.call_function_with_args_resolved(func, posargs, namedargs)
 
     def SETUP_ANNOTATIONS(self):
         """
@@ -2,6 +2,7 @@
 """
 from xpython.byteop.byteop24 import ByteOp24, Version_info
 from xpython.byteop.byteop36 import ByteOp36
+from xpython.pyobj import NULL, lookup_method
 
 # Gone in 3.7
 del ByteOp36.STORE_ANNOTATION
@@ -57,20 +58,19 @@ class ByteOp37(ByteOp36):
         by CALL_METHOD when calling the unbound method. Otherwise,
         NULL and the object return by the attribute lookup are pushed.
 
-        rocky: In our implementation in Python we don't have NULL: all
-        stack entries have *some* value. So instead we'll push another
-        item: the status. Also, instead of pushing the unbound method
-        and self, we will pass the bound method, since that is what we
-        have here. So TOS (self) is not pushed back onto the stack.
+        rocky: Our NULL is pyobj.NULL, which is never a Python value
+        that a program can see. For a method of a class interpreted
+        here, the unbound method is our Function, so calling it needs
+        neither a bound Method nor a new argument list.
         """
         TOS = self.vm.pop()
-        if hasattr(TOS, name):
-            # FIXME: check that gettr(TO, name) is a method
+        method = lookup_method(TOS, name)
+        if method is NULL:
+            self.vm.push(NULL)
             self.vm.push(getattr(TOS, name))
-            self.vm.push("LOAD_METHOD lookup success")
         else:
-            self.vm.push("fill in attribute method lookup")
-            self.vm.push(None)
+            self.vm.push(method)
+            self.vm.push(TOS)
 
     def CALL_METHOD(self, count):
         """Calls a method. argc is the number of positional
@@ -80,18 +80,21 @@ class ByteOp37(ByteOp36):
         LOAD_METHOD are on the stack (either self and an unbound
         method object or NULL and an arbitrary callable). All of them
         are popped and the return value is pushed.
-
-        rocky: In our setting, before "self" we have an additional
-        item which is the status of the LOAD_METHOD. In contrast to what can
-        be done in the C implementation, there is no way
-        in Python to represent a value outside what Python offers.
-        In effect, this is what NULL in C is.
         """
-        posargs = self.vm.popn(count)
-        is_success = self.vm.pop()
-        if is_success:
-            func = self.vm.pop()
-            self.call_function_with_args_resolved(func, posargs, {})
+        func, posargs = self.pop_method_call(count)
+        return self.call_function_with_args_resolved(func, posargs, {})
+
+    def pop_method_call(self, argc: int):
+        """Pop the `argc` arguments of a call and the two entries that
+        LOAD_METHOD pushed below them. Return the function to call and
+        its positional arguments, which start with self when LOAD_METHOD
+        found a method."""
+        vm = self.vm
+        if vm.peek(argc + 2) is NULL:
+            pos_args = vm.popn(argc)
+            func = vm.pop()
+            vm.pop()
         else:
-            # FIXME: do something else
-            raise self.vm.PyVMError("CALL_METHOD not implemented yet")
+            pos_args = vm.popn(argc + 1)
+            func = vm.pop()
+        return func, pos_args
@@ -7,6 +7,18 @@
 """
 from xpython.byteop.byteop37 import ByteOp37
 from xpython.byteop.byteoppypy import ByteOpPyPy
+from xpython.pyobj import NULL
+
+
+def method_name(vm, n: int) -> str:
+    """
+    returns the name of the method or callable that LOAD_METHOD pushed,
+    where the upper of the two entries it pushed is `n` from the top
+    """
+    fn = vm.peek(n + 1)
+    if fn is NULL:
+        fn = vm.peek(n)
+    return getattr(fn, "__name__", repr(fn))
 
 
 def fmt_call_method(vm, argc: int, repr_fn=repr) -> str:
@@ -15,7 +27,7 @@ def fmt_call_method(vm, argc: int, repr_fn=repr) -> str:
     """
     pos_args = [vm.peek(i + 1) for i in range(argc)]
 
-    fn_name = vm.peek(argc + 2).__name__
+    fn_name = method_name(vm, argc + 1)
     return f""" {fn_name}({", ".join((repr_fn(a) for a in pos_args))})"""
 
 
@@ -34,7 +46,7 @@ def fmt_call_method_kw(vm, argc: int, repr=repr) -> str:
     for i in range(argc - kwargs_count):
         pos_args.append(vm.peek(i + j))
 
-    fn_name = vm.peek(argc + 3).__name__
+    fn_name = method_name(vm, argc + 2)
     return f""" {fn_name}({", ".join((repr(a) for a in pos_args + kwargs_list))})"""
 
 
@@ -52,32 +64,13 @@ class ByteOp37PyPy(ByteOp37, ByteOpPyPy):
         """
         argc has a count of the number of keyword parameters.
         TOS has a tuple of keyword parameter names. Below that are the
-        keyword values. After that is the cached method which in our
-        case is garbage. After that is the method to call.
+        keyword values. After that are the positional values, and below
+        them the two entries that LOAD_METHOD pushed.
         """
-
-        # We are going to access parameter off of the stack which is
-        # has the last parameter closest to the top.
-        # Reverse keyword names in the tuple match our access pattern.
         kw_names = self.vm.pop()
         assert isinstance(kw_names, tuple)
-        kw_names = list(reversed(kw_names))
         kwarg_count = len(kw_names)
-
         assert argc >= kwarg_count
-        pos_argc = argc - kwarg_count
-        keyword_args = {}
-
-        for i in range(kwarg_count):
-            param_value = self.vm.pop()
-            keyword_args[kw_names[i]] = param_value
-
-        pos_args = []
-        for i in range(pos_argc):
-            pos_args.append(self.vm.pop())
-
-        pos_args = list(reversed(pos_args))
-
-        self.vm.pop()  # cached method slot is not used here.
-        func = self.vm.pop()
+        keyword_args = dict(zip(kw_names, self.vm.popn(kwarg_count)))
+        func, pos_args = self.pop_method_call(argc - kwarg_count)
         return self.call_function_with_args_resolved(func, pos_args, keyword_args)
@@ -8,6 +8,7 @@
 """
 from xpython.byteop.byteop24 import ByteOp24, Version_info
 from xpython.byteop.byteop37 import ByteOp37
+from xpython.pyobj import WHY_RERAISE, WHY_RETURN
 
 # Gone in 3.8
 del ByteOp24.BREAK_LOOP
@@ -78,7 +79,7 @@ class ByteOp38(ByteOp37):
             why = None
         elif isinstance(v, int):
             self.vm.jump(v)
-            why = "return"
+            why = WHY_RETURN
         elif issubclass(v, BaseException):
             # from trepan.api import debug; debug()
             exctype = v
@@ -88,7 +89,7 @@ class ByteOp38(ByteOp37):
 
             raise self.vm.PyVMError("END_FINALLY not finished yet")
             # FIXME: pop 3 more values
-            why = "reraise"
+            why = WHY_RERAISE
         else:  # pragma: no cover
             raise self.vm.PyVMError("Confused END_FINALLY")
         return why
@@ -130,7 +131,7 @@ class ByteOp38(ByteOp37):
             self.vm.last_exception = (exctype, val, tb)
 
             # FIXME: pop 3 more values
-            why = "reraise"
+            why = WHY_RERAISE
             raise self.vm.PyVMError("POP_FINALLY not finished yet")
         else:  # pragma: no cover
             raise self.vm.PyVMError("Confused POP_FINALLY")
@@ -3,6 +3,7 @@
 from xpython.byteop.byteop37pypy import ByteOp37PyPy
 from xpython.byteop.byteop38 import ByteOp38
 from xpython.byteop.byteoppypy import ByteOpPyPy
+from xpython.pyobj import BLOCK_SETUP_EXCEPT
 
 
 class ByteOp38PyPy(ByteOp38, ByteOpPyPy):
@@ -20,6 +21,6 @@ class ByteOp38PyPy(ByteOp38, ByteOpPyPy):
         Note: jump = delta + f.f_lasti set in parse_byte_and_args()
         """
 
-        self.vm.push_block("setup-except", jump_offset)
+        self.vm.push_block(BLOCK_SETUP_EXCEPT, jump_offset)
 
     CALL_METHOD_KW = ByteOp37PyPy.CALL_METHOD_KW
@@ -2,7 +2,6 @@
 
 Specific PyPy versions i.e. PyPy 2.7, 3.2, 3.5-3.7 inherit this.
 """
-import inspect
 
 
 class ByteOpPyPy(object):
@@ -19,7 +18,6 @@ class ByteOpPyPy(object):
         """
         self.vm.jump(jump_offset)
 
-    # For Python 3.7+ this is not correct
     def LOOKUP_METHOD(self, name):
         """From
         https://doc.pypy.org/en/latest/interpreter-optimizations.html#lookup-method-call-method
@@ -35,19 +33,18 @@ class ByteOpPyPy(object):
         LOAD_ATTR would have returned, and the other (im_self) is an
         interpreter-level None placeholder.
 
-        For now, we'll assume this is the same as LOAD_ATTR:
+        Starting in 3.7, CALL_METHOD is C Python's, so we push what
+        LOAD_METHOD does. Before that, we'll assume this is the same as
+        LOAD_ATTR:
 
         Replaces TOS with getattr(TOS, co_names[namei]).
         Note: name = co_names[namei] set in parse_byte_and_args()
         """
+        if self.version_info[:2] >= (3, 7):
+            return self.LOAD_METHOD(name)
         obj = self.vm.pop()
         val = getattr(obj, name)
         self.vm.push(val)
-        if self.version_info[:2] >= (3, 7):
-            if inspect.isfunction(val) or inspect.isbuiltin(val):
-                self.vm.push("LOAD_METHOD lookup success")
-            else:
-                self.vm.push("fill in attribute method lookup")
 
     def CALL_METHOD(self, argc: int):
         """
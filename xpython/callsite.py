@@ -0,0 +1,120 @@
+"""Call-site caches: remembering how to call what an instruction calls."""
+
+import inspect
+from typing import Dict
+
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from xpython.pyobj import Function
+
+# The most kinds of callable a call site keeps a strategy for.
+CALL_SITE_SIZE = 4
+
+# Call strategies.
+CALL_NATIVE = 1  # call it
+CALL_BOUND_METHOD = 2  # a Method of ours: unbind it, then look again
+CALL_INTERPRETED = 3  # a Function: run its frame in our eval loop
+CALL_NATIVE_FUNCTION = 4  # a Python function for our bytecode version
+CALL_SPECIAL_BUILTIN = 5  # see ByteOpBase.call_special_builtin()
+CALL_TYPE = 6  # type(), which can make a class
+CALL_SUPER = 7  # super(), which needs the frame
+
+# The built-in functions that ByteOpBase.call_special_builtin() runs
+# for the interpreted frame, by id().
+SPECIAL_BUILTINS = frozenset(
+    id(fn) for fn in (globals, locals, compile, exec, eval, __build_class__)
+)
+
+# Callables that are cached by their identity rather than their type.
+IDENTITY_KEYED = SPECIAL_BUILTINS | {id(type), id(super)}
+
+# Instructions whose handlers go through call_function_with_args_resolved().
+CALL_OPS = frozenset(
+    """
+    CALL CALL_FUNCTION CALL_FUNCTION_EX CALL_FUNCTION_KW CALL_FUNCTION_VAR
+    CALL_FUNCTION_VAR_KW CALL_METHOD CALL_METHOD_KW
+    """.split()
+)
+
+
+def classify(func, same_version: bool) -> int:
+    """Return the call strategy for `func`. `same_version` is True if
+    the bytecode we run is for the Python running us."""
+    if hasattr(func, "im_func"):
+        return CALL_BOUND_METHOD
+    if isinstance(func, Function):
+        return CALL_INTERPRETED
+    if id(func) in SPECIAL_BUILTINS:
+        return CALL_SPECIAL_BUILTIN
+    if func is type:
+        return CALL_TYPE
+    if func is super:
+        return CALL_SUPER
+    if same_version and inspect.isfunction(func):
+        return CALL_NATIVE_FUNCTION
+    return CALL_NATIVE
+
+
+class CallSite(object):
+    """The call strategies seen by one call instruction, keyed by the
+    type of the callable, or for those in IDENTITY_KEYED, its id(). Once
+    a site has CALL_SITE_SIZE of them, other kinds of callable are
+    classified each time they are called."""
+
+    __slots__ = ("strategies", "same_version")
+
+    def __init__(self, same_version: bool):
+        self.strategies: Dict[object, int] = {}
+        self.same_version = same_version
+
+    def __repr__(self):
+        return f"<CallSite {self.strategies}>"
+
+    def strategy(self, func) -> int:
+        """Return the call strategy for `func`."""
+        key = id(func)
+        if key not in IDENTITY_KEYED:
+            key = type(func)
+        strategy = self.strategies.get(key)
+        if strategy is None:
+            strategy = classify(func, self.same_version)
+            if len(self.strategies) < CALL_SITE_SIZE:
+                self.strategies[key] = strategy
+        return strategy
+
+
+class CallSites(object):
+    """Gives each call instruction in newly decoded code for a PyVM a
+    CallSite."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.same_version = vm.version[:2] == PYTHON_VERSION_TRIPLE[:2]
+
+    def __call__(self, decoded):
+        # EXTENDED_ARG offsets share the instruction they prefix, so
+        # group the offsets by instruction.
+        offsets = {}
+        for offset, inst in enumerate(decoded.instructions):
+            if inst is not None and inst.opname in CALL_OPS:
+                offsets.setdefault(id(inst), (inst, []))[1].append(offset)
+        for inst, inst_offsets in offsets.values():
+            if inst.handler is None:
+                continue
+            site = CallSite(self.same_version)
+            decoded.call_sites[inst.offset] = site
+            new_inst = inst._replace(handler=self.make_handler(inst.handler, site))
+            for offset in inst_offsets:
+                decoded.instructions[offset] = new_inst
+                decoded.unfused[offset] = new_inst
+
+    def make_handler(self, generic, site: CallSite):
+        """Return a handler that runs `generic` with `site` as the call
+        site."""
+        byteop = self.vm.byteop
+
+        def handler(*args):
+            byteop.call_site = site
+            return generic(*args)
+
+        return handler
@@ -0,0 +1,361 @@
+"""Decode-once instruction lists for code objects, kept in a bounded
+least-recently-used cache."""
+
+import collections
+import logging
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from xdis import code2num, next_offset, op_has_argument
+from xdis.cross_types import UnicodeForPython3
+
+log = logging.getLogger(__name__)
+
+# The default upper bound on the number of instructions kept across
+# all code objects in a DecodeCache. An Instruction record is a few
+# hundred bytes, so this is on the order of tens of megabytes.
+DEFAULT_MAX_INSTRUCTIONS = 200000
+
+Instruction = collections.namedtuple(
+    "Instruction",
+    "opcode opname handler int_arg arguments offset next_offset line_number",
+)
+try:
+    Instruction.opcode.__doc__ = "integer opcode value"
+    Instruction.opname.__doc__ = "opcode name, e.g. LOAD_FAST"
+    Instruction.handler.__doc__ = (
+        "function that implements the instruction or None if it must be looked up"
+    )
+    Instruction.int_arg.__doc__ = "integer operand with EXTENDED_ARG folded in, or None"
+    Instruction.arguments.__doc__ = "tuple with the resolved operand, if any"
+    Instruction.offset.__doc__ = "bytecode offset of the (non-EXTENDED_ARG) opcode"
+    Instruction.next_offset.__doc__ = "bytecode offset of the following instruction"
+    Instruction.line_number.__doc__ = "line number if this starts a line, else None"
+except Exception:
+    pass
+
+
+class LineTable(object):
+    """Bytecode offset to line number information for a code object.
+
+    This is computed once per code object and shared by its frames,
+    so it must not be changed.
+    """
+
+    __slots__ = ("linestarts", "offsets", "lines")
+
+    def __init__(self, linestarts: Iterable[Tuple[int, int]]):
+        linestarts = dict(linestarts)
+        # A read-only mapping from the offset of each instruction that
+        # starts a line to that line number.
+        self.linestarts = MappingProxyType(linestarts)
+        self.offsets = tuple(sorted(linestarts))
+        self.lines = tuple(linestarts[offset] for offset in self.offsets)
+
+    def line_number(self, offset: int) -> int:
+        """Return the line number of the instruction at `offset`, or 0 if
+        it comes before the first line start."""
+        i = bisect_right(self.offsets, offset)
+        return self.lines[i - 1] if i else 0
+
+
+def decode_instruction(
+    opc, version: tuple, code, offset: int, linestarts, byte_code=None
+) -> Instruction:
+    """Decode the instruction that starts at `offset` in `code`.
+
+    Any EXTENDED_ARG prefixes are folded into the operand of the
+    instruction they prefix, and the `offset` of the returned
+    instruction is that of the prefixed instruction.
+
+    If `byte_code` is given, it is used as the opcode at `offset`
+    instead of what is in `code.co_code`. This is used when replaying
+    an instruction which has been overwritten by a breakpoint.
+
+    The `handler` field of the returned instruction is None.
+    """
+    co_code = code.co_code
+    extended_arg = 0
+    line_number = None
+    int_arg = None
+    arguments = ()
+
+    while True:
+        start_line = linestarts.get(offset, None)
+        if start_line is not None:
+            line_number = start_line
+        if byte_code is None:
+            byte_code = code2num(co_code, offset)
+        arg_offset = offset + 1
+
+        if op_has_argument(byte_code, opc):
+            if version[:2] >= (3, 6):
+                int_arg = code2num(co_code, arg_offset) | extended_arg
+                # Note: Python 3.6.0a1 is 2, for 3.6.a3 and beyond we have 1
+                arg_offset += 1
+                if byte_code == opc.EXTENDED_ARG:
+                    extended_arg = int_arg << 8
+                    offset = next_offset(byte_code, opc, offset)
+                    byte_code = None
+                    continue
+            else:
+                int_arg = (
+                    code2num(co_code, arg_offset)
+                    + code2num(co_code, arg_offset + 1) * 256
+                    + extended_arg
+                )
+                arg_offset += 2
+                if byte_code == opc.EXTENDED_ARG:
+                    extended_arg = int_arg * 65536
+                    offset = next_offset(byte_code, opc, offset)
+                    byte_code = None
+                    continue
+
+            if byte_code in opc.CONST_OPS:
+                arg = code.co_consts[int_arg]
+                if isinstance(arg, UnicodeForPython3):
+                    arg = str(arg)
+            elif byte_code in opc.FREE_OPS:
+                if int_arg < len(code.co_cellvars):
+                    arg = code.co_cellvars[int_arg]
+                else:
+                    var_idx = int_arg - len(code.co_cellvars)
+                    arg = code.co_freevars[var_idx]
+            elif byte_code in opc.NAME_OPS:
+                if byte_code == opc.LOAD_GLOBAL and version[:2] >= (3, 11):
+                    # The low bit says whether to push NULL first.
+                    arg = str(code.co_names[int_arg >> 1])
+                    arguments = (arg, int_arg & 1)
+                    break
+                arg = code.co_names[int_arg]
+                if isinstance(arg, UnicodeForPython3):
+                    arg = str(arg)
+            elif byte_code in opc.JREL_OPS:
+                # Many relative jumps are conditional,
+                # so setting f.fallthrough is wrong.
+                if version[:2] >= (3, 10):
+                    int_arg += int_arg
+                arg = arg_offset + int_arg
+            elif byte_code in opc.JABS_OPS:
+                # We probably could set fallthough, since many (all?)
+                # of these are unconditional, but we'll make the jump do
+                # the work of setting.
+                if version[:2] >= (3, 10):
+                    int_arg += int_arg
+                arg = int_arg
+            else:
+                # This includes LOCAL_OPS: fast locals are accessed by
+                # their index in co_varnames.
+                arg = int_arg
+            arguments = (arg,)
+        break
+
+    return Instruction(
+        byte_code,
+        opc.opname[byte_code],
+        None,
+        int_arg,
+        arguments,
+        offset,
+        next_offset(byte_code, opc, offset),
+        line_number,
+    )
+
+
+def decode_code(
+    opc,
+    version: tuple,
+    code,
+    linestarts,
+    get_handler: Optional[Callable] = None,
+) -> List[Optional[Instruction]]:
+    """Decode all of the instructions in `code`.
+
+    The list returned is indexed by bytecode offset. Offsets that
+    are not the start of an instruction hold None, except for offsets
+    of EXTENDED_ARG prefixes; these hold the instruction the prefix
+    belongs to.
+
+    `get_handler`, if given, is called with each (opcode, opname) and
+    the result is stored as the instruction's `handler`.
+    """
+    co_code = code.co_code
+    n = len(co_code)
+    instructions: List[Optional[Instruction]] = [None] * n
+    offset = 0
+    while offset < n:
+        try:
+            inst = decode_instruction(opc, version, code, offset, linestarts)
+        except IndexError:
+            # Truncated instruction at the end of the bytecode. Leave
+            # it undecoded; it is an error only if we try to run it.
+            break
+        if get_handler is not None:
+            inst = inst._replace(handler=get_handler(inst.opcode, inst.opname))
+        # EXTENDED_ARG prefixes, if any, map to the instruction they prefix.
+        while offset < inst.offset:
+            instructions[offset] = inst
+            offset = next_offset(opc.EXTENDED_ARG, opc, offset)
+        instructions[offset] = inst
+        offset = inst.next_offset
+    return instructions
+
+
+class DecodedCode(object):
+    """Everything we precompute for a code object."""
+
+    __slots__ = (
+        "code",
+        "co_code",
+        "instructions",
+        "count",
+        "line_table",
+        "unfused",
+        "peephole",
+        "cfg",
+        "specializations",
+        "call_sites",
+        "intrinsics",
+        "free_frames",
+        "superinstructions",
+        "threaded",
+        "registers",
+        "jit",
+    )
+
+    def __init__(self, code, instructions, line_table: LineTable):
+        # We keep a reference to the code object so its id() can't be
+        # reused while it is in the cache, and a reference to its bytecode
+        # so we notice if it has been changed, e.g. by setting a breakpoint.
+        self.code = code
+        self.co_code = code.co_code
+        self.instructions = instructions
+        self.count = len(set(map(id, filter(None, instructions))))
+        self.line_table = line_table
+        # `instructions` without superinstructions. This is the same list
+        # unless some instructions have been fused.
+        self.unfused = instructions
+        # Offsets of the instructions that the peephole optimizer has
+        # changed or dropped, mapped to a description of the change;
+        # see xpython.peephole.
+        self.peephole = {}
+        # The ControlFlowGraph of the code, once it has been built; see
+        # xpython.flowgraph.
+        self.cfg = None
+        # Offsets of instructions that quickening has specialized,
+        # mapped to the name of the specialized form.
+        self.specializations = {}
+        # Offsets of call instructions mapped to their CallSite; see
+        # xpython.callsite.
+        self.call_sites = {}
+        # Offsets of call instructions that have been made intrinsics,
+        # mapped to the intrinsic's name; see xpython.intrinsics.
+        self.intrinsics = {}
+        # Frames for the code that have returned and can be reused; see
+        # PyVM.free_frame().
+        self.free_frames = []
+        # Offsets of superinstructions mapped to the names of the
+        # instructions they run.
+        self.superinstructions = {}
+        # The closure-threaded form of the instructions, if the threaded
+        # engine is used; see xpython.threaded.
+        self.threaded = None
+        # The RegisterCode for the code, if the register engine is used;
+        # see xpython.register.
+        self.registers = None
+        # What the JIT keeps for the code, if it may be translated; see
+        # xpython.jit.
+        self.jit = None
+
+
+class DecodeCache(object):
+    """A bounded, least-recently-used cache of `DecodedCode`s keyed by
+    code object.
+
+    The bound is on the total number of instructions decoded, not on
+    the number of code objects, since that is what memory use is
+    proportional to.
+
+    `passes` are called in turn with each newly decoded DecodedCode,
+    and may change its instructions. PyVM sets up which passes are run,
+    and in what order.
+    """
+
+    def __init__(
+        self,
+        opc,
+        version: tuple,
+        get_handler: Optional[Callable] = None,
+        max_instructions: int = DEFAULT_MAX_INSTRUCTIONS,
+        passes: Iterable[Callable] = (),
+    ):
+        self.opc = opc
+        self.version = version
+        self.get_handler = get_handler
+        self.passes = passes
+        self.max_instructions = max_instructions
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, code) -> bool:
+        entry = self._entries.get(id(code))
+        return entry is not None and entry.code is code
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def peek(self, code) -> Optional[DecodedCode]:
+        """Return the DecodedCode for `code` if it is in the cache, or
+        None. Unlike get(), this doesn't decode anything or count as a
+        use of the entry."""
+        entry = self._entries.get(id(code))
+        if entry is not None and entry.code is code and entry.co_code is code.co_code:
+            return entry
+        return None
+
+    def get(self, code) -> DecodedCode:
+        """Return the DecodedCode for `code`, decoding it if it isn't
+        in the cache or if its bytecode has changed since it was
+        decoded."""
+        key = id(code)
+        entries = self._entries
+        entry = entries.get(key)
+        if (
+            entry is not None
+            and entry.code is code
+            and (entry.co_code is code.co_code or entry.co_code == code.co_code)
+        ):
+            self.hits += 1
+            entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        if entry is not None:
+            self._evict(key)
+
+        line_table = LineTable(self.opc.findlinestarts(code, dup_lines=True))
+        instructions = decode_code(
+            self.opc, self.version, code, line_table.linestarts, self.get_handler
+        )
+        entry = DecodedCode(code, instructions, line_table)
+        for decode_pass in self.passes:
+            decode_pass(entry)
+        entries[key] = entry
+        self.size += entry.count
+
+        while self.size > self.max_instructions and len(entries) > 1:
+            oldest_key = next(iter(entries))
+            log.debug("evicting decoded code %r", entries[oldest_key].code)
+            self._evict(oldest_key)
+        return entry
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.count
@@ -72,7 +72,13 @@ def exec_code_object(
     is_pypy=IS_PYPY,
     callback=None,
     format_instruction=format_instruction,
+    engine="classic",
+    aot=False,
+    peephole=False,
+    verify=True,
 ):
+    """Run `code` with globals `env` in a new PyVM, or in a PyVMTraced
+    if there is a `callback`, and return the VM."""
     if callback:
         vm = PyVMTraced(
             callback,
@@ -92,11 +98,20 @@ def exec_code_object(
     else:
         if python_version != PYTHON_VERSION_TRIPLE[:2]:
             make_compatible_builtins(BUILTINS.__dict__, python_version)
-        vm = PyVM(python_version, is_pypy, format_instruction_func=format_instruction)
+        vm = PyVM(
+            python_version,
+            is_pypy,
+            format_instruction_func=format_instruction,
+            engine=engine,
+            aot=aot,
+            peephole=peephole,
+            verify=verify,
+        )
         try:
             vm.run_code(code, f_globals=env)
         except PyVMUncaughtException:
             pass
+    return vm
 
 
 def get_supported_versions(is_pypy, is_bytecode):
@@ -125,7 +140,9 @@ def rsplit1(s, sep):
     return sep.join(parts[:-1]), parts[-1]
 
 
-def run_python_module(modulename, args):
+def run_python_module(
+    modulename, args, engine="classic", aot=False, peephole=False, verify=True
+):
     """Run a python module, as though with ``python -m name args...``.
 
     `modulename` is the name of the module, possibly a dot-separated name.
@@ -169,11 +186,27 @@ def run_python_module(modulename, args):
 
     # Finally, hand the file off to run_python_file for execution.
     args[0] = pathname
-    run_python_file(pathname, args, package=packagename)
+    return run_python_file(
+        pathname,
+        args,
+        package=packagename,
+        engine=engine,
+        aot=aot,
+        peephole=peephole,
+        verify=verify,
+    )
 
 
 def run_python_file(
-    filename, args, package=None, callback=None, format_instruction=format_instruction
+    filename,
+    args,
+    package=None,
+    callback=None,
+    format_instruction=format_instruction,
+    engine="classic",
+    aot=False,
+    peephole=False,
+    verify=True,
 ):
     """Run a python file as if it were the main program on the command line.
 
@@ -185,6 +218,15 @@ def run_python_file(
     If `callback` is not None, it is a function which is called back as the
     execution progresses. This can be used for example in a debugger, or
     for custom tracing or statistics gathering.
+
+    `engine` is the PyVM engine to run the code with when there is no
+    `callback`; see xpython.threaded. `aot` says whether that PyVM
+    translates functions ahead of time; see xpython.aot, `peephole`
+    whether it optimizes code as it is loaded; see xpython.peephole, and
+    `verify` whether it checks the code before running it; see
+    xpython.verify.
+
+    The VM that ran the code is returned.
     """
     # Create a module to serve as __main__
     old_main_mod = sys.modules["__main__"]
@@ -271,13 +313,17 @@ def run_python_file(
             raise NoSourceError(f"No file to run: {filename!r}")
 
         # Execute the source file.
-        exec_code_object(
+        return exec_code_object(
             code,
             main_mod.__dict__,
             python_version,
             is_pypy,
             callback,
             format_instruction=format_instruction,
+            engine=engine,
+            aot=aot,
+            peephole=peephole,
+            verify=verify,
         )
 
     finally:
@@ -290,7 +336,15 @@ def run_python_file(
 
 
 def run_python_string(
-    source, args, package=None, callback=None, format_instruction=format_instruction
+    source,
+    args,
+    package=None,
+    callback=None,
+    format_instruction=format_instruction,
+    engine="classic",
+    aot=False,
+    peephole=False,
+    verify=True,
 ):
     """Run a python string as if it were the main program on the command line."""
     # Create a module to serve as __main__
@@ -322,13 +376,17 @@ def run_python_string(
         python_version = PYTHON_VERSION_TRIPLE
 
         # Execute the source string.
-        exec_code_object(
+        return exec_code_object(
             code,
             main_mod.__dict__,
             python_version,
             IS_PYPY,
             callback,
             format_instruction=format_instruction,
+            engine=engine,
+            aot=aot,
+            peephole=peephole,
+            verify=verify,
         )
 
     finally:
@@ -0,0 +1,370 @@
+"""Control-flow graphs for code objects, and the definite assignment and
+stack depths worked out over them."""
+
+import collections
+import dis
+from typing import Dict, FrozenSet, List, Optional
+
+from xdis import (
+    CO_ASYNC_GENERATOR,
+    CO_COROUTINE,
+    CO_GENERATOR,
+    CO_ITERABLE_COROUTINE,
+    CO_VARARGS,
+    CO_VARKEYWORDS,
+    IS_PYPY,
+    PYTHON_VERSION_TRIPLE,
+)
+
+# Code with these flags runs in frames that can be resumed with more on
+# the stack than co_stacksize allows for.
+RESUMABLE_FLAGS = (
+    CO_GENERATOR | CO_COROUTINE | CO_ITERABLE_COROUTINE | CO_ASYNC_GENERATOR
+)
+
+# Instructions that never go on to the next instruction.
+NO_FALLTHROUGH_OPS = frozenset(
+    """
+    BREAK_LOOP CONTINUE_LOOP JUMP_ABSOLUTE JUMP_BACKWARD
+    JUMP_BACKWARD_NO_INTERRUPT JUMP_FORWARD RAISE_VARARGS RERAISE
+    RETURN_CONST RETURN_VALUE
+    """.split()
+)
+
+Edge = collections.namedtuple("Edge", "target kind")
+try:
+    Edge.target.__doc__ = "offset of the block control goes to"
+    Edge.kind.__doc__ = 'how control gets there: "next", "jump" or "handler"'
+except Exception:
+    pass
+
+
+def stack_depths_known(opc, version: tuple) -> bool:
+    """Return True if stack depths can be worked out for bytecode of
+    `version` with opcodes `opc`: the Python running us, from 3.8 on,
+    where dis.stack_effect() can tell a jump from going on."""
+    return (
+        (3, 8) <= tuple(version[:2]) == PYTHON_VERSION_TRIPLE[:2] < (3, 11)
+        and opc.is_pypy == IS_PYPY
+    )
+
+
+class BasicBlock(object):
+    """A straight run of instructions in a ControlFlowGraph."""
+
+    __slots__ = ("start", "offsets", "successors", "predecessors", "reachable")
+
+    def __init__(self, start: int):
+        # The offset of the first instruction.
+        self.start = start
+        # The offsets of the instructions in the block, in order.
+        self.offsets: List[int] = []
+        # Edges to the blocks control can go to from the end of this one.
+        self.successors: List[Edge] = []
+        # Offsets of the blocks that have an edge to this one.
+        self.predecessors: List[int] = []
+        # Whether the block can be reached from the start of the code.
+        self.reachable = False
+
+    @property
+    def end(self) -> int:
+        """The offset of the last instruction."""
+        return self.offsets[-1]
+
+    def __repr__(self):
+        return f"<BasicBlock {self.start}-{self.end}>"
+
+
+class ControlFlowGraph(object):
+    """The basic blocks of a code object, and the local variables set
+    and the stack depth before each reachable instruction. Neither fact
+    is worked out for 3.11 and later, and stack depths only where
+    stack_depths_known().
+
+    `instructions` is the code's decoded instruction list.
+    """
+
+    def __init__(self, opc, version: tuple, code, instructions):
+        self.opc = opc
+        self.version = tuple(version[:2])
+        self.code = code
+        self.instructions = instructions
+        # Blocks by the offset they start at, in offset order.
+        self.blocks: Dict[int, BasicBlock] = {}
+        self.block_of: Dict[int, BasicBlock] = {}
+        self.build()
+        # The local variables, by index in co_varnames, which are set
+        # before each instruction, keyed by offset. Only reachable
+        # instructions are here.
+        self.assigned: Optional[Dict[int, FrozenSet[int]]] = None
+        # The stack depth before each reachable instruction, and the most
+        # that is needed.
+        self.stack_depths: Optional[Dict[int, int]] = None
+        self.max_stack_depth: Optional[int] = None
+        if self.version < (3, 11):
+            self.assigned = self.find_assigned()
+            if stack_depths_known(opc, self.version):
+                self.stack_depths = self.find_stack_depths()
+
+    def is_jump(self, inst) -> bool:
+        opcode = inst.opcode
+        return opcode in self.opc.JREL_OPS or opcode in self.opc.JABS_OPS
+
+    def edges(self, inst) -> List[Edge]:
+        """Return the edges out of instruction `inst`."""
+        edges = []
+        if self.is_jump(inst):
+            target = inst.arguments[0]
+            if target < len(self.instructions) and self.instructions[target]:
+                kind = "handler" if inst.opname.startswith("SETUP_") else "jump"
+                edges.append(Edge(self.instructions[target].offset, kind))
+        following = inst.next_offset
+        if inst.opname not in NO_FALLTHROUGH_OPS and following < len(self.instructions):
+            edges.append(Edge(following, "next"))
+        return edges
+
+    def ends_block(self, offsets: List[int], i: int) -> bool:
+        """Return True if the instruction at `offsets[i]` is the last in
+        its block: it jumps, it doesn't go on to the next instruction, or
+        the instruction it goes on to isn't the next one in the code, as
+        happens when the peephole optimizer has folded what follows into
+        it."""
+        inst = self.instructions[offsets[i]]
+        if self.is_jump(inst) or inst.opname in NO_FALLTHROUGH_OPS:
+            return True
+        return i + 1 < len(offsets) and offsets[i + 1] != inst.next_offset
+
+    def build(self):
+        instructions = self.instructions
+        offsets = [
+            offset
+            for offset, inst in enumerate(instructions)
+            if inst is not None and inst.offset == offset
+        ]
+        if not offsets:
+            return
+        leaders = {offsets[0]}
+        for i, offset in enumerate(offsets):
+            if self.ends_block(offsets, i):
+                inst = instructions[offset]
+                leaders.update(edge.target for edge in self.edges(inst))
+                leaders.add(inst.next_offset)
+
+        block = None
+        for i, offset in enumerate(offsets):
+            if block is None or offset in leaders:
+                block = self.blocks[offset] = BasicBlock(offset)
+            block.offsets.append(offset)
+            self.block_of[offset] = block
+            if self.ends_block(offsets, i):
+                block = None
+
+        for block in self.blocks.values():
+            block.successors = [
+                edge
+                for edge in self.edges(instructions[block.end])
+                if edge.target in self.blocks
+            ]
+            for edge in block.successors:
+                self.blocks[edge.target].predecessors.append(block.start)
+
+        pending = [offsets[0]]
+        while pending:
+            block = self.blocks[pending.pop()]
+            if not block.reachable:
+                block.reachable = True
+                pending.extend(edge.target for edge in block.successors)
+
+    def block_at(self, offset: int) -> Optional[BasicBlock]:
+        """Return the block with the instruction at `offset` in it, or
+        None if there is no instruction there."""
+        if offset >= len(self.instructions) or self.instructions[offset] is None:
+            return None
+        inst = self.instructions[offset]
+        return self.block_of.get(inst.offset)
+
+    def reachable_blocks(self) -> List[BasicBlock]:
+        return [block for block in self.blocks.values() if block.reachable]
+
+    def is_assigned(self, offset: int, var_num: int) -> bool:
+        """Return True if local variable `var_num` is set whenever the
+        instruction at `offset` is run."""
+        if self.assigned is None:
+            return False
+        assigned = self.assigned.get(offset)
+        return assigned is not None and var_num in assigned
+
+    def find_assigned(self) -> Dict[int, FrozenSet[int]]:
+        """Return the local variables set before each reachable
+        instruction. A variable deleted anywhere in the code never
+        counts, so a handler block gets what is set at its SETUP_
+        instruction."""
+        code = self.code
+        instructions = self.instructions
+        deleted = set()
+        for block in self.blocks.values():
+            for offset in block.offsets:
+                if instructions[offset].opname == "DELETE_FAST":
+                    deleted.add(instructions[offset].int_arg)
+        nargs = code.co_argcount + getattr(code, "co_kwonlyargcount", 0)
+        if code.co_flags & CO_VARARGS:
+            nargs += 1
+        if code.co_flags & CO_VARKEYWORDS:
+            nargs += 1
+        start = frozenset(range(nargs)) - deleted
+
+        def transfer(block, assigned):
+            for offset in block.offsets:
+                assigned = assign(instructions[offset], assigned, deleted)
+            return assigned
+
+        # What is assigned on entry to each reachable block. Blocks not
+        # yet reached are left out, which stands for "everything".
+        entry: Dict[int, FrozenSet[int]] = {}
+        first = next(iter(self.blocks), None)
+        if first is None:
+            return {}
+        entry[first] = start
+        pending = [first]
+        while pending:
+            block = self.blocks[pending.pop()]
+            out = transfer(block, entry[block.start])
+            for edge in block.successors:
+                old = entry.get(edge.target)
+                new = out if old is None else old & out
+                if new != old:
+                    entry[edge.target] = new
+                    pending.append(edge.target)
+
+        assigned = {}
+        for start_offset, before in entry.items():
+            for offset in self.blocks[start_offset].offsets:
+                assigned[offset] = before
+                before = assign(instructions[offset], before, deleted)
+        return assigned
+
+    def find_stack_depths(self) -> Optional[Dict[int, int]]:
+        """Return the stack depth before each reachable instruction, or
+        None if it can't be worked out or isn't the same on all paths
+        to an instruction. Also sets `max_stack_depth`."""
+        instructions = self.instructions
+        if not self.blocks:
+            return None
+        first = next(iter(self.blocks))
+        # In 3.10, a generator is started with the value sent to it on
+        # the stack, which GEN_START pops.
+        depths = {first: int(instructions[first].opname == "GEN_START")}
+        pending = [first]
+        highest = 0
+        while pending:
+            offset = pending.pop()
+            inst = instructions[offset]
+            depth = depths[offset]
+            # Constants folded by the peephole optimizer have no int_arg.
+            int_arg = None
+            if inst.opcode >= dis.HAVE_ARGUMENT:
+                int_arg = inst.int_arg or 0
+            try:
+                jump_effect = dis.stack_effect(inst.opcode, int_arg, jump=True)
+                effect = dis.stack_effect(inst.opcode, int_arg, jump=False)
+            except ValueError:
+                return None
+            highest = max(highest, depth, depth + jump_effect, depth + effect)
+            for edge in self.edges(inst):
+                if edge.kind == "next":
+                    target_depth = depth + effect
+                else:
+                    target_depth = depth + jump_effect
+                if edge.target not in depths:
+                    depths[edge.target] = target_depth
+                    pending.append(edge.target)
+                elif depths[edge.target] != target_depth:
+                    return None
+        self.max_stack_depth = highest
+        return depths
+
+    @property
+    def stack_bounded(self) -> bool:
+        """True if the stack is known never to grow beyond co_stacksize."""
+        return (
+            self.max_stack_depth is not None
+            and self.max_stack_depth <= self.code.co_stacksize
+            and not self.code.co_flags & RESUMABLE_FLAGS
+        )
+
+
+def assign(inst, assigned: FrozenSet[int], deleted) -> FrozenSet[int]:
+    """Return what is assigned after `inst` given that `assigned` is
+    assigned before it. Variables in `deleted` are never assigned."""
+    if inst.opname == "STORE_FAST" and inst.int_arg not in deleted:
+        return assigned | {inst.int_arg}
+    return assigned
+
+
+def make_assigned_load_fast(vm, generic, stack_bounded: bool):
+    """Return a LOAD_FAST handler for a variable that is known to be
+    set, so that there is no need to test for UNBOUND. Frames without
+    fast locals go through `generic`, the usual handler.
+
+    If `stack_bounded`, the code is known not to need more stack than
+    co_stacksize, so the value is stored straight into the frame's stack
+    without going through PyVM.push()."""
+
+    if stack_bounded:
+
+        def load_fast_assigned(var_num):
+            frame = vm.frame
+            fastlocals = frame.fastlocals
+            if fastlocals is None:
+                return generic(var_num)
+            sp = frame.stack_pointer
+            frame.stack[sp] = fastlocals[var_num]
+            frame.stack_pointer = sp + 1
+
+    else:
+
+        def load_fast_assigned(var_num):
+            fastlocals = vm.frame.fastlocals
+            if fastlocals is None:
+                return generic(var_num)
+            vm.push(fastlocals[var_num])
+
+    return load_fast_assigned
+
+
+class FlowAnalyzer(object):
+    """Builds the ControlFlowGraph of newly decoded code for a PyVM,
+    kept as the DecodedCode's `cfg`. A LOAD_FAST of a variable that is
+    always set gets a handler that doesn't check for an unset one."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        # LOAD_FAST handlers, keyed by whether the stack is bounded.
+        self.load_fast = {}
+
+    def __call__(self, decoded):
+        vm = self.vm
+        instructions = decoded.instructions
+        cfg = decoded.cfg = ControlFlowGraph(
+            vm.opc, vm.version, decoded.code, instructions
+        )
+        if not cfg.assigned:
+            return
+        # EXTENDED_ARG offsets share the instruction they prefix, and
+        # must go on doing so.
+        replaced = {}
+        stack_bounded = cfg.stack_bounded
+        for offset, inst in enumerate(instructions):
+            if inst is None or inst.opname != "LOAD_FAST" or inst.handler is None:
+                continue
+            new_inst = replaced.get(id(inst))
+            if new_inst is None:
+                if not cfg.is_assigned(inst.offset, inst.int_arg):
+                    continue
+                handler = self.load_fast.get(stack_bounded)
+                if handler is None:
+                    handler = self.load_fast[stack_bounded] = make_assigned_load_fast(
+                        vm, inst.handler, stack_bounded
+                    )
+                new_inst = replaced[id(inst)] = inst._replace(handler=handler)
+            instructions[offset] = new_inst
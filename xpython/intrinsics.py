@@ -0,0 +1,180 @@
+"""Intrinsics: running calls to hot built-in functions on the stack."""
+
+import builtins
+from typing import Callable, Dict
+
+from xpython.pyobj import WHY_EXCEPTION
+from xpython.quicken import QUICKEN_MAX_MISSES
+
+# Built-in functions we run as intrinsics, by name.
+INTRINSICS: Dict[str, Callable] = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs",
+        "getattr",
+        "hasattr",
+        "isinstance",
+        "len",
+        "max",
+        "min",
+        "range",
+    )
+}
+
+
+def intrinsic_name(fn: Callable) -> str:
+    """The name we give an intrinsic instruction, e.g. CALL_FUNCTION_LEN."""
+    return f"CALL_FUNCTION_{fn.__name__.upper()}"
+
+
+def make_intrinsic(vm, fn: Callable, argc: int, miss):
+    """Return a handler that replaces `fn` and the `argc` arguments above
+    it on the stack with the result of calling `fn` with them. It calls
+    `miss` with its arguments when the callable on the stack isn't
+    `fn`."""
+
+    def type_error(frame, exc):
+        # As CALL_FUNCTION does.
+        tb = vm.traceback_here(frame, exc)
+        vm.last_exception = (TypeError, exc, tb)
+        return WHY_EXCEPTION
+
+    if argc == 1:
+
+        def intrinsic(*args):
+            frame = vm.frame
+            stack = frame.stack
+            sp = frame.stack_pointer - 1
+            if stack[sp - 1] is not fn:
+                return miss(args)
+            x = stack[sp]
+            stack[sp] = None
+            frame.stack_pointer = sp
+            try:
+                stack[sp - 1] = fn(x)
+            except TypeError as exc:
+                stack[sp - 1] = None
+                frame.stack_pointer = sp - 1
+                return type_error(frame, exc)
+            return None
+
+    elif argc == 2:
+
+        def intrinsic(*args):
+            frame = vm.frame
+            stack = frame.stack
+            sp = frame.stack_pointer - 2
+            if stack[sp - 1] is not fn:
+                return miss(args)
+            x = stack[sp]
+            y = stack[sp + 1]
+            stack[sp] = stack[sp + 1] = None
+            frame.stack_pointer = sp
+            try:
+                stack[sp - 1] = fn(x, y)
+            except TypeError as exc:
+                stack[sp - 1] = None
+                frame.stack_pointer = sp - 1
+                return type_error(frame, exc)
+            return None
+
+    else:
+
+        def intrinsic(*args):
+            frame = vm.frame
+            stack = frame.stack
+            sp = frame.stack_pointer - argc
+            if stack[sp - 1] is not fn:
+                return miss(args)
+            arguments = stack[sp : sp + argc]
+            stack[sp : sp + argc] = [None] * argc
+            frame.stack_pointer = sp
+            try:
+                stack[sp - 1] = fn(*arguments)
+            except TypeError as exc:
+                stack[sp - 1] = None
+                frame.stack_pointer = sp - 1
+                return type_error(frame, exc)
+            return None
+
+    return intrinsic
+
+
+class Intrinsics(object):
+    """Installs adaptive handlers for calls that may be to built-in
+    functions in `INTRINSICS` in newly decoded code for a PyVM. The
+    first time a call runs, it becomes an intrinsic if it calls one of
+    them, and otherwise gets back its generic handler. An intrinsic
+    goes back to the adaptive handler after `max_misses` misses."""
+
+    def __init__(self, vm, max_misses: int = QUICKEN_MAX_MISSES):
+        self.vm = vm
+        self.max_misses = max_misses
+
+    def __call__(self, decoded):
+        candidates = {}
+        calls = {}
+        for offset, inst in enumerate(decoded.instructions):
+            if inst is None or inst.handler is None:
+                continue
+            if inst.opname == "LOAD_GLOBAL":
+                name = inst.arguments[0]
+                if name in INTRINSICS:
+                    candidates[id(INTRINSICS[name])] = INTRINSICS[name]
+            elif inst.opname == "CALL_FUNCTION" and inst.int_arg < 256:
+                # Before 3.6, a high byte gives the number of keyword
+                # arguments. EXTENDED_ARG offsets share the instruction
+                # they prefix, so group the offsets by instruction.
+                calls.setdefault(id(inst), (inst, []))[1].append(offset)
+        if not candidates:
+            return
+        for inst, inst_offsets in calls.values():
+            self.install(decoded, inst, inst_offsets, inst.handler, candidates)
+
+    def install(self, decoded, inst, offsets, generic, candidates):
+        """Give `inst` an adaptive handler which, the first time it runs,
+        makes it an intrinsic if it calls one of `candidates`, a dict of
+        built-in functions by id(), and otherwise gives it back
+        `generic`."""
+        vm = self.vm
+        argc = inst.int_arg
+        misses = 0
+
+        def set_handler(handler, name):
+            new_inst = inst._replace(handler=handler)
+            instructions = decoded.instructions
+            unfused = decoded.unfused
+            for offset in offsets:
+                # Leave superinstructions alone; they get the handler
+                # from `unfused`.
+                if instructions[offset] is unfused[offset]:
+                    instructions[offset] = new_inst
+                unfused[offset] = new_inst
+            if name is None:
+                decoded.intrinsics.pop(inst.offset, None)
+            else:
+                decoded.intrinsics[inst.offset] = name
+
+        def miss(args):
+            nonlocal misses
+            misses += 1
+            if misses >= self.max_misses:
+                # Something else is being called here now; start over.
+                misses = 0
+                set_handler(adaptive, None)
+            return generic(*args)
+
+        def adaptive(*args):
+            frame = vm.frame
+            sp = frame.stack_pointer
+            if sp > argc:
+                fn = candidates.get(id(frame.stack[sp - argc - 1]))
+                if fn is not None:
+                    handler = make_intrinsic(vm, fn, argc, miss)
+                    set_handler(handler, intrinsic_name(fn))
+                    return handler(*args)
+            # This isn't a call to an intrinsic. Stay generic from here on.
+            set_handler(generic, None)
+            return generic(*args)
+
+        set_handler(adaptive, None)
@@ -0,0 +1,656 @@
+"""A JIT for hot functions: translating bytecode to Python source, which is
+compiled and run natively."""
+
+import dis
+import inspect
+import logging
+from typing import Dict, List, Optional
+
+from xdis import (
+    CO_ASYNC_GENERATOR,
+    CO_COROUTINE,
+    CO_GENERATOR,
+    CO_ITERABLE_COROUTINE,
+    CO_NEWLOCALS,
+    CO_OPTIMIZED,
+    CO_VARARGS,
+    CO_VARKEYWORDS,
+    IS_PYPY,
+    PYTHON_VERSION_TRIPLE,
+)
+
+from xpython.pyobj import NULL, UNBOUND, WHY_RETURN, Function, Method, lookup_method
+
+log = logging.getLogger(__name__)
+
+# The number of times a function's entry points are reached before the
+# function is translated.
+JIT_THRESHOLD = 200
+
+# The versions of Python we can translate bytecode for, when we are
+# running the same version.
+JIT_VERSIONS = ((3, 7), (3, 8), (3, 9), (3, 10))
+
+# What a translated function returns when the code has returned. The
+# return value is in the VM's return_value.
+RETURNED = -1
+
+# Generators and coroutines, which we leave to the interpreter.
+NOT_JIT_FLAGS = CO_GENERATOR | CO_COROUTINE | CO_ITERABLE_COROUTINE | CO_ASYNC_GENERATOR
+
+# Python operators for the operator instruction families.
+BINARY_OPERATORS = {
+    "POWER": "**",
+    "MULTIPLY": "*",
+    "FLOOR_DIVIDE": "//",
+    "TRUE_DIVIDE": "/",
+    "MODULO": "%",
+    "ADD": "+",
+    "SUBTRACT": "-",
+    "LSHIFT": "<<",
+    "RSHIFT": ">>",
+    "AND": "&",
+    "XOR": "^",
+    "OR": "|",
+}
+
+UNARY_OPERATORS = {
+    "POSITIVE": "+",
+    "NEGATIVE": "-",
+    "NOT": "not ",
+    "INVERT": "~",
+}
+
+# COMPARE_OP's operand for the comparisons we translate. Exception
+# matching is left to the interpreter.
+COMPARE_OPERATORS = ("<", "<=", "==", "!=", ">", ">=", "in", "not in", "is", "is not")
+
+JUMP_OPS = frozenset(
+    """
+    JUMP_ABSOLUTE JUMP_FORWARD POP_JUMP_IF_FALSE POP_JUMP_IF_TRUE
+    JUMP_IF_FALSE_OR_POP JUMP_IF_TRUE_OR_POP FOR_ITER
+    """.split()
+)
+
+# Instructions that we translate.
+TRANSLATED_OPS = (
+    frozenset(
+        """
+        NOP POP_TOP ROT_TWO ROT_THREE ROT_FOUR DUP_TOP DUP_TOP_TWO
+        LOAD_CONST LOAD_FAST STORE_FAST LOAD_GLOBAL LOAD_ATTR STORE_ATTR
+        BINARY_SUBSCR STORE_SUBSCR DELETE_SUBSCR COMPARE_OP IS_OP CONTAINS_OP
+        BUILD_TUPLE BUILD_LIST LIST_APPEND GET_ITER RETURN_VALUE
+        CALL_FUNCTION LOAD_METHOD CALL_METHOD
+        """.split()
+    )
+    | JUMP_OPS
+    | frozenset("BINARY_" + name for name in BINARY_OPERATORS)
+    | frozenset("INPLACE_" + name for name in BINARY_OPERATORS)
+    | frozenset("UNARY_" + name for name in UNARY_OPERATORS)
+)
+
+# Instructions after which control never goes on to the next one.
+NO_FALLTHROUGH_OPS = frozenset(
+    """
+    JUMP_ABSOLUTE JUMP_FORWARD RETURN_VALUE RAISE_VARARGS RERAISE
+    BREAK_LOOP CONTINUE_LOOP END_FINALLY
+    """.split()
+)
+
+# Instructions whose jump goes to an exception handler or the end of a
+# with statement rather than being a jump in normal control flow.
+HANDLER_SETUP_OPS = frozenset(
+    "SETUP_EXCEPT SETUP_FINALLY SETUP_WITH SETUP_ASYNC_WITH".split()
+)
+
+# Built-in functions that our ByteOp call routines treat specially,
+# so calls to them go through the interpreter.
+SPECIAL_BUILTINS = frozenset(
+    id(fn)
+    for fn in (
+        __build_class__,
+        compile,
+        eval,
+        exec,
+        globals,
+        locals,
+    )
+)
+
+
+def can_jit(vm, code) -> bool:
+    """Return True if `code`, run by `vm`, is something we might translate."""
+    if IS_PYPY or vm.is_pypy:
+        return False
+    if tuple(vm.version[:2]) != PYTHON_VERSION_TRIPLE[:2]:
+        return False
+    if PYTHON_VERSION_TRIPLE[:2] not in JIT_VERSIONS:
+        return False
+    flags = code.co_flags
+    if flags & (CO_OPTIMIZED | CO_NEWLOCALS) != CO_OPTIMIZED | CO_NEWLOCALS:
+        return False
+    return not flags & NOT_JIT_FLAGS
+
+
+def can_call_directly(vm, func) -> bool:
+    """Return True if calling `func` from translated code does what the
+    VM's call routines would do."""
+    ftype = type(func)
+    if ftype is Method:
+        func = func.im_func
+        ftype = type(func)
+    if ftype is Function:
+        # Calls to interpreted functions are run in the interpreter's
+        # loop. That keeps the frames, and the recursion limit, the
+        # same as when nothing is translated.
+        return not vm.inline_calls
+    if inspect.isbuiltin(func):
+        return id(func) not in SPECIAL_BUILTINS and func.__name__ != "exec"
+    if inspect.isfunction(func):
+        return func not in vm.fn2native
+    if inspect.isclass(func):
+        return func is not type and func.__name__ != "super"
+    return True
+
+
+def stack_effects(inst):
+    """Return the change in stack depth when the instruction `inst`
+    jumps, and when it goes on to the next instruction."""
+    opcode = inst.opcode
+    # Constants folded by the peephole optimizer have no int_arg.
+    int_arg = (inst.int_arg or 0) if opcode >= dis.HAVE_ARGUMENT else None
+    if PYTHON_VERSION_TRIPLE >= (3, 8):
+        return (
+            dis.stack_effect(opcode, int_arg, jump=True),
+            dis.stack_effect(opcode, int_arg, jump=False),
+        )
+    # Before 3.8, stack_effect() gives the larger of the two.
+    opname = inst.opname
+    if opname == "FOR_ITER":
+        return -1, 1
+    elif opname in ("JUMP_IF_FALSE_OR_POP", "JUMP_IF_TRUE_OR_POP"):
+        return 0, -1
+    effect = dis.stack_effect(opcode, int_arg)
+    return effect, effect
+
+
+def stack_depths(instructions) -> Optional[Dict[int, int]]:
+    """Return the value stack depth before each instruction reachable by
+    normal control flow from the start of the code, keyed by offset, or
+    None if the depths don't agree where control flow meets."""
+    depths = {0: 0}
+    pending = [0]
+    while pending:
+        offset = pending.pop()
+        inst = instructions[offset]
+        depth = depths[offset]
+        opname = inst.opname
+        try:
+            jump_effect, effect = stack_effects(inst)
+        except ValueError:
+            continue
+        edges = []
+        if inst.opcode in dis.hasjrel or inst.opcode in dis.hasjabs:
+            if opname not in HANDLER_SETUP_OPS:
+                edges.append((inst.arguments[0], depth + jump_effect))
+        if opname not in NO_FALLTHROUGH_OPS:
+            edges.append((inst.next_offset, depth + effect))
+        for target, target_depth in edges:
+            if target >= len(instructions) or instructions[target] is None:
+                continue
+            target = instructions[target].offset
+            if target not in depths:
+                depths[target] = target_depth
+                pending.append(target)
+            elif depths[target] != target_depth:
+                return None
+    return depths
+
+
+def entry_points(instructions, depths: Dict[int, int]) -> List[int]:
+    """Return the offsets of the first instruction and the targets of
+    backward jumps that we can start running translated code at."""
+    entries = {0}
+    for offset in depths:
+        inst = instructions[offset]
+        if inst.opname in JUMP_OPS:
+            target = instructions[inst.arguments[0]].offset
+            if target <= offset:
+                entries.add(target)
+    return sorted(
+        offset
+        for offset in entries
+        if offset in depths and instructions[offset].opname in TRANSLATED_OPS
+    )
+
+
+class Translator(object):
+    """Translates the bytecode of a code object into the source of a
+    Python function that works on its Frame. Stack entries and local
+    variables become local variables, and a loop picks the basic block
+    to run next by offset. An instruction not in TRANSLATED_OPS, or a
+    case that isn't handled, is a side exit: the frame is brought up to
+    date and the offset is returned, so that eval_frame() can carry on
+    from there."""
+
+    def __init__(self, code, instructions, depths: Dict[int, int], entries):
+        self.code = code
+        self.instructions = instructions
+        self.depths = depths
+        self.entries = entries
+        self.nlocals = len(code.co_varnames)
+        nargs = code.co_argcount + code.co_kwonlyargcount
+        if code.co_flags & CO_VARARGS:
+            nargs += 1
+        if code.co_flags & CO_VARKEYWORDS:
+            nargs += 1
+        deleted = {
+            inst.int_arg
+            for inst in filter(None, instructions)
+            if inst.opname == "DELETE_FAST"
+        }
+        # Local variables that are always set: the arguments that aren't
+        # deleted.
+        self.always_set = frozenset(range(nargs)) - deleted
+        self.leader_offsets = frozenset(self.leaders())
+        # The constants the translated code uses: the code's constants
+        # followed by any that the peephole optimizer has folded, whose
+        # LOAD_CONSTs have no int_arg.
+        self.consts = list(code.co_consts)
+        self.const_index: Dict[int, int] = {}
+        for inst in filter(None, instructions):
+            if inst.opname == "LOAD_CONST":
+                if inst.int_arg is None:
+                    self.const_index[inst.offset] = len(self.consts)
+                    self.consts.append(inst.arguments[0])
+                else:
+                    self.const_index[inst.offset] = inst.int_arg
+        # Local variables known to be set at the current point of the
+        # block being translated.
+        self.bound = set()
+        self.lines: List[str] = []
+
+    def emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def leaders(self) -> List[int]:
+        """The offsets that start a block of translated code: the entry
+        points and jump targets. A block can have several exits, so the
+        instruction after a conditional jump doesn't start a new one."""
+        leaders = set(self.entries)
+        for offset in self.depths:
+            inst = self.instructions[offset]
+            if inst.opname in JUMP_OPS:
+                leaders.add(self.instructions[inst.arguments[0]].offset)
+        return [leader for leader in leaders if leader in self.depths]
+
+    def store_locals(self, indent: int):
+        if self.nlocals:
+            names = ", ".join(f"l{i}" for i in range(self.nlocals))
+            self.emit(indent, f"fastlocals[:] = ({names},)")
+
+    def side_exit(self, indent: int, offset: int, depth: int):
+        """Emit code to store the frame state and return to the
+        interpreter at `offset`, with `depth` entries on the stack."""
+        self.store_locals(indent)
+        if depth:
+            names = ", ".join(f"s{i}" for i in range(depth))
+            self.emit(indent, f"stack[0:{depth}] = ({names},)")
+        self.emit(indent, f"frame.stack_pointer = {depth}")
+        self.emit(indent, f"return {offset}")
+
+    def jump(self, indent: int, target: int):
+        self.emit(indent, f"pc = {self.instructions[target].offset}")
+        self.emit(indent, "continue")
+
+    def translate(self) -> str:
+        """Return the source of a function `make_jitted()` which returns
+        the translated function."""
+        code = self.code
+        emit = self.emit
+        emit(0, "def make_jitted(")
+        emit(1, "vm, consts, UNBOUND, NULL, can_call_directly, lookup_method")
+        emit(0, "):")
+        for i in sorted(set(self.const_index.values())):
+            emit(1, f"c{i} = consts[{i}]")
+        emit(1, "def jitted(frame, pc):")
+        emit(2, "fastlocals = frame.fastlocals")
+        emit(2, "stack = frame.stack")
+        emit(2, "f_globals = frame.f_globals")
+        emit(2, "f_builtins = frame.f_builtins")
+        if self.nlocals:
+            names = ", ".join(f"l{i}" for i in range(self.nlocals))
+            emit(2, f"{names}, = fastlocals")
+        for entry in self.entries:
+            depth = self.depths[entry]
+            if depth:
+                emit(2, f"if pc == {entry}:")
+                for i in range(depth):
+                    emit(3, f"s{i} = stack[{i}]")
+        emit(2, "lasti = pc")
+        emit(2, "try:")
+        emit(3, "while True:")
+        keyword = "if"
+        for leader in sorted(self.leader_offsets):
+            emit(4, f"{keyword} pc == {leader}:")
+            keyword = "elif"
+            self.translate_block(leader)
+        emit(4, "else:")
+        emit(5, 'raise vm.PyVMError("no translated code at offset %d" % pc)')
+        emit(2, "except BaseException:")
+        emit(3, "frame.f_lasti = lasti")
+        self.store_locals(3)
+        emit(3, "depth = DEPTHS[lasti]")
+        emit(3, "temporaries = locals()")
+        emit(3, 'stack[0:depth] = [temporaries["s%d" % i] for i in range(depth)]')
+        emit(3, "frame.stack_pointer = depth")
+        emit(3, "raise")
+        emit(1, "return jitted")
+        emit(0, "")
+        depths = ", ".join(
+            f"{offset}: {depth}" for offset, depth in self.depths.items()
+        )
+        emit(0, f"DEPTHS = {{{depths}}}")
+        emit(0, f"# Translated from {code.co_name} in {code.co_filename}")
+        return "\n".join(self.lines) + "\n"
+
+    def translate_block(self, offset: int):
+        """Emit the code for the basic block starting at `offset`."""
+        instructions = self.instructions
+        self.bound = set(self.always_set)
+        first = True
+        while True:
+            inst = instructions[offset]
+            if not first and offset in self.leader_offsets:
+                self.jump(5, offset)
+                return
+            first = False
+            depth = self.depths[offset]
+            if inst.opname not in TRANSLATED_OPS or not self.translate_instruction(
+                inst, depth
+            ):
+                self.side_exit(5, offset, depth)
+                return
+            if inst.opname in NO_FALLTHROUGH_OPS:
+                return
+            offset = inst.next_offset
+            if offset not in self.depths:
+                return
+
+    def translate_instruction(self, inst, d: int) -> bool:
+        """Emit the code for `inst`, which has `d` entries on the stack
+        before it. Return False if it needs to go through the
+        interpreter."""
+        emit = self.emit
+        opname = inst.opname
+        arg = inst.int_arg
+        offset = inst.offset
+
+        def s(i):
+            return f"s{d + i}"
+
+        def raises():
+            emit(5, f"lasti = {offset}")
+
+        if opname == "NOP" or opname == "POP_TOP":
+            pass
+        elif opname == "ROT_TWO":
+            emit(5, f"{s(-2)}, {s(-1)} = {s(-1)}, {s(-2)}")
+        elif opname == "ROT_THREE":
+            emit(5, f"{s(-3)}, {s(-2)}, {s(-1)} = {s(-1)}, {s(-3)}, {s(-2)}")
+        elif opname == "ROT_FOUR":
+            emit(
+                5,
+                f"{s(-4)}, {s(-3)}, {s(-2)}, {s(-1)} = "
+                f"{s(-1)}, {s(-4)}, {s(-3)}, {s(-2)}",
+            )
+        elif opname == "DUP_TOP":
+            emit(5, f"{s(0)} = {s(-1)}")
+        elif opname == "DUP_TOP_TWO":
+            emit(5, f"{s(0)}, {s(1)} = {s(-2)}, {s(-1)}")
+        elif opname == "LOAD_CONST":
+            emit(5, f"{s(0)} = c{self.const_index[offset]}")
+        elif opname == "LOAD_FAST":
+            if arg not in self.bound:
+                # Let the interpreter report the unset variable.
+                emit(5, f"if l{arg} is UNBOUND:")
+                self.side_exit(6, offset, d)
+                self.bound.add(arg)
+            emit(5, f"{s(0)} = l{arg}")
+        elif opname == "STORE_FAST":
+            emit(5, f"l{arg} = {s(-1)}")
+            self.bound.add(arg)
+        elif opname == "LOAD_GLOBAL":
+            name = inst.arguments[0]
+            emit(5, f"{s(0)} = f_globals.get({name!r}, UNBOUND)")
+            emit(5, f"if {s(0)} is UNBOUND:")
+            emit(6, f"{s(0)} = f_builtins.get({name!r}, UNBOUND)")
+            emit(6, f"if {s(0)} is UNBOUND:")
+            # Let the interpreter report the missing name.
+            self.side_exit(7, offset, d)
+        elif opname == "LOAD_ATTR":
+            raises()
+            emit(5, f"{s(-1)} = getattr({s(-1)}, {inst.arguments[0]!r})")
+        elif opname == "STORE_ATTR":
+            raises()
+            emit(5, f"setattr({s(-1)}, {inst.arguments[0]!r}, {s(-2)})")
+        elif opname == "BINARY_SUBSCR":
+            raises()
+            emit(5, f"{s(-2)} = {s(-2)}[{s(-1)}]")
+        elif opname == "STORE_SUBSCR":
+            raises()
+            emit(5, f"{s(-2)}[{s(-1)}] = {s(-3)}")
+        elif opname == "DELETE_SUBSCR":
+            raises()
+            emit(5, f"del {s(-2)}[{s(-1)}]")
+        elif opname.startswith("BINARY_"):
+            raises()
+            op = BINARY_OPERATORS[opname[7:]]
+            emit(5, f"{s(-2)} = {s(-2)} {op} {s(-1)}")
+        elif opname.startswith("INPLACE_"):
+            raises()
+            op = BINARY_OPERATORS[opname[8:]]
+            emit(5, f"{s(-2)} {op}= {s(-1)}")
+        elif opname.startswith("UNARY_"):
+            raises()
+            op = UNARY_OPERATORS[opname[6:]]
+            emit(5, f"{s(-1)} = {op}{s(-1)}")
+        elif opname == "COMPARE_OP":
+            if arg >= len(COMPARE_OPERATORS):
+                return False
+            raises()
+            emit(5, f"{s(-2)} = {s(-2)} {COMPARE_OPERATORS[arg]} {s(-1)}")
+        elif opname == "IS_OP":
+            op = "is not" if arg else "is"
+            emit(5, f"{s(-2)} = {s(-2)} {op} {s(-1)}")
+        elif opname == "CONTAINS_OP":
+            raises()
+            op = "not in" if arg else "in"
+            emit(5, f"{s(-2)} = {s(-2)} {op} {s(-1)}")
+        elif opname == "BUILD_TUPLE":
+            items = "".join(f"{s(i)}, " for i in range(-arg, 0))
+            emit(5, f"{s(-arg)} = ({items})")
+        elif opname == "BUILD_LIST":
+            items = ", ".join(s(i) for i in range(-arg, 0))
+            emit(5, f"{s(-arg)} = [{items}]")
+        elif opname == "LIST_APPEND":
+            raises()
+            emit(5, f"{s(-1 - arg)}.append({s(-1)})")
+        elif opname == "GET_ITER":
+            raises()
+            emit(5, f"{s(-1)} = iter({s(-1)})")
+        elif opname == "FOR_ITER":
+            raises()
+            emit(5, f"{s(0)} = next({s(-1)}, UNBOUND)")
+            emit(5, f"if {s(0)} is UNBOUND:")
+            self.jump(6, inst.arguments[0])
+        elif opname in ("JUMP_ABSOLUTE", "JUMP_FORWARD"):
+            self.jump(5, inst.arguments[0])
+        elif opname in ("POP_JUMP_IF_FALSE", "JUMP_IF_FALSE_OR_POP"):
+            raises()
+            emit(5, f"if not {s(-1)}:")
+            self.jump(6, inst.arguments[0])
+        elif opname in ("POP_JUMP_IF_TRUE", "JUMP_IF_TRUE_OR_POP"):
+            raises()
+            emit(5, f"if {s(-1)}:")
+            self.jump(6, inst.arguments[0])
+        elif opname == "RETURN_VALUE":
+            emit(5, f"vm.return_value = {s(-1)}")
+            emit(5, f"return {RETURNED}")
+        elif opname == "CALL_FUNCTION":
+            self.call(s(-1 - arg), [s(i) for i in range(-arg, 0)], offset, d)
+        elif opname == "LOAD_METHOD":
+            # This is what our LOAD_METHOD does; see byteop37.py.
+            raises()
+            name = inst.arguments[0]
+            emit(5, f"{s(0)} = lookup_method({s(-1)}, {name!r})")
+            emit(5, f"if {s(0)} is NULL:")
+            emit(6, f"{s(-1)}, {s(0)} = NULL, getattr({s(-1)}, {name!r})")
+            emit(5, "else:")
+            emit(6, f"{s(-1)}, {s(0)} = {s(0)}, {s(-1)}")
+        elif opname == "CALL_METHOD":
+            args = [s(i) for i in range(-arg, 0)]
+            emit(5, f"if {s(-2 - arg)} is NULL:")
+            self.call(s(-1 - arg), args, offset, d, s(-2 - arg), 6)
+            emit(5, "else:")
+            self.call(s(-2 - arg), [s(-1 - arg)] + args, offset, d, indent=6)
+        else:
+            return False
+        return True
+
+    def call(
+        self,
+        func: str,
+        args: List[str],
+        offset: int,
+        d: int,
+        result: Optional[str] = None,
+        indent: int = 5,
+    ):
+        """Emit a call of `func` with `args` whose result replaces the
+        entry of the stack `result` is in, by default that of `func`."""
+        self.emit(indent, f"if not can_call_directly(vm, {func}):")
+        self.side_exit(indent + 1, offset, d)
+        self.emit(indent, f"lasti = {offset}")
+        self.emit(indent, f"{result or func} = {func}({', '.join(args)})")
+
+
+class JitCode(object):
+    """What the JIT keeps for a code object."""
+
+    __slots__ = ("decoded", "depths", "entries", "count", "source", "function")
+
+    def __init__(self, decoded, depths: Dict[int, int], entries: List[int]):
+        self.decoded = decoded
+        self.depths = depths
+        self.entries = entries
+        # The number of times an entry point has been reached.
+        self.count = 0
+        # The translated Python source, and the function compiled from it.
+        # `function` is False if translating failed.
+        self.source = None
+        self.function = None
+
+    def compile(self, vm):
+        """Translate and compile the code, setting `function`."""
+        code = self.decoded.code
+        try:
+            translator = Translator(
+                code, self.decoded.unfused, self.depths, self.entries
+            )
+            self.source = translator.translate()
+            namespace = {}
+            exec(compile(self.source, f"<jit {code.co_name}>", "exec"), namespace)
+            self.function = namespace["make_jitted"](
+                vm, translator.consts, UNBOUND, NULL, can_call_directly, lookup_method
+            )
+        except Exception as e:
+            log.info("Can't translate %s: %s", code.co_name, e)
+            self.function = False
+        else:
+            if vm.log_debug:
+                log.debug("Translated %s:\n%s", code.co_name, self.source)
+
+
+class JIT(object):
+    """Sets up newly decoded code for a PyVM to be translated once its
+    entry points, the first instruction and the targets of backward
+    jumps, have been reached `threshold` times. This is only done for
+    bytecode of the Python running us, and not for generators."""
+
+    def __init__(self, vm, threshold: int = JIT_THRESHOLD):
+        self.vm = vm
+        self.threshold = threshold
+
+    def __call__(self, decoded):
+        code = decoded.code
+        if not can_jit(self.vm, code):
+            return
+        unfused = decoded.unfused
+        depths = stack_depths(unfused)
+        if depths is None:
+            return
+        entries = entry_points(unfused, depths)
+        if not entries:
+            return
+        jit = decoded.jit = JitCode(decoded, depths, entries)
+        if decoded.instructions is unfused:
+            decoded.instructions = list(unfused)
+        for entry in entries:
+            self.install(decoded, jit, entry)
+
+    def install(self, decoded, jit, entry: int):
+        """Give the instruction at the entry point `entry` a handler
+        that runs the translated code once there is some."""
+        vm = self.vm
+        threshold = self.threshold
+        instructions = decoded.instructions
+        unfused = decoded.unfused
+        inst = instructions[entry]
+        depth = jit.depths[entry]
+        if inst is unfused[entry]:
+            # Quickening may change the handler.
+            def run_interpreted(*args):
+                return unfused[entry].handler(*args)
+
+        else:
+            # A superinstruction. It looks up what it runs each time.
+            run_interpreted = inst.handler
+
+        def enter(*args):
+            function = jit.function
+            if function is None:
+                jit.count += 1
+                if jit.count < threshold or vm.log_info:
+                    return run_interpreted(*args)
+                jit.compile(vm)
+                function = jit.function
+            frame = vm.frame
+            if not function or frame.stack_pointer != depth or vm.log_info:
+                return run_interpreted(*args)
+            try:
+                offset = function(frame, entry)
+            except BaseException:
+                frame.f_lineno = frame.line_table.line_number(frame.f_lasti)
+                raise
+            if offset == RETURNED:
+                return WHY_RETURN
+            # A side exit. Any stack entries above the new stack
+            # pointer were left there when we started.
+            sp = frame.stack_pointer
+            if sp < depth:
+                frame.stack[sp:depth] = [None] * (depth - sp)
+            frame.f_lasti = offset
+            frame.f_lineno = frame.line_table.line_number(offset)
+            frame.fallthrough = False
+            return None
+
+        entered = inst._replace(handler=enter)
+        threaded = decoded.threaded
+        for offset in range(entry + 1):
+            # EXTENDED_ARG prefixes map to the instruction they prefix.
+            if instructions[offset] is inst:
+                instructions[offset] = entered
+                if threaded is not None:
+                    # Run through dispatch(), which sees the "return".
+                    threaded[offset] = None
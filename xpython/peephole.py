@@ -0,0 +1,279 @@
+"""A peephole optimizer for decoded instructions, mostly of use for
+bytecode from older compilers."""
+
+import operator
+from typing import Callable, Dict, List, Optional
+
+# Unconditional jumps that a jump to can be threaded through.
+UNCONDITIONAL_JUMP_OPS = frozenset(("JUMP_FORWARD", "JUMP_ABSOLUTE"))
+
+# Jumps whose target may be threaded. This doesn't include jumps like
+# SETUP_EXCEPT and FOR_ITER which do more than jump.
+THREADED_JUMP_OPS = UNCONDITIONAL_JUMP_OPS | frozenset(
+    (
+        "JUMP_IF_FALSE",
+        "JUMP_IF_TRUE",
+        "JUMP_IF_FALSE_OR_POP",
+        "JUMP_IF_TRUE_OR_POP",
+        "POP_JUMP_IF_FALSE",
+        "POP_JUMP_IF_TRUE",
+    )
+)
+
+# Instructions that never go on to the next instruction.
+NO_FALLTHROUGH_OPS = UNCONDITIONAL_JUMP_OPS | frozenset(
+    ("RETURN_VALUE", "RAISE_VARARGS", "BREAK_LOOP", "CONTINUE_LOOP", "RERAISE")
+)
+
+# Instructions that do nothing and can be skipped over.
+SKIPPED_OPS = frozenset(("NOP",))
+
+# Arithmetic we fold when both operands are numbers. BINARY_DIVIDE
+# isn't here since what it does depends on the bytecode version.
+NUMBER_TYPES = (int, float, complex)
+BINARY_FOLDS: Dict[str, Callable] = {
+    "BINARY_ADD": operator.add,
+    "BINARY_SUBTRACT": operator.sub,
+    "BINARY_MULTIPLY": operator.mul,
+    "BINARY_TRUE_DIVIDE": operator.truediv,
+    "BINARY_FLOOR_DIVIDE": operator.floordiv,
+    "BINARY_MODULO": operator.mod,
+    "BINARY_POWER": operator.pow,
+    "BINARY_LSHIFT": operator.lshift,
+    "BINARY_RSHIFT": operator.rshift,
+    "BINARY_AND": operator.and_,
+    "BINARY_OR": operator.or_,
+    "BINARY_XOR": operator.xor,
+}
+UNARY_FOLDS: Dict[str, Callable] = {
+    "UNARY_NEGATIVE": operator.neg,
+    "UNARY_POSITIVE": operator.pos,
+    "UNARY_INVERT": operator.invert,
+}
+
+# Limits on what we fold, so that we don't spend a long time at load
+# time computing something big, like 2 ** 100000000, that may never
+# be needed.
+MAX_FOLDED_BITS = 128
+MAX_FOLDED_SHIFT = 128
+
+
+def fold_binary(opname: str, x, y):
+    """Return a 1-tuple with the result of the binary instruction
+    `opname` on constants `x` and `y`, or None if it shouldn't be
+    folded."""
+    fn = BINARY_FOLDS.get(opname)
+    if fn is None:
+        return None
+    if not (isinstance(x, NUMBER_TYPES) and isinstance(y, NUMBER_TYPES)):
+        return None
+    if opname == "BINARY_POWER" and isinstance(y, int) and abs(y) > MAX_FOLDED_SHIFT:
+        return None
+    if opname == "BINARY_LSHIFT" and isinstance(y, int) and y > MAX_FOLDED_SHIFT:
+        return None
+    try:
+        value = fn(x, y)
+    except Exception:
+        # Leave it to be raised when the code is run.
+        return None
+    if isinstance(value, int) and value.bit_length() > MAX_FOLDED_BITS:
+        return None
+    return (value,)
+
+
+def fold_unary(opname: str, x):
+    """Return a 1-tuple with the result of the unary instruction
+    `opname` on constant `x`, or None if it shouldn't be folded."""
+    fn = UNARY_FOLDS.get(opname)
+    if fn is None or not isinstance(x, NUMBER_TYPES):
+        return None
+    try:
+        return (fn(x),)
+    except Exception:
+        return None
+
+
+class Peephole(object):
+    """Optimizes newly decoded code for a PyVM: jumps to jumps go
+    straight to the end of the chain, constant expressions are folded
+    into a LOAD_CONST, and code that can't be reached is dropped. Each
+    change is recorded in the DecodedCode's `peephole`.
+
+    Nothing is moved. A rewritten instruction stays at its offset,
+    with a `next_offset` past what was folded into it, so line tables,
+    f_lasti and tracebacks still refer to the bytecode. Nothing is
+    changed across the start of a line or a jump target. Code for 3.11
+    and later is left alone."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.opc = vm.opc
+        self.enabled = vm.version[:2] < (3, 11)
+
+    def __call__(self, decoded):
+        if not self.enabled:
+            return
+        instructions = decoded.instructions
+        changes: Dict[int, str] = {}
+        targets = self.jump_targets(instructions)
+        self.fold_constants(instructions, targets, changes)
+        self.thread_jumps(instructions, changes)
+        self.skip_nops(instructions, changes)
+        dropped = self.drop_unreachable(instructions)
+        if dropped:
+            for offset in dropped:
+                changes.setdefault(offset, "dropped")
+            decoded.count = len(set(map(id, filter(None, instructions))))
+        decoded.peephole = changes
+
+    def is_jump(self, inst) -> bool:
+        opcode = inst.opcode
+        return opcode in self.opc.JREL_OPS or opcode in self.opc.JABS_OPS
+
+    def jump_targets(self, instructions) -> set:
+        """Return the offsets of the instructions that are jumped to,
+        including exception and loop block handlers."""
+        targets = set()
+        for inst in filter(None, instructions):
+            if self.is_jump(inst):
+                target = inst.arguments[0]
+                if target < len(instructions) and instructions[target] is not None:
+                    targets.add(instructions[target].offset)
+        return targets
+
+    def replace(self, instructions, inst, new_inst):
+        """Put `new_inst` in place of `inst` and the EXTENDED_ARG
+        prefixes that map to it."""
+        offset = inst.offset
+        while offset >= 0 and instructions[offset] is inst:
+            instructions[offset] = new_inst
+            offset -= 1
+
+    def fold_constants(self, instructions, targets, changes):
+        # The LOAD_CONSTs, with any folding done, that are on top of the
+        # stack at this point in a straight run of instructions.
+        consts: List = []
+        n = len(instructions)
+        offset = 0
+        while offset < n:
+            inst = instructions[offset]
+            if inst is None:
+                offset += 1
+                consts = []
+                continue
+            offset = inst.next_offset
+            if inst.offset in targets or inst.line_number is not None:
+                consts = []
+            opname = inst.opname
+            if opname == "LOAD_CONST":
+                consts.append(inst)
+                continue
+            folded = None
+            if opname == "BUILD_TUPLE" and 0 < inst.int_arg <= len(consts):
+                folded = (tuple(c.arguments[0] for c in consts[-inst.int_arg :]),)
+                count = inst.int_arg
+            elif opname in BINARY_FOLDS and len(consts) >= 2:
+                folded = fold_binary(
+                    opname, consts[-2].arguments[0], consts[-1].arguments[0]
+                )
+                count = 2
+            elif opname in UNARY_FOLDS and consts:
+                folded = fold_unary(opname, consts[-1].arguments[0])
+                count = 1
+            if folded is None:
+                consts = []
+                continue
+            first = consts[-count]
+            load = first._replace(
+                int_arg=None, arguments=folded, next_offset=inst.next_offset
+            )
+            self.replace(instructions, first, load)
+            del consts[-count:]
+            consts.append(load)
+            changes[first.offset] = (
+                f"folded {first.offset}-{inst.offset} into LOAD_CONST {folded[0]!r}"
+            )
+
+    def final_target(self, instructions, target: int) -> Optional[int]:
+        """Return where a jump to `target` ends up after any
+        unconditional jumps and NOPs there, or None if that is
+        `target`."""
+        seen = set()
+        final = target
+        while final < len(instructions) and final not in seen:
+            seen.add(final)
+            inst = instructions[final]
+            if inst is None or inst.line_number is not None:
+                break
+            if inst.opname in UNCONDITIONAL_JUMP_OPS:
+                final = inst.arguments[0]
+            elif inst.opname in SKIPPED_OPS:
+                final = inst.next_offset
+            else:
+                break
+        if final == target or final >= len(instructions):
+            return None
+        return final
+
+    def thread_jumps(self, instructions, changes):
+        for offset, inst in enumerate(instructions):
+            if (
+                inst is None
+                or inst.offset != offset
+                or inst.opname not in THREADED_JUMP_OPS
+            ):
+                continue
+            target = inst.arguments[0]
+            final = self.final_target(instructions, target)
+            if final is None:
+                continue
+            self.replace(instructions, inst, inst._replace(arguments=(final,)))
+            changes[offset] = f"jump to {target} threaded to {final}"
+
+    def skip_nops(self, instructions, changes):
+        """Have instructions followed by NOPs go on to whatever comes
+        after them."""
+        for offset, inst in enumerate(instructions):
+            if inst is None or inst.offset != offset:
+                continue
+            if inst.opname in NO_FALLTHROUGH_OPS:
+                continue
+            following = inst.next_offset
+            while following < len(instructions):
+                nop = instructions[following]
+                if (
+                    nop is None
+                    or nop.opname not in SKIPPED_OPS
+                    or nop.line_number is not None
+                ):
+                    break
+                following = nop.next_offset
+            if following != inst.next_offset:
+                self.replace(instructions, inst, inst._replace(next_offset=following))
+                changes.setdefault(offset, f"NOPs skipped to {following}")
+
+    def drop_unreachable(self, instructions) -> List[int]:
+        """Remove the instructions that can't be reached from the start
+        of the code, and return their offsets."""
+        n = len(instructions)
+        reached = set()
+        pending = [0]
+        while pending:
+            offset = pending.pop()
+            if offset >= n or instructions[offset] is None:
+                continue
+            inst = instructions[offset]
+            if inst.offset in reached:
+                continue
+            reached.add(inst.offset)
+            if self.is_jump(inst):
+                pending.append(inst.arguments[0])
+            if inst.opname not in NO_FALLTHROUGH_OPS:
+                pending.append(inst.next_offset)
+        dropped = []
+        for offset, inst in enumerate(instructions):
+            if inst is not None and inst.offset not in reached:
+                if inst.offset == offset:
+                    dropped.append(offset)
+                instructions[offset] = None
+        return dropped
@@ -3,10 +3,18 @@ import collections
 import inspect
 import linecache
 import types
-from copy import copy
 from sys import stderr
-
-from xdis import CO_GENERATOR, CO_ITERABLE_COROUTINE, iscode
+from typing import Optional
+
+from xdis import (
+    CO_GENERATOR,
+    CO_ITERABLE_COROUTINE,
+    CO_NEWLOCALS,
+    CO_OPTIMIZED,
+    CO_VARARGS,
+    CO_VARKEYWORDS,
+    iscode,
+)
 from xdis.cross_dis import findlinestarts
 from xdis.version_info import PYTHON3, PYTHON_VERSION_TRIPLE
 
@@ -18,12 +26,27 @@ else:
         pass
 
 
+from xpython.decode import LineTable
 import xpython.stdlib.inspect2 as inspect2
 import xpython.stdlib.inspect3 as inspect3
 
 PY2 = not PYTHON3
 
 
+class _Unbound(object):
+    """The type of UNBOUND."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<unbound>"
+
+
+# The value of a fast local variable that hasn't been assigned or has
+# been deleted.
+UNBOUND = _Unbound()
+
+
 def make_cell(value):
     # Thanks to Alex Gaynor for help with this bit of twistiness.
     # Construct an actual cell object by creating a closure right here,
@@ -54,6 +77,129 @@ COMPREHENSION_FN_NAMES = frozenset(
 )
 
 
+class BindingPlan(object):
+    """How to bind the arguments of a call to a function's local
+    variables. This is worked out once from the function's code,
+    defaults and keyword-only defaults, and is then used for each call.
+
+    `bind()` handles calls that bind without error. For anything else
+    it returns None, and the caller should fall back to the generic
+    getcallargs() routines, which produce the right error message.
+    """
+
+    __slots__ = (
+        "code",
+        "defaults",
+        "kwdefaults",
+        "nlocals",
+        "argcount",
+        "first_default",
+        "kwonly_names",
+        "varargs_index",
+        "varkw_index",
+        "keyword_index",
+        "simple",
+    )
+
+    def __init__(self, code, defaults, kwdefaults):
+        # We keep the code and defaults so that Function can tell when
+        # these have been reassigned and this plan is stale.
+        self.code = code
+        self.defaults = defaults
+        self.kwdefaults = kwdefaults
+
+        varnames = code.co_varnames
+        flags = code.co_flags
+        argcount = code.co_argcount
+        kwonlyargcount = getattr(code, "co_kwonlyargcount", 0)
+        posonlyargcount = getattr(code, "co_posonlyargcount", 0)
+
+        self.nlocals = len(varnames)
+        self.argcount = argcount
+        self.first_default = argcount - len(defaults or ())
+        i = argcount + kwonlyargcount
+        self.kwonly_names = varnames[argcount:i]
+        if flags & CO_VARARGS:
+            self.varargs_index = i
+            i += 1
+        else:
+            self.varargs_index = None
+        self.varkw_index = i if flags & CO_VARKEYWORDS else None
+
+        # Positional-only parameters can't be passed by keyword.
+        self.keyword_index = {
+            varnames[j]: j for j in range(posonlyargcount, argcount + kwonlyargcount)
+        }
+
+        # A call with exactly `argcount` positional arguments and nothing
+        # else is just a copy.
+        self.simple = (
+            kwonlyargcount == 0
+            and self.varargs_index is None
+            and self.varkw_index is None
+        )
+
+    def bind(self, args: tuple, kwargs: dict) -> Optional[list]:
+        """Return a list of initial values for the fast locals of a call
+        with `args` and `kwargs`, or None if the call can't be bound
+        without an error.
+        """
+        argcount = self.argcount
+        nargs = len(args)
+        if self.simple and nargs == argcount and not kwargs:
+            return list(args) + [UNBOUND] * (self.nlocals - argcount)
+
+        fastlocals = [UNBOUND] * self.nlocals
+        if nargs > argcount:
+            if self.varargs_index is None:
+                return None
+            fastlocals[:argcount] = args[:argcount]
+            fastlocals[self.varargs_index] = tuple(args[argcount:])
+        else:
+            fastlocals[:nargs] = args
+            if self.varargs_index is not None:
+                fastlocals[self.varargs_index] = ()
+
+        if self.varkw_index is not None:
+            extra_kwargs = {}
+            fastlocals[self.varkw_index] = extra_kwargs
+        else:
+            extra_kwargs = None
+
+        if kwargs:
+            keyword_index = self.keyword_index
+            for name, value in kwargs.items():
+                i = keyword_index.get(name)
+                if i is None:
+                    if extra_kwargs is None:
+                        return None
+                    extra_kwargs[name] = value
+                elif fastlocals[i] is not UNBOUND:
+                    # Multiple values for argument.
+                    return None
+                else:
+                    fastlocals[i] = value
+
+        if nargs < argcount:
+            defaults = self.defaults
+            first_default = self.first_default
+            for i in range(nargs, argcount):
+                if fastlocals[i] is UNBOUND:
+                    if i < first_default:
+                        return None
+                    fastlocals[i] = defaults[i - first_default]
+
+        if self.kwonly_names:
+            kwdefaults = self.kwdefaults
+            for i, name in enumerate(self.kwonly_names, argcount):
+                if fastlocals[i] is UNBOUND:
+                    if not kwdefaults or name not in kwdefaults:
+                        return None
+                    fastlocals[i] = kwdefaults[name]
+
+        return fastlocals
+
+
 class Function:
     """Function(name, code, globals, argdefs, closure, vm,  kwdefaults={},
                 annotations={}, doc=None, qualname=None)
@@ -86,12 +232,20 @@ class Function:
         "__closure__",
         # rest
         "func_globals",
-        "func_locals",
         "func_dict",
+        "__qualname__",
+        "__annotations__",
+        # Function attributes, and __doc__, which can't be a slot since
+        # the class has a docstring.
         "__dict__",
+        "version",
+        "has_dot_zero",
         # "__doc__" is filled in by the doc comment above.
         "_vm",
         "_func",
+        "_binding_plan",
+        "_aot",
+        "_aot_plan",
     ]
 
     def __init__(
@@ -110,6 +264,7 @@ class Function:
         self._vm = vm
         self.version = vm.version
         self.__doc__ = doc
+        self._binding_plan = None
 
         if name is not None and not isinstance(name, str):
             raise TypeError(
@@ -145,8 +300,6 @@ class Function:
         self.func_closure = self.__closure__ = closure
 
         self.func_globals = globs
-        self.func_locals = vm.frame.f_locals
-        self.__dict__ = {"version": vm.version, "_vm": vm}
 
         self.__doc__ = (
             code.co_consts[0] if hasattr(code, "co_consts") and code.co_consts else None
@@ -223,6 +376,12 @@ class Function:
             # cross version interpreting... FIXME: fix this up
             self._func = None
 
+        # The native function that calls run instead, when the VM has
+        # translated the code ahead of time, and the binding plan it was
+        # made for; see aot_function().
+        self._aot = self._aot_plan = None
+        self.aot_function()
+
     def __repr__(self):  # pragma: no cover
         if hasattr(self, "func_name"):
             return f"<Function {self.func_name} at 0x{id(self):08x}>"
@@ -239,7 +398,83 @@ class Function:
         else:
             return self
 
+    def binding_plan(self) -> BindingPlan:
+        """Return the BindingPlan for calls to this function. A new one
+        is made the first time, and again whenever the function's code
+        or defaults have been reassigned."""
+        code = self.__code__
+        if self.version >= (3, 0):
+            defaults, kwdefaults = self.__defaults__, self.__kwdefaults__
+        else:
+            defaults, kwdefaults = self.func_defaults, None
+        plan = self._binding_plan
+        if (
+            plan is None
+            or plan.code is not code
+            or plan.defaults is not defaults
+            or plan.kwdefaults is not kwdefaults
+        ):
+            plan = self._binding_plan = BindingPlan(code, defaults, kwdefaults)
+        return plan
+
+    def aot_function(self) -> Optional[types.FunctionType]:
+        """Return the native function that runs instead of this one when
+        the VM translates code ahead of time, or None; see xpython.aot.
+        Like the binding plan, it is made again whenever the function's
+        code or defaults have been reassigned."""
+        aot = self._vm.aot
+        if aot is None:
+            return None
+        plan = self.binding_plan()
+        if plan is not self._aot_plan:
+            self._aot_plan = plan
+            self._aot = aot.function(self, plan)
+        return self._aot
+
     def __call__(self, *args, **kwargs):
+        if self._vm.aot is not None:
+            native = self.aot_function()
+            if native is not None:
+                return native(*args, **kwargs)
+        frame = self.make_call_frame(args, kwargs)
+        if self.__code__.co_flags & CO_GENERATOR:
+            qualname = self.__qualname__ if self._vm.version >= (3, 4) else None
+            gen = Generator(
+                g_frame=frame, name=self.__name__, qualname=qualname, vm=self._vm
+            )
+            # The generator's frame refers to the one calling us.
+            if frame.f_back is not None:
+                frame.f_back.escape()
+            if self.__code__.co_flags & CO_ITERABLE_COROUTINE:
+                gen = _AsyncGeneratorWrapper(gen)
+                frame.generator = gen
+                return gen
+
+            frame.generator = gen
+            retval = gen
+        else:
+            retval = self._vm.eval_frame(frame)
+            self._vm.free_frame(frame)
+        return retval
+
+    def make_call_frame(self, args, kwargs) -> "Frame":
+        """Make a frame for a call to this function with positional
+        arguments `args` and keyword arguments `kwargs`."""
+        fastlocals = self.binding_plan().bind(args, kwargs)
+        if fastlocals is not None:
+            return self._vm.make_frame(
+                self.func_code,
+                f_globals=self.func_globals,
+                closure=self.__closure__,
+                fastlocals=fastlocals,
+            )
+        # The call has an error in it. Use the generic routines
+        # to report that.
+        return self._make_frame_getcallargs(args, kwargs)
+
+    def _make_frame_getcallargs(self, args, kwargs):
+        """Make a frame for a call to this function, binding arguments
+        with getcallargs()."""
         if self.has_dot_zero:
             # D'oh! http://bugs.python.org/issue19611 Py2 doesn't know how to
             # inspect set comprehensions, dict comprehensions, or generator
@@ -268,30 +503,26 @@ class Function:
             else:
                 callargs = inspect2.getcallargs(self, *args, **kwargs)
 
-        frame = self._vm.make_frame(
+        return self._vm.make_frame(
             self.func_code, callargs, self.func_globals, {}, self.__closure__
         )
-        if self.__code__.co_flags & CO_GENERATOR:
-            qualname = self.__qualname__ if self._vm.version >= (3, 4) else None
-            gen = Generator(
-                g_frame=frame, name=self.__name__, qualname=qualname, vm=self._vm
-            )
-            if self.__code__.co_flags & CO_ITERABLE_COROUTINE:
-                gen = _AsyncGeneratorWrapper(gen)
-                frame.generator = gen
-                return gen
-
-            frame.generator = gen
-            retval = gen
-        else:
-            retval = self._vm.eval_frame(frame)
-        return retval
 
 
+# A bound instance method object. This has no docstring so that
+# __doc__ can be a slot.
 # FIXME: go over. Not sure how close This is supposed to be
 # like type.MethodType
 class Method(object):
-    """Create a bound instance method object."""
+    __slots__ = (
+        "im_self",
+        "im_class",
+        "im_func",
+        "func_code",
+        "__name__",
+        "__code__",
+        "__doc__",
+        "__weakref__",
+    )
 
     def __init__(self, obj, _class, func):
         self.__doc__ = obj.__doc__
@@ -343,6 +574,8 @@ class Cell(object):
 
     """
 
+    __slots__ = ("contents",)
+
     def __init__(self, value):
         self.contents = value
 
@@ -353,6 +586,95 @@ class Cell(object):
         self.contents = value
 
 
+class _Null(object):
+    """The type of NULL."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<NULL>"
+
+
+# What LOAD_METHOD pushes below a callable that isn't a method, and
+# what PUSH_NULL pushes: the stand-in for C's NULL pointer, which the
+# call instructions look for.
+NULL = _Null()
+
+# The types of class attributes that LOAD_METHOD leaves unbound, to be
+# called with the object as their first argument.
+METHOD_TYPES = frozenset((Function, types.FunctionType, type(str.join)))
+
+
+def lookup_method(obj, name: str):
+    """Return the function that `obj.name` would bind `obj` to, or NULL
+    if getting the attribute does something else.
+
+    This is what LOAD_METHOD does in C Python: when `obj` gets its
+    attributes in the usual way and the attribute is a plain function
+    found in its class, rather than in `obj` itself, the function can
+    be called with `obj` as its first argument without making a bound
+    method first.
+    """
+    obj_type = type(obj)
+    if obj_type.__getattribute__ is not object.__getattribute__:
+        return NULL
+    for klass in obj_type.__mro__:
+        attr = klass.__dict__.get(name, NULL)
+        if attr is not NULL:
+            break
+    else:
+        return NULL
+    if type(attr) not in METHOD_TYPES:
+        return NULL
+    if obj_type.__dictoffset__ and name in obj.__dict__:
+        return NULL
+    return attr
+
+
+# Why a frame's block stack is being unwound: the values that
+# instruction handlers return to the eval_frame() loop, which are
+# compared for each instruction run. None means there is nothing to do.
+WHY_EXCEPTION = 1  # an exception was raised
+WHY_RERAISE = 2  # an exception is raised again, as by END_FINALLY
+WHY_RETURN = 3  # the function returns
+WHY_BREAK = 4  # a "break" statement
+WHY_CONTINUE = 5  # a "continue" statement
+WHY_YIELD = 6  # a generator yields
+WHY_SILENCED = 7  # a "with" statement's __exit__() swallowed an exception
+WHY_CALL = 8  # an interpreted function's frame is to be run in this loop
+
+# Before 3.8, the reason a "finally" clause is being run is pushed on
+# the value stack for END_FINALLY and WITH_CLEANUP to look at. There it
+# is the name of the why value, since 3.8's END_FINALLY takes an int on
+# the stack to be an offset to go back to.
+WHY_NAMES = {
+    WHY_EXCEPTION: "exception",
+    WHY_RERAISE: "reraise",
+    WHY_RETURN: "return",
+    WHY_BREAK: "break",
+    WHY_CONTINUE: "continue",
+    WHY_YIELD: "yield",
+    WHY_SILENCED: "silenced",
+    WHY_CALL: "call",
+}
+WHY_CODES = {name: why for why, name in WHY_NAMES.items()}
+
+# The kinds of Block.
+BLOCK_LOOP = 1  # SETUP_LOOP
+BLOCK_SETUP_EXCEPT = 2  # SETUP_EXCEPT, and SETUP_FINALLY starting in 3.8
+BLOCK_FINALLY = 3  # SETUP_FINALLY before 3.8
+BLOCK_WITH = 4  # SETUP_WITH in 2.7
+BLOCK_EXCEPT_HANDLER = 5  # an exception handler that is running
+
+BLOCK_NAMES = {
+    BLOCK_LOOP: "loop",
+    BLOCK_SETUP_EXCEPT: "setup-except",
+    BLOCK_FINALLY: "finally",
+    BLOCK_WITH: "with",
+    BLOCK_EXCEPT_HANDLER: "except-handler",
+}
+
+
 class Block(object):
     """
     Block(type, handler, level)
@@ -368,26 +690,73 @@ class Block(object):
     int b_handler;              /* where to jump to find handler */
     int b_level;                /* value stack level to pop to */
 
+    `type` is one of the BLOCK_ kinds above.
     """
 
+    __slots__ = ("type", "handler", "level")
+
     def __init__(self, type, handler, level):
         self.type = type
         self.handler = handler
         self.level = level
-        return
 
     def __repr__(self):
+        name = BLOCK_NAMES.get(self.type, self.type)
         if self.handler is None:
-            return "<Block type: %s, stack level: %d" % (self.type, self.level)
+            return "<Block type: %s, stack level: %d" % (name, self.level)
         else:
             return "<Block type: %s, end offset: @%d, stack level: %d" % (
-                self.type,
+                name,
                 self.handler,
                 self.level,
             )
 
 
+def frame_builtins(f_globals: dict, f_back) -> dict:
+    """The builtins for a frame with globals `f_globals` that is
+    called from `f_back`."""
+    if f_back and f_back.f_globals is f_globals:
+        # If we share the globals, we share the builtins.
+        return f_back.f_builtins
+    try:
+        f_builtins = f_globals["__builtins__"]
+    except KeyError:
+        # No builtins! Make up a minimal one with None.
+        return {"None": None}
+    if hasattr(f_builtins, "__dict__"):
+        f_builtins = f_builtins.__dict__
+    return f_builtins
+
+
 class Frame(object):
+    # Frames are made for every call, so their attributes are slots, and
+    # those that are seldom used are only given a value when they are.
+    __slots__ = (
+        "f_code",
+        "f_globals",
+        "f_back",
+        "_f_locals",
+        "_locals_snapshot",
+        "fastlocals",
+        "stack",
+        "stack_pointer",
+        "f_trace",
+        "event_flags",
+        "brkpt",
+        "f_builtins",
+        "f_lineno",
+        "f_lasti",
+        "cells",
+        "block_stack",
+        "generator",
+        "version",
+        "inst_index",
+        "fallthrough",
+        "last_op",
+        "line_table",
+        "escaped",
+    )
+
     def __init__(
         self,
         f_code,
@@ -396,12 +765,42 @@ class Frame(object):
         f_back,
         version=PYTHON_VERSION_TRIPLE,
         closure=None,
+        line_table=None,
+        fastlocals=None,
     ):
         self.f_code = f_code
         self.f_globals = f_globals
-        self.f_locals = f_locals
         self.f_back = f_back
-        self.stack = []
+
+        # Optimized function frames keep their local variables in
+        # `fastlocals`, a list indexed by position in co_varnames. A
+        # dictionary of them is built only when someone asks for
+        # f_locals. For other frames, `fastlocals` is None and
+        # f_locals is a dictionary that is used directly. An optimized
+        # frame that is given `fastlocals` can be given None for
+        # `f_locals`; the dictionary is then made when it is needed.
+        self._f_locals = f_locals
+        self._locals_snapshot = None
+        if f_code.co_flags & (CO_NEWLOCALS | CO_OPTIMIZED) == (
+            CO_NEWLOCALS | CO_OPTIMIZED
+        ):
+            if fastlocals is None:
+                fastlocals = [
+                    f_locals.get(name, UNBOUND) for name in f_code.co_varnames
+                ]
+            self.fastlocals = fastlocals
+        else:
+            if fastlocals is not None:
+                for name, value in zip(f_code.co_varnames, fastlocals):
+                    if value is not UNBOUND:
+                        f_locals[name] = value
+            self.fastlocals = None
+
+        # The evaluation stack is preallocated to the size the compiler
+        # says is needed. Entries at or above stack_pointer are None.
+        self.stack = [None] * f_code.co_stacksize
+        self.stack_pointer = 0
+
         self.f_trace = None
 
         # event args is used in tracing/debugging callback.
@@ -410,19 +809,10 @@ class Frame(object):
         # brkpt is a mapping bytecode offset to the opcode value that was
         # smasshed by overwriting it with the pseudo opcode BRKPT.
         # After a breakpoint is serviced, this opcode needs to be run.
-        self.brkpt = {}
+        # It is None until a breakpoint is set.
+        self.brkpt = None
 
-        if f_back and f_back.f_globals is f_globals:
-            # If we share the globals, we share the builtins.
-            self.f_builtins = f_back.f_builtins
-        else:
-            try:
-                self.f_builtins = f_globals["__builtins__"]
-                if hasattr(self.f_builtins, "__dict__"):
-                    self.f_builtins = self.f_builtins.__dict__
-            except KeyError:
-                # No builtins! Make up a minimal one with None.
-                self.f_builtins = {"None": None}
+        self.f_builtins = frame_builtins(f_globals, f_back)
 
         self.f_lineno = f_code.co_firstlineno
 
@@ -437,7 +827,14 @@ class Frame(object):
                 f_back.cells = {}
             for var in f_code.co_cellvars:
                 # Make a cell for the variable in our locals, or None.
-                cell = Cell(self.f_locals.get(var))
+                if self.fastlocals is not None and var in f_code.co_varnames:
+                    # An argument that is also a cell variable.
+                    value = self.fastlocals[f_code.co_varnames.index(var)]
+                    cell = Cell(None if value is UNBOUND else value)
+                elif f_locals is None:
+                    cell = Cell(None)
+                else:
+                    cell = Cell(f_locals.get(var))
                 f_back.cells[var] = self.cells[var] = cell
         else:
             self.cells = None
@@ -473,8 +870,15 @@ class Frame(object):
         self.fallthrough = False
         self.last_op = None
 
-        # Keep a cache of line starts for this frame
-        self.line_starts = list(findlinestarts(self.f_code))
+        # True once something other than the running code may hold on
+        # to the frame; see escape().
+        self.escaped = False
+
+        # Line number information is shared by all frames of a code
+        # object. PyVM.make_frame() passes in its cached copy.
+        if line_table is None:
+            line_table = LineTable(findlinestarts(f_code))
+        self.line_table = line_table
         return
 
     def __repr__(self):  # pragma: no cover
@@ -485,24 +889,112 @@ class Frame(object):
             self.f_lasti,
         )
 
+    @property
+    def f_locals(self) -> dict:
+        """The local variables of the frame as a dictionary.
+
+        For frames with fast locals, the dictionary is refreshed from
+        them each time this is accessed. Changes made to it are copied
+        back by `locals_to_fast()`.
+        """
+        if self.fastlocals is not None:
+            self.fast_to_locals()
+        return self._f_locals
+
+    @f_locals.setter
+    def f_locals(self, f_locals: dict):
+        # After this, the frame's local variables are whatever is in
+        # `f_locals`; this is how STORE_LOCALS works.
+        self._f_locals = f_locals
+        self.fastlocals = None
+        self._locals_snapshot = None
+
+    def fast_to_locals(self):
+        """Update the f_locals dictionary from fast locals."""
+        f_locals = self._f_locals
+        if f_locals is None:
+            f_locals = self._f_locals = {}
+        for name, value in zip(self.f_code.co_varnames, self.fastlocals):
+            if value is UNBOUND:
+                f_locals.pop(name, None)
+            else:
+                f_locals[name] = value
+        # Remember what we handed out, so that locals_to_fast() copies
+        # back only what was changed in the dictionary.
+        self._locals_snapshot = list(self.fastlocals)
+
+    def locals_to_fast(self):
+        """Copy changes made to the f_locals dictionary since it was last
+        handed out, say by a debugger, back into fast locals."""
+        snapshot = self._locals_snapshot
+        if snapshot is None or self.fastlocals is None:
+            return
+        f_locals = self._f_locals
+        fastlocals = self.fastlocals
+        for i, name in enumerate(self.f_code.co_varnames):
+            value = f_locals.get(name, UNBOUND)
+            if value is not snapshot[i]:
+                fastlocals[i] = value
+        self._locals_snapshot = None
+
+    def escape(self):
+        """Note that something other than the running code, such as a
+        traceback, may now hold on to this frame and the frames that
+        called it, so none of them can be reused by PyVM.make_frame()
+        once they return."""
+        frame = self
+        while frame is not None and not frame.escaped:
+            frame.escaped = True
+            frame = frame.f_back
+
+    def retire(self):
+        """Drop what the frame refers to once it has returned, so that
+        it can be kept on a free list. See PyVM.free_frame()."""
+        stack = self.stack
+        for i in range(self.stack_pointer):
+            stack[i] = None
+        self.stack_pointer = 0
+        self.block_stack.clear()
+        self.f_globals = self.f_builtins = self.f_back = None
+        self._f_locals = self._locals_snapshot = self.fastlocals = None
+        self.last_op = None
+
+    def reuse(self, f_globals, f_back, fastlocals):
+        """Ready a retired frame to run its code again, as Frame() would
+        with these arguments and no f_locals or closure."""
+        self.f_globals = f_globals
+        self.f_back = f_back
+        self.fastlocals = fastlocals
+        self.f_builtins = frame_builtins(f_globals, f_back)
+        self.f_lineno = self.f_code.co_firstlineno
+        self.f_lasti = -1
+        self.inst_index = -1
+        self.fallthrough = False
+
+    @property
+    def linestarts(self):
+        """A read-only mapping from the offset of each instruction that
+        starts a line to that line number."""
+        return self.line_table.linestarts
+
+    def stack_values(self) -> list:
+        """Return a list of the values on the evaluation stack, bottom first."""
+        return self.stack[: self.stack_pointer]
+
     def line_number(self) -> int:
         """Get the current line number the frame is executing."""
         # We don't keep f_lineno up to date, so calculate it based on the
         # instruction address and the line number table.
-        last_line_number = 0
-        for offset, line_number in self.line_starts:
-            if offset > self.f_lasti:
-                break
-            last_line_number = line_number
-
-        return last_line_number
+        return self.line_table.line_number(self.f_lasti)
 
 
 class Traceback(object):
-    def __init__(self, frame):
+    __slots__ = ("tb_next", "tb_lasti", "tb_lineno", "tb_frame")
+
+    def __init__(self, frame, lasti: int, lineno: int):
         self.tb_next = frame.f_back
-        self.tb_lasti = frame.f_lasti
-        self.tb_lineno = frame.f_lineno
+        self.tb_lasti = lasti
+        self.tb_lineno = lineno
         self.tb_frame = frame
 
     # Note: this can be removed when we have our own compatibility traceback.
@@ -512,7 +1004,7 @@ class Traceback(object):
         while tb:
             f = tb.tb_frame
             filename = f.f_code.co_filename
-            lineno = f.line_number()
+            lineno = tb.tb_lineno
             print(
                 '  File "%s", line %d, in %s' % (filename, lineno, f.f_code.co_name),
                 file=file,
@@ -524,22 +1016,75 @@ class Traceback(object):
             tb = tb.tb_next
 
 
-def traceback_from_frame(frame):
-    tb = None
+class TracebackRecord(object):
+    """The frames an exception has passed through so far.
 
-    while frame:
-        next_tb = Traceback(copy(frame))
+    This is what we keep while an exception unwinds, instead of a
+    Traceback chain. Each frame the exception leaves adds a
+    (frame, lasti) entry, innermost frame first. Most exceptions are
+    caught and never looked at, so line numbers are looked up and the
+    Traceback chain is built only when `to_traceback()` is called.
+    """
+
+    __slots__ = ("exception", "entries", "_traceback")
+
+    def __init__(self, exception):
+        self.exception = exception
+        self.entries = []
+        self._traceback = None
+
+    def add(self, frame):
+        """Record that the exception is passing through `frame`."""
+        entries = self.entries
+        lasti = frame.f_lasti
+        if entries and entries[-1][0] is frame and entries[-1][1] == lasti:
+            return
+        entries.append((frame, lasti))
+        self._traceback = None
+
+    def to_traceback(self):
+        """Return the Traceback chain for the entries, outermost frame first."""
+        if self._traceback is None:
+            self._traceback = traceback_from_entries(self.entries)
+        return self._traceback
+
+
+def traceback_from_entries(entries):
+    """Build a Traceback chain from (frame, lasti) entries, which are
+    innermost frame first. The outermost Traceback is returned."""
+    tb = None
+    for frame, lasti in entries:
+        next_tb = Traceback(frame, lasti, frame.line_table.line_number(lasti))
         next_tb.tb_next = tb
         tb = next_tb
-        frame = frame.f_back
     return tb
 
 
+def traceback_from_frame(frame):
+    frame.escape()
+    entries = []
+    while frame:
+        entries.append((frame, frame.f_lasti))
+        frame = frame.f_back
+    return traceback_from_entries(entries)
+
+
 class Generator(object):
+    __slots__ = (
+        "gi_frame",
+        "vm",
+        "started",
+        "finished",
+        "gi_running",
+        "gi_code",
+        "__name__",
+        "__qualname__",
+        "__weakref__",
+    )
+
     def __init__(self, g_frame, name, qualname, vm):
         self.gi_frame = g_frame
         self.vm = vm
-        self.name = vm
         self.started = False
         self.finished = False
         self.gi_running = False
@@ -556,12 +1101,19 @@ class Generator(object):
     def send(self, value=None):
         if not self.started and value is not None:
             raise TypeError("Can't send non-None value to a just-started generator")
-        self.gi_frame.stack.append(value)
+        frame = self.gi_frame
+        if frame.stack_pointer < len(frame.stack):
+            frame.stack[frame.stack_pointer] = value
+        else:
+            frame.stack.append(value)
+        frame.stack_pointer += 1
         self.started = True
-        self.running = True
-        val = self.vm.resume_frame(self.gi_frame)
+        self.gi_running = True
+        try:
+            val = self.vm.resume_frame(self.gi_frame)
+        finally:
+            self.gi_running = False
         if self.finished:
-            self.running = False
             raise StopIteration(val)
         return val
 
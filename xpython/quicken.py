@@ -0,0 +1,200 @@
+"""Quickening: specializing arithmetic, comparison and subscript
+instructions for the operand types they see."""
+
+import operator
+from typing import Callable, Dict, Optional, Tuple
+
+from xdis.opcodes.opcode_311 import _nb_ops
+
+# The number of times an instruction runs before we try to specialize it.
+QUICKEN_WARMUP = 8
+
+# The number of times a specialized instruction's guard can fail before
+# it is given back its adaptive handler.
+QUICKEN_MAX_MISSES = 64
+
+# Operand types that a specialized form is guarded on. A second type
+# of None means that the right-hand operand isn't checked.
+NUMBER_TYPES = ((int, int), (float, float))
+STRING_TYPES = ((str, str),)
+SUBSCRIPT_TYPES = ((list, int), (tuple, int), (str, int), (dict, None))
+
+# Operations we specialize: the name used by binaryOperator() and
+# inplaceOperator() mapped to the operation and the operand types to
+# specialize it for. In-place operators on these types are the same
+# as the plain operators since none of the types are mutable.
+BINARY_SPECIALIZATIONS: Dict[str, Tuple[Callable, tuple]] = {
+    "ADD": (operator.add, NUMBER_TYPES + STRING_TYPES),
+    "SUBTRACT": (operator.sub, NUMBER_TYPES),
+    "MULTIPLY": (operator.mul, NUMBER_TYPES),
+    "TRUE_DIVIDE": (operator.truediv, NUMBER_TYPES),
+    "FLOOR_DIVIDE": (operator.floordiv, NUMBER_TYPES),
+    "MODULO": (operator.mod, NUMBER_TYPES),
+    "SUBSCR": (operator.getitem, SUBSCRIPT_TYPES),
+}
+
+INPLACE_SPECIALIZATIONS = {
+    name: specialization
+    for name, specialization in BINARY_SPECIALIZATIONS.items()
+    if name != "SUBSCR"
+}
+
+# COMPARE_OP's operand for the comparisons we specialize.
+COMPARE_SPECIALIZATIONS = {
+    0: (operator.lt, NUMBER_TYPES + STRING_TYPES),
+    1: (operator.le, NUMBER_TYPES + STRING_TYPES),
+    2: (operator.eq, NUMBER_TYPES + STRING_TYPES),
+    3: (operator.ne, NUMBER_TYPES + STRING_TYPES),
+    4: (operator.gt, NUMBER_TYPES + STRING_TYPES),
+    5: (operator.ge, NUMBER_TYPES + STRING_TYPES),
+}
+
+# BINARY_OP's operand is an index into this, e.g. "ADD" or "INPLACE_ADD".
+BINARY_OP_NAMES = tuple(nb_op[0][3:] for nb_op in _nb_ops)
+
+
+def specialization_for(opname: str, arguments: tuple, version: tuple):
+    """Return the (operation, operand types) we can specialize the
+    instruction `opname` with operand `arguments` for, or None."""
+    if opname == "BINARY_OP":
+        opname = "BINARY_" + BINARY_OP_NAMES[arguments[0]]
+    if opname.startswith("BINARY_"):
+        return BINARY_SPECIALIZATIONS.get(opname[7:])
+    elif opname.startswith("INPLACE_"):
+        return INPLACE_SPECIALIZATIONS.get(opname[8:])
+    elif opname == "COMPARE_OP" and version[:2] < (3, 12):
+        # Starting in 3.12 the comparison is in the high bits of the operand.
+        return COMPARE_SPECIALIZATIONS.get(arguments[0])
+    return None
+
+
+def specialized_name(opname: str, xtype: type, ytype: Optional[type]) -> str:
+    """The name we give a specialized instruction, e.g. BINARY_ADD_INT_INT."""
+    name = f"{opname}_{xtype.__name__}"
+    if ytype is not None:
+        name += f"_{ytype.__name__}"
+    return name.upper()
+
+
+def make_specialized(vm, op: Callable, xtype: type, ytype: Optional[type], miss):
+    """Return a handler that replaces the top two stack entries x, y
+    with op(x, y) when x and y have types `xtype` and `ytype`. It calls
+    `miss` with its arguments when they don't."""
+    if ytype is None:
+
+        def specialized(*args):
+            frame = vm.frame
+            stack = frame.stack
+            sp = frame.stack_pointer - 1
+            x = stack[sp - 1]
+            if type(x) is xtype:
+                stack[sp - 1] = op(x, stack[sp])
+                stack[sp] = None
+                frame.stack_pointer = sp
+                return None
+            return miss(args)
+
+    else:
+
+        def specialized(*args):
+            frame = vm.frame
+            stack = frame.stack
+            sp = frame.stack_pointer - 1
+            x = stack[sp - 1]
+            y = stack[sp]
+            if type(x) is xtype and type(y) is ytype:
+                stack[sp - 1] = op(x, y)
+                stack[sp] = None
+                frame.stack_pointer = sp
+                return None
+            return miss(args)
+
+    return specialized
+
+
+class Quickener(object):
+    """Installs adaptive handlers in newly decoded code for a PyVM.
+    After QUICKEN_WARMUP runs, an adaptive handler specializes its
+    instruction for the operand types on the stack. A specialized
+    handler guards on those types, and goes back to being adaptive
+    after QUICKEN_MAX_MISSES misses."""
+
+    def __init__(
+        self,
+        vm,
+        warmup: int = QUICKEN_WARMUP,
+        max_misses: int = QUICKEN_MAX_MISSES,
+    ):
+        self.vm = vm
+        self.warmup = warmup
+        self.max_misses = max_misses
+
+    def __call__(self, decoded):
+        # EXTENDED_ARG offsets share the instruction they prefix, so
+        # group the offsets by instruction.
+        offsets = {}
+        for offset, inst in enumerate(decoded.instructions):
+            if inst is not None:
+                offsets.setdefault(id(inst), (inst, []))[1].append(offset)
+        for inst, inst_offsets in offsets.values():
+            if inst.handler is None:
+                continue
+            specialization = specialization_for(
+                inst.opname, inst.arguments, self.vm.version
+            )
+            if specialization is not None:
+                self.install(decoded, inst, inst_offsets, inst.handler, specialization)
+
+    def install(self, decoded, inst, offsets, generic, specialization):
+        """Give `inst` an adaptive handler which calls `generic` until it
+        has run `warmup` times and then tries to specialize it."""
+        vm = self.vm
+        op, candidates = specialization
+        count = 0
+        misses = 0
+
+        def set_handler(handler, name):
+            new_inst = inst._replace(handler=handler)
+            instructions = decoded.instructions
+            unfused = decoded.unfused
+            for offset in offsets:
+                # Leave superinstructions alone; they get the handler
+                # from `unfused`.
+                if instructions[offset] is unfused[offset]:
+                    instructions[offset] = new_inst
+                unfused[offset] = new_inst
+            if name is None:
+                decoded.specializations.pop(inst.offset, None)
+            else:
+                decoded.specializations[inst.offset] = name
+
+        def miss(args):
+            nonlocal count, misses
+            misses += 1
+            if misses >= self.max_misses:
+                # The operand types have changed; start over.
+                count = misses = 0
+                set_handler(adaptive, None)
+            return generic(*args)
+
+        def adaptive(*args):
+            nonlocal count
+            count += 1
+            if count < self.warmup:
+                return generic(*args)
+            frame = vm.frame
+            sp = frame.stack_pointer
+            if sp >= 2:
+                x = frame.stack[sp - 2]
+                y = frame.stack[sp - 1]
+                for xtype, ytype in candidates:
+                    if type(x) is xtype and (ytype is None or type(y) is ytype):
+                        name = specialized_name(inst.opname, xtype, ytype)
+                        handler = make_specialized(vm, op, xtype, ytype, miss)
+                        set_handler(handler, name)
+                        return handler(*args)
+            # Nothing fits what we see. Stay generic from here on.
+            set_handler(generic, None)
+            return generic(*args)
+
+        set_handler(adaptive, None)
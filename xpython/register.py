@@ -0,0 +1,794 @@
+"""Register code: running stack bytecode as instructions on registers, an
+alternative to pushing and popping the value stack."""
+
+import operator
+from typing import Dict, List, Optional
+
+from xdis import CO_NEWLOCALS, CO_OPTIMIZED
+
+from xpython.pyobj import UNBOUND, WHY_RETURN
+
+# The kinds of register instruction. Each instruction is a tuple
+#
+#     (kind, dest, a, b, fn, exit)
+#
+# where `dest`, `a` and `b` are register numbers:
+#
+# CALL2     regs[dest] = fn(regs[a], regs[b])
+# MOVE      regs[dest] = regs[a]
+# BRANCH_IF_FALSE, BRANCH_IF_TRUE
+#           if regs[a] is false (or true), jump to the Target `b`
+# JUMP      jump to the Target `b`
+# CALL1     regs[dest] = fn(regs[a])
+# CALLN     regs[dest] = fn(*regs[a...]); `a` is a tuple of registers
+#           and `dest` is None if the result isn't kept
+# FOR_ITER  regs[dest] = next(regs[a]), or jump to the Target `b` if
+#           the iterator is exhausted
+# CHECK     leave through `exit` if local variable `a` isn't set
+# GLOBAL    regs[dest] = the global or builtin named `fn`, or leave
+#           through `exit` if there is none
+# MOVES     regs[dest...] = regs[a...] all at once; `dest` and `a` are
+#           tuples of registers
+# RETURN    return regs[a]
+# EXIT      leave through `exit`
+#
+# `exit`, if an instruction has one, is an Exit.
+(
+    CALL2,
+    MOVE,
+    BRANCH_IF_FALSE,
+    BRANCH_IF_TRUE,
+    JUMP,
+    CALL1,
+    CALLN,
+    FOR_ITER,
+    CHECK,
+    GLOBAL,
+    MOVES,
+    RETURN,
+    EXIT,
+) = range(13)
+
+KIND_NAMES = (
+    "CALL2",
+    "MOVE",
+    "BRANCH_IF_FALSE",
+    "BRANCH_IF_TRUE",
+    "JUMP",
+    "CALL1",
+    "CALLN",
+    "FOR_ITER",
+    "CHECK",
+    "GLOBAL",
+    "MOVES",
+    "RETURN",
+    "EXIT",
+)
+
+BRANCHES = (BRANCH_IF_FALSE, BRANCH_IF_TRUE)
+
+# Instructions whose result can be put straight into the register that
+# a following MOVE would copy it to.
+DEST_KINDS = frozenset((CALL2, CALL1, CALLN, FOR_ITER, GLOBAL))
+
+# Marks a block in RegisterCode.blocks that hasn't been translated yet.
+NOT_TRANSLATED = object()
+
+# The instruction families translated to CALL2 and CALL1, by the name
+# after BINARY_, INPLACE_ or UNARY_. These do what the operators in
+# xpython.byteop.byteop do. DIVIDE is left to the interpreter since what
+# it does depends on the bytecode version.
+BINARY_FUNCTIONS = {
+    "POWER": pow,
+    "MULTIPLY": operator.mul,
+    "MATRIX_MULTIPLY": operator.matmul,
+    "FLOOR_DIVIDE": operator.floordiv,
+    "TRUE_DIVIDE": operator.truediv,
+    "MODULO": operator.mod,
+    "ADD": operator.add,
+    "SUBTRACT": operator.sub,
+    "SUBSCR": operator.getitem,
+    "LSHIFT": operator.lshift,
+    "RSHIFT": operator.rshift,
+    "AND": operator.and_,
+    "XOR": operator.xor,
+    "OR": operator.or_,
+}
+
+INPLACE_FUNCTIONS = {
+    "POWER": operator.ipow,
+    "MULTIPLY": operator.imul,
+    "FLOOR_DIVIDE": operator.ifloordiv,
+    "TRUE_DIVIDE": operator.itruediv,
+    "MODULO": operator.imod,
+    "ADD": operator.iadd,
+    "SUBTRACT": operator.isub,
+    "LSHIFT": operator.ilshift,
+    "RSHIFT": operator.irshift,
+    "AND": operator.iand,
+    "XOR": operator.ixor,
+    "OR": operator.ior,
+}
+
+UNARY_FUNCTIONS = {
+    "POSITIVE": operator.pos,
+    "NEGATIVE": operator.neg,
+    "NOT": operator.not_,
+    "INVERT": operator.invert,
+}
+
+JUMP_OPS = frozenset(
+    """
+    JUMP_ABSOLUTE JUMP_FORWARD POP_JUMP_IF_FALSE POP_JUMP_IF_TRUE
+    JUMP_IF_FALSE_OR_POP JUMP_IF_TRUE_OR_POP FOR_ITER
+    """.split()
+)
+
+# Functions which constant folding may call on constant operands, and
+# the operand types it may call them with.
+FOLDABLE_FUNCTIONS = frozenset(
+    (
+        operator.add,
+        operator.sub,
+        operator.mul,
+        operator.truediv,
+        operator.floordiv,
+        operator.mod,
+        operator.lshift,
+        operator.rshift,
+        operator.and_,
+        operator.or_,
+        operator.xor,
+        operator.lt,
+        operator.le,
+        operator.eq,
+        operator.ne,
+        operator.gt,
+        operator.ge,
+        operator.neg,
+        operator.pos,
+        operator.invert,
+        operator.not_,
+        pow,
+    )
+)
+FOLDABLE_TYPES = (int, float, bool)
+
+# Folding stops short of making numbers bigger than this, so that the
+# folding itself doesn't take long.
+MAX_FOLDED_BITS = 128
+
+
+def build_tuple(*items):
+    return items
+
+
+def build_list(*items):
+    return list(items)
+
+
+class Exit(object):
+    """Where register code leaves for the interpreter: the bytecode
+    offset, and the registers holding what is on the value stack."""
+
+    __slots__ = ("offset", "stack")
+
+    def __init__(self, offset: int, stack: tuple):
+        self.offset = offset
+        self.stack = stack
+
+    def __repr__(self):
+        return f"Exit({self.offset}, {self.stack})"
+
+
+class Target(list):
+    """Where a jump in register code goes: [offset, depth, ops], where
+    `ops` is the target block's instructions once it has been looked
+    up, or False if the target has no register code."""
+
+    def __init__(self, offset: int, depth: int):
+        super().__init__((offset, depth, None))
+
+
+class RegisterBlock(object):
+    __slots__ = ("depth", "ops")
+
+    def __init__(self, depth: int, ops: list):
+        # The stack depth on entering the block.
+        self.depth = depth
+        self.ops = ops
+
+
+class RegisterCode(object):
+    """The register code for a code object, and the interpreter for it.
+    Registers hold the frame's local variables, one entry for each stack
+    slot, and the constants. Blocks are translated as they are first
+    run, and then optimized by OPTIMIZATIONS. Leaving through an Exit
+    stores the registers back in the frame, so the interpreter carries
+    on as if it had run the bytecode itself."""
+
+    def __init__(self, vm, decoded):
+        self.vm = vm
+        self.decoded = decoded
+        code = decoded.code
+        self.nlocals = len(code.co_varnames)
+        self.stacksize = code.co_stacksize
+        # Registers for constants follow those for locals and the stack.
+        self.const_base = self.nlocals + self.stacksize
+        self.constants = list(code.co_consts)
+        self.names: Dict[str, int] = {}
+        # Blocks by the offset they start at, or None for an offset
+        # that register code can't start at. The extra entry at the end
+        # is for running off the end of the code.
+        unfused = decoded.unfused
+        self.blocks: list = [NOT_TRANSLATED] * len(unfused) + [None]
+        self.targets = set()
+        for offset, inst in enumerate(unfused):
+            if inst is None or inst.offset != offset:
+                self.blocks[offset] = None
+            elif inst.opname in JUMP_OPS:
+                self.targets.add(unfused[inst.arguments[0]].offset)
+        # LOAD_GLOBAL may also push a NULL starting in 3.11.
+        self.translate_globals = vm.version[:2] < (3, 11)
+
+    def const_register(self, value) -> int:
+        self.constants.append(value)
+        return self.const_base + len(self.constants) - 1
+
+    def name_register(self, name: str) -> int:
+        register = self.names.get(name)
+        if register is None:
+            register = self.names[name] = self.const_register(name)
+        return register
+
+    def is_temporary(self, register: int) -> bool:
+        return self.nlocals <= register < self.const_base
+
+    def is_constant(self, register: int) -> bool:
+        return register >= self.const_base
+
+    def constant(self, register: int):
+        return self.constants[register - self.const_base]
+
+    def block(self, offset: int, depth: int) -> Optional[RegisterBlock]:
+        """Return the block starting at `offset` with `depth` entries on
+        the stack, translating it if that hasn't been done yet."""
+        block = self.blocks[offset]
+        if block is NOT_TRANSLATED:
+            block = self.blocks[offset] = self.translate(offset, depth)
+        if block is None or block.depth != depth:
+            return None
+        return block
+
+    def translate(self, offset: int, depth: int) -> Optional[RegisterBlock]:
+        """Translate the block starting at `offset`, run the
+        optimizations over it, and return it. None is returned if the
+        first instruction has no register form."""
+        jit = self.decoded.jit
+        if jit is not None and offset in jit.entries:
+            # Leave these to the JIT's handler.
+            return None
+        ops = BlockTranslator(self, offset, depth).translate()
+        if ops[0][0] == EXIT:
+            return None
+        for optimization in OPTIMIZATIONS:
+            ops = optimization(self, ops)
+        return RegisterBlock(depth, [tuple(op) for op in ops])
+
+    def link(self, target: Target):
+        """Look up the instructions of the block that `target` jumps to."""
+        block = self.block(target[0], target[1])
+        target[2] = False if block is None else block.ops
+        return target[2]
+
+    def leave(self, frame, regs: list, exit: Exit, stack_pointer: int):
+        """Store the registers back into `frame` as they are at `exit`.
+        `stack_pointer` is the frame's stack pointer when the register
+        code was started."""
+        nlocals = self.nlocals
+        frame.fastlocals[:] = regs[:nlocals]
+        stack = frame.stack
+        depth = len(exit.stack)
+        stack[:depth] = [regs[register] for register in exit.stack]
+        if depth < stack_pointer:
+            stack[depth:stack_pointer] = [None] * (stack_pointer - depth)
+        frame.stack_pointer = depth
+        frame.f_lasti = exit.offset
+        frame.f_lineno = frame.line_table.line_number(exit.offset)
+
+    def run(self, frame, offset: int) -> Optional[int]:
+        """Run register code for `frame` from `offset` until it comes to
+        an instruction that the interpreter has to run. The frame is left
+        set to run that instruction, and None is returned. WHY_RETURN is
+        returned if the code returns. Exceptions are passed on with the
+        frame set as it is at the instruction that raised it.
+        """
+        stack_pointer = frame.stack_pointer
+        block = self.block(offset, stack_pointer)
+        if block is None or len(frame.stack) != self.stacksize:
+            frame.f_lasti = offset
+            return None
+        regs = frame.fastlocals + frame.stack + self.constants
+        f_globals = frame.f_globals
+        f_builtins = frame.f_builtins
+        ops = block.ops
+        i = 0
+        op = None
+        try:
+            while True:
+                op = ops[i]
+                kind, dest, a, b, fn, exit = op
+                i += 1
+                if kind == CALL2:
+                    regs[dest] = fn(regs[a], regs[b])
+                    continue
+                elif kind == MOVE:
+                    regs[dest] = regs[a]
+                    continue
+                elif kind == BRANCH_IF_FALSE:
+                    if regs[a]:
+                        continue
+                elif kind == BRANCH_IF_TRUE:
+                    if not regs[a]:
+                        continue
+                elif kind == JUMP:
+                    pass
+                elif kind == CALL1:
+                    regs[dest] = fn(regs[a])
+                    continue
+                elif kind == FOR_ITER:
+                    value = next(regs[a], UNBOUND)
+                    if value is not UNBOUND:
+                        regs[dest] = value
+                        continue
+                elif kind == CALLN:
+                    value = fn(*[regs[register] for register in a])
+                    if dest is not None:
+                        regs[dest] = value
+                    continue
+                elif kind == CHECK:
+                    if regs[a] is UNBOUND:
+                        break
+                    continue
+                elif kind == GLOBAL:
+                    value = f_globals.get(fn, UNBOUND)
+                    if value is UNBOUND:
+                        value = f_builtins.get(fn, UNBOUND)
+                        if value is UNBOUND:
+                            break
+                    regs[dest] = value
+                    continue
+                elif kind == MOVES:
+                    values = [regs[register] for register in a]
+                    for register, value in zip(dest, values):
+                        regs[register] = value
+                    continue
+                elif kind == RETURN:
+                    self.vm.return_value = regs[a]
+                    if frame.generator:
+                        frame.generator.finished = True
+                    self.leave(frame, regs, exit, stack_pointer)
+                    return WHY_RETURN
+                else:
+                    break
+
+                # Jump to the Target `b`.
+                ops = b[2]
+                if ops is None:
+                    ops = self.link(b)
+                if ops is False:
+                    exit = Exit(b[0], tuple(range(self.nlocals, self.nlocals + b[1])))
+                    break
+                i = 0
+                if len(regs) < self.const_base + len(self.constants):
+                    # Translating the block has added constants.
+                    regs += self.constants[len(regs) - self.const_base :]
+        except Exception:
+            if op[5] is not None:
+                self.leave(frame, regs, op[5], stack_pointer)
+            raise
+        self.leave(frame, regs, exit, stack_pointer)
+        return None
+
+    def format_block(self, offset: int) -> str:
+        """Return a listing of the block at `offset`, for debugging."""
+        block = self.blocks[offset]
+        if block is NOT_TRANSLATED or block is None:
+            return ""
+        lines = []
+        for kind, dest, a, b, fn, exit in block.ops:
+            fields = [KIND_NAMES[kind]]
+            if dest is not None:
+                fields.append(f"{self.register_name(dest)} <-")
+            if fn is not None:
+                fields.append(getattr(fn, "__name__", repr(fn)))
+            if isinstance(a, tuple):
+                fields.append(", ".join(map(self.register_name, a)))
+            elif a is not None:
+                fields.append(self.register_name(a))
+            if b is not None:
+                if isinstance(b, Target):
+                    fields.append(f"to {b[0]}")
+                else:
+                    fields.append(self.register_name(b))
+            lines.append(" ".join(fields))
+        return "\n".join(lines)
+
+    def register_name(self, register) -> str:
+        if isinstance(register, tuple):
+            return "(%s)" % ", ".join(map(self.register_name, register))
+        if register < self.nlocals:
+            return self.decoded.code.co_varnames[register]
+        elif register < self.const_base:
+            return f"s{register - self.nlocals}"
+        return repr(self.constant(register))
+
+
+class BlockTranslator(object):
+    """Translates a block of bytecode into register instructions, with
+    each stack slot in a register of its own."""
+
+    def __init__(self, code: RegisterCode, offset: int, depth: int):
+        self.code = code
+        self.offset = offset
+        self.depth = depth
+        self.ops: List[list] = []
+        # Local variables known to be set at this point of the block.
+        self.bound = set()
+        # The highest stack entry used so far.
+        self.highest = depth - 1
+
+    def slot(self, i: int) -> int:
+        """The register for stack entry `i`, counting from the bottom."""
+        if i > self.highest:
+            self.highest = i
+        return self.code.nlocals + i
+
+    def stack(self, depth: int) -> tuple:
+        return tuple(range(self.code.nlocals, self.code.nlocals + depth))
+
+    def emit(self, kind, dest=None, a=None, b=None, fn=None, exit=None):
+        self.ops.append([kind, dest, a, b, fn, exit])
+
+    def translate(self) -> List[list]:
+        code = self.code
+        unfused = code.decoded.unfused
+        offset = self.offset
+        depth = self.depth
+        while True:
+            inst = unfused[offset] if offset < len(unfused) else None
+            if inst is None:
+                self.emit(EXIT, exit=Exit(offset, self.stack(depth)))
+                return self.ops
+            if offset != self.offset and offset in code.targets:
+                self.emit(JUMP, b=Target(offset, depth))
+                return self.ops
+            count = len(self.ops)
+            new_depth = self.translate_instruction(inst, depth)
+            if self.highest >= code.stacksize:
+                # Generator frames can start with more on the stack than
+                # co_stacksize allows for; leave those to the interpreter
+                # rather than spill into the constant registers.
+                del self.ops[count:]
+                self.emit(EXIT, exit=Exit(inst.offset, self.stack(depth)))
+                return self.ops
+            if new_depth is None:
+                return self.ops
+            depth = new_depth
+            offset = inst.next_offset
+
+    def translate_instruction(self, inst, d: int) -> Optional[int]:
+        """Emit register instructions for `inst`, which has `d` entries
+        on the stack before it. Return the depth after it, or None if
+        it ends the block."""
+        code = self.code
+        emit = self.emit
+        opname = inst.opname
+        arg = inst.int_arg
+        offset = inst.offset
+        slot = self.slot
+        exit = Exit(offset, self.stack(d))
+
+        if opname == "LOAD_FAST":
+            cfg = code.decoded.cfg
+            if arg not in self.bound and not (cfg and cfg.is_assigned(offset, arg)):
+                emit(CHECK, a=arg, exit=exit)
+                self.bound.add(arg)
+            emit(MOVE, slot(d), arg)
+            return d + 1
+        elif opname == "STORE_FAST":
+            emit(MOVE, arg, slot(d - 1))
+            self.bound.add(arg)
+            return d - 1
+        elif opname == "LOAD_CONST":
+            if arg is None:
+                # A constant the peephole optimizer has folded.
+                emit(MOVE, slot(d), code.const_register(inst.arguments[0]))
+            else:
+                emit(MOVE, slot(d), code.const_base + arg)
+            return d + 1
+        elif opname == "POP_TOP":
+            return d - 1
+        elif opname == "NOP":
+            return d
+        elif opname.startswith("BINARY_") and opname[7:] in BINARY_FUNCTIONS:
+            fn = BINARY_FUNCTIONS[opname[7:]]
+            emit(CALL2, slot(d - 2), slot(d - 2), slot(d - 1), fn, exit)
+            return d - 1
+        elif opname.startswith("INPLACE_") and opname[8:] in INPLACE_FUNCTIONS:
+            fn = INPLACE_FUNCTIONS[opname[8:]]
+            emit(CALL2, slot(d - 2), slot(d - 2), slot(d - 1), fn, exit)
+            return d - 1
+        elif opname.startswith("UNARY_") and opname[6:] in UNARY_FUNCTIONS:
+            fn = UNARY_FUNCTIONS[opname[6:]]
+            emit(CALL1, slot(d - 1), slot(d - 1), fn=fn, exit=exit)
+            return d
+        elif opname in ("COMPARE_OP", "IS_OP", "CONTAINS_OP"):
+            # The exception-matching comparison is left to the interpreter.
+            if opname == "COMPARE_OP" and arg >= 10:
+                emit(EXIT, exit=exit)
+                return None
+            index = {"COMPARE_OP": 0, "IS_OP": 8, "CONTAINS_OP": 6}[opname] + arg
+            fn = code.vm.byteop.COMPARE_OPERATORS[index]
+            emit(CALL2, slot(d - 2), slot(d - 2), slot(d - 1), fn, exit)
+            return d - 1
+        elif opname == "LOAD_GLOBAL" and code.translate_globals:
+            emit(GLOBAL, slot(d), fn=inst.arguments[0], exit=exit)
+            return d + 1
+        elif opname == "LOAD_ATTR":
+            name = code.name_register(inst.arguments[0])
+            emit(CALL2, slot(d - 1), slot(d - 1), name, getattr, exit)
+            return d
+        elif opname == "STORE_ATTR":
+            name = code.name_register(inst.arguments[0])
+            emit(CALLN, a=(slot(d - 1), name, slot(d - 2)), fn=setattr, exit=exit)
+            return d - 2
+        elif opname == "STORE_SUBSCR":
+            sources = (slot(d - 2), slot(d - 1), slot(d - 3))
+            emit(CALLN, a=sources, fn=operator.setitem, exit=exit)
+            return d - 3
+        elif opname == "DELETE_SUBSCR":
+            sources = (slot(d - 2), slot(d - 1))
+            emit(CALLN, a=sources, fn=operator.delitem, exit=exit)
+            return d - 2
+        elif opname == "DUP_TOP":
+            emit(MOVE, slot(d), slot(d - 1))
+            return d + 1
+        elif opname == "DUP_TOP_TWO":
+            emit(MOVE, slot(d), slot(d - 2))
+            emit(MOVE, slot(d + 1), slot(d - 1))
+            return d + 2
+        elif opname == "ROT_TWO":
+            emit(MOVES, (slot(d - 2), slot(d - 1)), (slot(d - 1), slot(d - 2)))
+            return d
+        elif opname == "ROT_THREE":
+            dests = (slot(d - 3), slot(d - 2), slot(d - 1))
+            emit(MOVES, dests, (slot(d - 1), slot(d - 3), slot(d - 2)))
+            return d
+        elif opname in ("BUILD_TUPLE", "BUILD_LIST"):
+            fn = build_tuple if opname == "BUILD_TUPLE" else build_list
+            emit(CALLN, slot(d - arg), self.stack(d)[d - arg :], fn=fn, exit=exit)
+            return d - arg + 1
+        elif opname == "LIST_APPEND" and code.vm.version[:2] >= (2, 7):
+            sources = (slot(d - 1 - arg), slot(d - 1))
+            emit(CALLN, a=sources, fn=list.append, exit=exit)
+            return d - 1
+        elif opname == "GET_ITER":
+            emit(CALL1, slot(d - 1), slot(d - 1), fn=iter, exit=exit)
+            return d
+        elif opname == "FOR_ITER":
+            target = Target(self.target(inst), d - 1)
+            emit(FOR_ITER, slot(d), slot(d - 1), target, exit=exit)
+            return d + 1
+        elif opname in ("JUMP_ABSOLUTE", "JUMP_FORWARD"):
+            emit(JUMP, b=Target(self.target(inst), d))
+            return None
+        elif opname in ("POP_JUMP_IF_FALSE", "POP_JUMP_IF_TRUE"):
+            kind = BRANCH_IF_FALSE if opname == "POP_JUMP_IF_FALSE" else BRANCH_IF_TRUE
+            emit(kind, a=slot(d - 1), b=Target(self.target(inst), d - 1), exit=exit)
+            return d - 1
+        elif opname in ("JUMP_IF_FALSE_OR_POP", "JUMP_IF_TRUE_OR_POP"):
+            kind = (
+                BRANCH_IF_FALSE if opname == "JUMP_IF_FALSE_OR_POP" else BRANCH_IF_TRUE
+            )
+            emit(kind, a=slot(d - 1), b=Target(self.target(inst), d), exit=exit)
+            return d - 1
+        elif opname == "RETURN_VALUE":
+            emit(RETURN, a=slot(d - 1), exit=Exit(offset, self.stack(d - 1)))
+            return None
+        emit(EXIT, exit=exit)
+        return None
+
+    def target(self, inst) -> int:
+        return self.code.decoded.unfused[inst.arguments[0]].offset
+
+
+def uses(op) -> list:
+    """The registers that `op` reads, not counting the stack entries
+    that a jump passes on."""
+    kind, _, a, b, _, exit = op
+    if kind in (CALLN, MOVES):
+        registers = list(a)
+    elif kind in (JUMP, GLOBAL, EXIT):
+        registers = []
+    else:
+        registers = [a]
+    if kind == CALL2:
+        registers.append(b)
+    if exit is not None:
+        registers.extend(exit.stack)
+    return registers
+
+
+def defines(op) -> tuple:
+    """The registers that `op` writes."""
+    dest = op[1]
+    if dest is None:
+        return ()
+    return dest if op[0] == MOVES else (dest,)
+
+
+def replace_uses(op: list, replacements: Dict[int, int]):
+    """Change the registers that `op` reads which are keys of
+    `replacements` to their values."""
+    kind, _, a, b, _, exit = op
+    get = replacements.get
+    if kind in (CALLN, MOVES):
+        op[2] = tuple(get(register, register) for register in a)
+    elif a is not None:
+        op[2] = get(a, a)
+    if kind == CALL2:
+        op[3] = get(b, b)
+    if exit is not None:
+        stack = tuple(get(register, register) for register in exit.stack)
+        op[5] = Exit(exit.offset, stack)
+
+
+def copy_propagation(code: RegisterCode, ops: List[list]) -> List[list]:
+    """Replace the use of a register that has been copied from another
+    by a MOVE with the register it was copied from, as long as neither
+    has been changed since."""
+    is_temporary = code.is_temporary
+    is_constant = code.is_constant
+    copies: Dict[int, int] = {}
+
+    for op in ops:
+        if copies:
+            replace_uses(op, copies)
+        for register in defines(op):
+            for dest, copied in list(copies.items()):
+                if register == dest or register == copied:
+                    del copies[dest]
+        if op[0] == MOVE:
+            dest, copied = op[1], op[2]
+            # Copies into local variables are only followed for
+            # constants. Otherwise we would keep stack slots in use
+            # that dead_store_elimination() can get rid of.
+            if is_temporary(dest) or is_constant(copied):
+                copies[dest] = copied
+    return [op for op in ops if op[0] != MOVE or op[1] != op[2]]
+
+
+def constant_folding(code: RegisterCode, ops: List[list]) -> List[list]:
+    """Work out operations on constants, and branches on them, ahead of
+    time. Checks of local variables that are now known to be set are
+    removed."""
+    is_constant = code.is_constant
+    # Registers known to hold a constant, and the constant's register.
+    known: Dict[int, int] = {}
+    folded = []
+    for op in ops:
+        if known:
+            replace_uses(op, known)
+            for register in defines(op):
+                known.pop(register, None)
+        kind, dest, a, b, fn, exit = op
+        if kind in (CALL2, CALL1) and fn in FOLDABLE_FUNCTIONS:
+            if kind == CALL2:
+                operands = (a, b)
+            else:
+                operands = (a,)
+            if all(map(is_constant, operands)):
+                values = [code.constant(operand) for operand in operands]
+                value = fold(fn, values)
+                if value is not UNBOUND:
+                    register = code.const_register(value)
+                    folded.append([MOVE, dest, register, None, None, None])
+                    known[dest] = register
+                    continue
+        elif kind == MOVE and is_constant(a):
+            known[dest] = a
+        elif kind == CHECK and is_constant(a):
+            continue
+        elif kind in BRANCHES and is_constant(a):
+            value = code.constant(a)
+            if type(value) in FOLDABLE_TYPES + (str, type(None)):
+                if bool(value) == (kind == BRANCH_IF_TRUE):
+                    folded.append([JUMP, None, None, b, None, None])
+                    # Nothing after an unconditional jump is run.
+                    return folded
+                continue
+        folded.append(op)
+    return folded
+
+
+def fold(fn, values: list):
+    """Return fn(*values) if it is safe to work out ahead of time, or
+    UNBOUND."""
+    for value in values:
+        if type(value) not in FOLDABLE_TYPES:
+            return UNBOUND
+    if fn in (pow, operator.lshift) and not (
+        isinstance(values[1], int) and 0 <= values[1] <= MAX_FOLDED_BITS
+    ):
+        return UNBOUND
+    try:
+        value = fn(*values)
+    except Exception:
+        # Leave the exception to be raised when the code is run.
+        return UNBOUND
+    if isinstance(value, int) and value.bit_length() > MAX_FOLDED_BITS:
+        return UNBOUND
+    return value
+
+
+def dead_store_elimination(code: RegisterCode, ops: List[list]) -> List[list]:
+    """Remove copies to stack slots that are never read, and put the
+    result of an instruction straight into the register that a MOVE
+    then copies it to."""
+    is_temporary = code.is_temporary
+    live = set()
+    kept: List[list] = []
+    i = len(ops)
+    while i:
+        i -= 1
+        op = ops[i]
+        kind, dest = op[0], op[1]
+        if kind in (JUMP, FOR_ITER) or kind in BRANCHES:
+            target = op[3]
+            live.update(range(code.nlocals, code.nlocals + target[1]))
+        if kind == MOVE and is_temporary(dest) and dest not in live:
+            continue
+        if (
+            kind == MOVE
+            and is_temporary(op[2])
+            and op[2] not in live
+            and i
+            and ops[i - 1][0] in DEST_KINDS
+            and ops[i - 1][1] == op[2]
+        ):
+            # Put the result of the previous instruction where the MOVE
+            # would copy it to.
+            live.discard(dest)
+            op = ops[i - 1]
+            op[1] = dest
+            i -= 1
+            dest = op[1]
+        for register in defines(op):
+            live.discard(register)
+        live.update(register for register in uses(op) if is_temporary(register))
+        kept.append(op)
+    kept.reverse()
+    return kept
+
+
+# The optimizations run over each block, in order.
+OPTIMIZATIONS = (
+    copy_propagation,
+    constant_folding,
+    copy_propagation,
+    dead_store_elimination,
+)
+
+
+class RegisterTranslator(object):
+    """Gives newly decoded code for a PyVM a RegisterCode, stored as the
+    DecodedCode's `registers`."""
+
+    def __init__(self, vm):
+        self.vm = vm
+
+    def __call__(self, decoded):
+        flags = decoded.code.co_flags
+        if flags & (CO_OPTIMIZED | CO_NEWLOCALS) == CO_OPTIMIZED | CO_NEWLOCALS:
+            decoded.registers = RegisterCode(self.vm, decoded)
@@ -0,0 +1,307 @@
+"""Superinstructions: running common instruction sequences as one."""
+
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from xdis import CO_OPTIMIZED, Bytecode, iscode
+
+# Instructions whose handlers only work on the stack, locals and names:
+# they never jump and never return a "why" value. Any but the last
+# instruction of a superinstruction must be one of these.
+FUSIBLE_PREFIX_OPS = frozenset(
+    """
+    LOAD_FAST LOAD_CONST LOAD_NAME LOAD_GLOBAL LOAD_ATTR LOAD_DEREF
+    LOAD_CLOSURE LOAD_METHOD STORE_FAST STORE_NAME STORE_ATTR STORE_SUBSCR
+    STORE_DEREF POP_TOP DUP_TOP ROT_TWO ROT_THREE COMPARE_OP IS_OP
+    CONTAINS_OP BINARY_ADD BINARY_SUBTRACT BINARY_MULTIPLY
+    BINARY_TRUE_DIVIDE BINARY_FLOOR_DIVIDE BINARY_MODULO BINARY_SUBSCR
+    INPLACE_ADD INPLACE_SUBTRACT INPLACE_MULTIPLY BUILD_TUPLE BUILD_LIST
+    GET_ITER
+    """.split()
+)
+
+# The sequences fused for each bytecode version, most frequent first.
+# Regenerate with admin-tools/mine-superinstructions.py --table.
+SUPERINSTRUCTIONS: Dict[Tuple[int, int], Tuple[Tuple[str, ...], ...]] = {
+    (2, 4): (
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_ATTR", "LOAD_FAST"),
+        ("LOAD_ATTR", "LOAD_FAST"),
+        ("LOAD_CONST", "LOAD_FAST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "BUILD_TUPLE"),
+    ),
+    (2, 5): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_CONST", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+        ("LOAD_FAST", "BUILD_TUPLE"),
+    ),
+    (2, 6): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_CONST", "CALL_FUNCTION"),
+        ("POP_TOP", "POP_TOP"),
+        ("LOAD_ATTR", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+    ),
+    (2, 7): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_CONST", "CALL_FUNCTION"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+        ("LOAD_FAST", "RETURN_VALUE"),
+        ("LOAD_ATTR", "LOAD_CONST"),
+    ),
+    (3, 2): (
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_CONST", "CALL_FUNCTION"),
+        ("LOAD_GLOBAL", "LOAD_CONST"),
+        ("LOAD_FAST", "RETURN_VALUE"),
+        ("LOAD_CONST", "LOAD_FAST"),
+    ),
+    (3, 3): (
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_CONST", "CALL_FUNCTION"),
+        ("LOAD_CONST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_CONST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+    ),
+    (3, 4): (
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_CONST", "CALL_FUNCTION"),
+        ("LOAD_CONST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_CONST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+    ),
+    (3, 5): (
+        ("LOAD_CONST", "RETURN_VALUE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_CONST", "CALL_FUNCTION"),
+        ("LOAD_CONST", "LOAD_CONST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+    ),
+    (3, 6): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+        ("LOAD_ATTR", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("COMPARE_OP", "POP_JUMP_IF_FALSE"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_ATTR", "CALL_FUNCTION"),
+    ),
+    (3, 7): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("COMPARE_OP", "POP_JUMP_IF_FALSE"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_METHOD"),
+        ("LOAD_METHOD", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+    ),
+    (3, 8): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("COMPARE_OP", "POP_JUMP_IF_FALSE"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_METHOD"),
+        ("LOAD_METHOD", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+    ),
+    (3, 9): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_FAST", "LOAD_METHOD"),
+        ("LOAD_METHOD", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+        ("LOAD_FAST", "CALL_METHOD"),
+    ),
+    (3, 10): (
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_GLOBAL", "LOAD_FAST"),
+        ("LOAD_FAST", "LOAD_CONST"),
+        ("LOAD_FAST", "LOAD_METHOD"),
+        ("LOAD_METHOD", "LOAD_FAST"),
+        ("LOAD_FAST", "CALL_FUNCTION"),
+        ("LOAD_CONST", "RETURN_VALUE"),
+    ),
+    (3, 11): (
+        ("LOAD_GLOBAL", "CACHE"),
+        ("LOAD_ATTR", "CACHE"),
+        ("LOAD_METHOD", "CACHE"),
+        ("LOAD_FAST", "LOAD_ATTR"),
+        ("LOAD_FAST", "LOAD_ATTR", "CACHE"),
+        ("LOAD_FAST", "LOAD_FAST"),
+        ("LOAD_FAST", "PRECALL"),
+        ("LOAD_FAST", "LOAD_METHOD"),
+    ),
+}
+
+
+def code_objects(code) -> Iterable:
+    """Yield `code` and all of the code objects nested in it."""
+    yield code
+    for const in code.co_consts:
+        if iscode(const):
+            yield from code_objects(const)
+
+
+def count_sequences(code, opc, lengths=(2, 3), functions_only=True) -> Counter:
+    """Count the instruction sequences of the given `lengths` in `code`
+    and the code nested in it that could be fused.
+
+    Module and class bodies usually run only once, so unless
+    `functions_only` is False only function bodies are counted.
+    """
+    counts = Counter()
+    for co in code_objects(code):
+        if functions_only and not co.co_flags & CO_OPTIMIZED:
+            continue
+        instructions = [
+            inst for inst in Bytecode(co, opc) if inst.opname != "EXTENDED_ARG"
+        ]
+        for i in range(len(instructions)):
+            for n in lengths:
+                sequence = instructions[i : i + n]
+                if len(sequence) < n:
+                    break
+                if any(inst.starts_line is not None for inst in sequence[1:]):
+                    break
+                if any(inst.opname not in FUSIBLE_PREFIX_OPS for inst in sequence[:-1]):
+                    break
+                counts[tuple(inst.opname for inst in sequence)] += 1
+    return counts
+
+
+def make_superinstruction(vm, unfused, sequence):
+    """Return a handler that runs the instructions in `sequence`. The
+    handlers are taken from the `unfused` instruction list each time
+    since quickening can change them."""
+    first = sequence[0].offset
+    rest = tuple((inst.offset, inst.arguments) for inst in sequence[1:])
+    if len(rest) == 1:
+        ((second, second_args),) = rest
+
+        def superinstruction(*args):
+            unfused[first].handler(*args)
+            vm.frame.f_lasti = second
+            return unfused[second].handler(*second_args)
+
+    else:
+
+        def superinstruction(*args):
+            unfused[first].handler(*args)
+            frame = vm.frame
+            why = None
+            for offset, arguments in rest:
+                frame.f_lasti = offset
+                why = unfused[offset].handler(*arguments)
+            return why
+
+    return superinstruction
+
+
+class Fuser(object):
+    """Fuses instruction sequences into superinstructions in newly
+    decoded code for a PyVM. Only the first instruction of a sequence
+    is replaced, so jumps to the others still work, and none of the
+    others may start a line. Any but the last instruction of a sequence
+    must be in FUSIBLE_PREFIX_OPS, as only the last one's "why" result is
+    kept."""
+
+    def __init__(self, vm, sequences=None):
+        self.vm = vm
+        if sequences is None:
+            sequences = SUPERINSTRUCTIONS.get(tuple(vm.version[:2]), ())
+        for sequence in sequences:
+            for opname in sequence[:-1]:
+                if opname not in FUSIBLE_PREFIX_OPS:
+                    raise ValueError(
+                        f"{opname} can only end a superinstruction; got {sequence!r}"
+                    )
+        # Longest sequences first so that they are preferred.
+        self.sequences = sorted(sequences, key=len, reverse=True)
+
+    def __call__(self, decoded):
+        if not self.sequences:
+            return
+        unfused = decoded.unfused
+        instructions = None
+        n = len(unfused)
+        offset = 0
+        while offset < n:
+            inst = unfused[offset]
+            if inst is None:
+                # Code the peephole optimizer has dropped, or a
+                # truncated instruction at the end.
+                offset += 1
+                continue
+            sequence = self.match(unfused, inst)
+            if sequence is None:
+                offset = inst.next_offset
+                continue
+            if instructions is None:
+                instructions = decoded.instructions = list(unfused)
+            fused = inst._replace(
+                handler=make_superinstruction(self.vm, unfused, sequence)
+            )
+            # EXTENDED_ARG prefixes map to the instruction they prefix.
+            for i in range(offset, inst.offset + 1):
+                if unfused[i] is inst:
+                    instructions[i] = fused
+            decoded.superinstructions[inst.offset] = tuple(
+                inst.opname for inst in sequence
+            )
+            offset = sequence[-1].next_offset
+
+    def match(self, unfused, inst):
+        """Return the list of instructions starting with `inst` that make
+        up one of our sequences, or None."""
+        for names in self.sequences:
+            if inst.opname != names[0]:
+                continue
+            sequence = [inst]
+            for name in names[1:]:
+                prev = sequence[-1]
+                if prev.handler is None or prev.next_offset >= len(unfused):
+                    break
+                following = unfused[prev.next_offset]
+                if (
+                    following is None
+                    or following.opname != name
+                    or following.line_number is not None
+                    or following.handler is None
+                ):
+                    break
+                sequence.append(following)
+            else:
+                return sequence
+        return None
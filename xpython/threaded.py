@@ -0,0 +1,110 @@
+"""Closure-threaded code: an alternative to the eval_frame() dispatch loop."""
+
+from typing import Callable, List, Optional
+
+# Instructions whose handlers may return a "why" value, which only the
+# eval_frame() loop can act on. A handler added for a new instruction
+# that returns a "why" value must be listed here.
+UNTHREADED_OPS = frozenset(
+    """
+    BREAK_LOOP BRKPT CALL CALL_FUNCTION CALL_FUNCTION_EX CALL_FUNCTION_KW
+    CALL_FUNCTION_VAR CALL_FUNCTION_VAR_KW CALL_METHOD CALL_METHOD_KW
+    CONTINUE_LOOP END_FINALLY GET_AITER GET_ANEXT IMPORT_FROM POP_FINALLY
+    RAISE_VARARGS RERAISE RETURN_VALUE WITH_CLEANUP_FINISH YIELD_FROM
+    YIELD_VALUE
+    """.split()
+)
+
+
+def make_threaded_op(vm, inst, handler: Callable) -> Callable:
+    """Return a closure that runs `inst` with `handler` and returns the
+    offset of the instruction to run next."""
+    offset = inst.offset
+    following = inst.next_offset
+    arguments = inst.arguments
+    line_number = inst.line_number
+
+    # A handler that jumps sets the frame's f_lasti to the jump target
+    # and clears its `fallthrough`.
+    if line_number is None:
+
+        def threaded_op():
+            frame = vm.frame
+            frame.f_lasti = offset
+            handler(*arguments)
+            if frame.fallthrough:
+                return following
+            frame.fallthrough = True
+            return frame.f_lasti
+
+    else:
+
+        def threaded_op():
+            frame = vm.frame
+            frame.f_lasti = offset
+            frame.f_lineno = line_number
+            handler(*arguments)
+            if frame.fallthrough:
+                return following
+            frame.fallthrough = True
+            return frame.f_lasti
+
+    return threaded_op
+
+
+def make_dynamic_threaded_op(vm, inst, unfused) -> Callable:
+    """Like make_threaded_op(), but the handler is fetched from the
+    `unfused` instruction list each time, since an earlier pass such as
+    quickening may change it."""
+    offset = inst.offset
+    following = inst.next_offset
+    arguments = inst.arguments
+    line_number = inst.line_number
+
+    def threaded_op():
+        frame = vm.frame
+        frame.f_lasti = offset
+        if line_number is not None:
+            frame.f_lineno = line_number
+        unfused[offset].handler(*arguments)
+        if frame.fallthrough:
+            return following
+        frame.fallthrough = True
+        return frame.f_lasti
+
+    return threaded_op
+
+
+class Threader(object):
+    """Translates newly decoded code for a PyVM into threaded code,
+    stored as the DecodedCode's `threaded` list. Each entry is a closure
+    that runs its instruction and returns the offset of the one to run
+    next; see PyVM.run_threaded(). Instructions in UNTHREADED_OPS get
+    None and are run by the classic loop."""
+
+    def __init__(self, vm):
+        self.vm = vm
+
+    def __call__(self, decoded):
+        vm = self.vm
+        dispatch_table = vm.dispatch_table
+        unfused = decoded.unfused
+        # One more entry than there are offsets, so that running off the
+        # end of the code goes back to the classic loop, which reports it.
+        threaded: List[Optional[Callable]] = [None] * (len(unfused) + 1)
+        made = {}
+        for offset, inst in enumerate(unfused):
+            if inst is None or inst.handler is None:
+                continue
+            if inst.opname in UNTHREADED_OPS:
+                continue
+            op = made.get(inst.offset)
+            if op is None:
+                if inst.handler is dispatch_table[inst.opcode]:
+                    op = make_threaded_op(vm, inst, inst.handler)
+                else:
+                    op = make_dynamic_threaded_op(vm, inst, unfused)
+                made[inst.offset] = op
+            # EXTENDED_ARG prefixes map to the instruction they prefix.
+            threaded[offset] = op
+        decoded.threaded = threaded
@@ -0,0 +1,246 @@
+"""A static verifier for bytecode: code objects are checked once before
+they are run, and what a compiler wouldn't produce is rejected."""
+
+import dis
+from typing import Dict, Iterator, Tuple
+
+from xdis import code2num, iscode, next_offset, op_has_argument
+
+from xpython.decode import decode_code
+from xpython.flowgraph import (
+    NO_FALLTHROUGH_OPS,
+    ControlFlowGraph,
+    stack_depths_known,
+)
+
+
+class VerifyError(Exception):
+    """Raised when bytecode fails verification. `code` is the code
+    object, and `offset` and `opname` are those of the instruction that
+    is at fault, if there is one."""
+
+    def __init__(self, message: str, code=None, offset=None, opname=None):
+        super().__init__(message)
+        self.code = code
+        self.offset = offset
+        self.opname = opname
+
+
+def describe(code) -> str:
+    """How errors refer to the code object `code`."""
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def scan(opc, version: tuple, co_code) -> Iterator[Tuple[int, int, int, int, int]]:
+    """Yield (start, offset, opcode, int_arg, next) for each instruction in
+    `co_code`, where `start` is the offset of its first EXTENDED_ARG
+    prefix, if it has any, and `offset` that of the instruction itself.
+    This follows decode_instruction() but doesn't look at the operand.
+
+    A truncated instruction at the end of the code is yielded with a
+    `next` past the end of the code.
+    """
+    n = len(co_code)
+    offset = 0
+    while offset < n:
+        start = offset
+        extended_arg = 0
+        while True:
+            opcode = code2num(co_code, offset)
+            following = next_offset(opcode, opc, offset)
+            int_arg = None
+            if following > n:
+                break
+            if op_has_argument(opcode, opc):
+                if version[:2] >= (3, 6):
+                    int_arg = code2num(co_code, offset + 1) | extended_arg
+                    if opcode == opc.EXTENDED_ARG:
+                        extended_arg = int_arg << 8
+                        offset = following
+                        if offset < n:
+                            continue
+                else:
+                    int_arg = (
+                        code2num(co_code, offset + 1)
+                        + code2num(co_code, offset + 2) * 256
+                        + extended_arg
+                    )
+                    if opcode == opc.EXTENDED_ARG:
+                        extended_arg = int_arg * 65536
+                        offset = following
+                        if offset < n:
+                            continue
+            break
+        yield start, offset, opcode, int_arg, following
+        offset = following
+
+
+class Verifier(object):
+    """Checks code objects for a PyVM before they are run: that each
+    instruction is complete and known, its operands are in range, its
+    jumps go to instructions and, if it is the last and can be reached,
+    it doesn't go on past the end. Where stack depths are known, the
+    stack must stay between empty and co_stacksize. A failed check
+    raises VerifyError. Code for 3.11 and later isn't checked.
+
+    PyVM.run_code() verifies everything it is given with
+    verify_tree() when the verifier is one of its decode passes, and as
+    a decode pass the verifier checks any other code when it is first
+    run."""
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.opc = vm.opc
+        self.version = vm.version
+        self.enabled = vm.version[:2] < (3, 11)
+        self.check_depths = stack_depths_known(vm.opc, vm.version)
+        # Code objects which have been verified by verify_tree() but not
+        # yet decoded, by id(). Decoding them doesn't verify them again.
+        # This is emptied by forget().
+        self.verified: Dict[int, object] = {}
+
+    def __call__(self, decoded):
+        code = decoded.code
+        if self.verified.pop(id(code), None) is code:
+            return
+        self.verify(code, decoded.instructions)
+
+    def verify_tree(self, code):
+        """Verify `code` and the code objects in its constants,
+        recursively."""
+        pending = [code]
+        while pending:
+            code = pending.pop()
+            if (
+                self.verified.get(id(code)) is not code
+                and code not in self.vm.decode_cache
+            ):
+                self.verify(code)
+                self.verified[id(code)] = code
+            pending.extend(const for const in code.co_consts if iscode(const))
+
+    def forget(self):
+        """Let go of the code objects verify_tree() has verified but which
+        haven't been decoded. Those that are run later are verified when
+        they are decoded."""
+        self.verified.clear()
+
+    def error(self, code, offset: int, opcode: int, message: str):
+        opname = self.opc.opname[opcode]
+        raise VerifyError(
+            f"{describe(code)}: offset {offset}, {opname}: {message}",
+            code,
+            offset,
+            opname,
+        )
+
+    def verify(self, code, instructions=None):
+        """Raise VerifyError if `code` fails a check. `instructions`
+        are its decoded instructions, if they have been decoded."""
+        if not self.enabled:
+            return
+        last = self.check_instructions(code)
+        if last is None and not self.check_depths:
+            return
+        if instructions is None:
+            instructions = decode_code(self.opc, self.version, code, {})
+        cfg = ControlFlowGraph(self.opc, self.version, code, instructions)
+        if last is not None:
+            # Compilers can leave an unreachable instruction at the end,
+            # like the POP_TOP after a return in a finally clause.
+            offset, opcode = last
+            block = cfg.block_at(offset)
+            if block is not None and block.reachable:
+                self.error(code, offset, opcode, "goes on past the end of the code")
+        if self.check_depths:
+            self.check_stack(code, instructions, cfg)
+
+    def check_instructions(self, code):
+        """Check each instruction on its own, and where it jumps to.
+        Return the offset and opcode of the last instruction if it goes
+        on to the next one, and otherwise None."""
+        opc = self.opc
+        co_code = code.co_code
+        n = len(co_code)
+        starts = set()
+        jumps = []
+        opcode = None
+        bounds = (
+            (opc.CONST_OPS, len(code.co_consts), "constant"),
+            (opc.NAME_OPS, len(code.co_names), "name"),
+            (opc.LOCAL_OPS, len(code.co_varnames), "local variable"),
+            (opc.FREE_OPS, len(code.co_cellvars) + len(code.co_freevars), "cell"),
+        )
+        for start, offset, opcode, int_arg, following in scan(
+            opc, self.version, co_code
+        ):
+            starts.add(start)
+            starts.add(offset)
+            if following > n or opcode == opc.EXTENDED_ARG:
+                self.error(code, offset, opcode, "instruction is truncated")
+            if opc.opname[opcode].startswith("<"):
+                self.error(code, offset, opcode, f"unknown opcode {opcode}")
+            if int_arg is None:
+                continue
+            for ops, count, kind in bounds:
+                if opcode in ops:
+                    if int_arg >= count:
+                        self.error(
+                            code,
+                            offset,
+                            opcode,
+                            f"{kind} index {int_arg} is out of range; "
+                            f"there are {count}",
+                        )
+                    break
+            else:
+                if opcode in opc.JREL_OPS or opcode in opc.JABS_OPS:
+                    if self.version[:2] >= (3, 10):
+                        int_arg += int_arg
+                    target = int_arg
+                    if opcode in opc.JREL_OPS:
+                        target += following
+                    jumps.append((offset, opcode, target))
+        if opcode is None:
+            return None
+        last = (offset, opcode)
+        for offset, opcode, target in jumps:
+            if target not in starts:
+                if target >= n:
+                    where = "past the end of the code"
+                else:
+                    where = "in the middle of an instruction"
+                self.error(code, offset, opcode, f"jump target {target} is {where}")
+        if opc.opname[last[1]] in NO_FALLTHROUGH_OPS:
+            return None
+        return last
+
+    def check_stack(self, code, instructions, cfg):
+        """Check the stack depth before and after each instruction that
+        can be reached, where that is known. `cfg` is the code's
+        ControlFlowGraph."""
+        depths = cfg.stack_depths
+        if depths is None:
+            return
+        stacksize = code.co_stacksize
+        for offset in sorted(depths):
+            inst = instructions[offset]
+            int_arg = inst.int_arg if inst.opcode >= dis.HAVE_ARGUMENT else None
+            depth = depths[offset]
+            for jump in (False, True):
+                after = depth + dis.stack_effect(inst.opcode, int_arg, jump=jump)
+                if after < 0:
+                    self.error(
+                        code,
+                        offset,
+                        inst.opcode,
+                        f"takes the stack below empty; it has {depth} entries",
+                    )
+                if after > stacksize:
+                    self.error(
+                        code,
+                        offset,
+                        inst.opcode,
+                        f"needs a stack of {after} entries; "
+                        f"co_stacksize is {stacksize}",
+                    )
@@ -7,16 +7,55 @@ import os
 import sys
 
 import six
-from typing import List
+from typing import List, Optional
 from six.moves import reprlib
-from xdis import (CO_NEWLOCALS, IS_PYPY, PYTHON3, PYTHON_VERSION_TRIPLE,
-                  code2num, next_offset, op_has_argument)
-from xdis.cross_types import UnicodeForPython3
+from xdis import (
+    CO_NEWLOCALS,
+    CO_OPTIMIZED,
+    IS_PYPY,
+    PYTHON3,
+    PYTHON_VERSION_TRIPLE,
+    next_offset,
+)
 from xdis.op_imports import get_opcode_module
-from xdis.opcodes.opcode_311 import _nb_ops
 
+from xpython.aot import AOT
 from xpython.byteop import get_byteop
-from xpython.pyobj import Block, Frame, Traceback, traceback_from_frame
+from xpython.callsite import CallSites
+from xpython.decode import DEFAULT_MAX_INSTRUCTIONS, DecodeCache, decode_instruction
+from xpython.flowgraph import ControlFlowGraph, FlowAnalyzer
+from xpython.intrinsics import Intrinsics
+from xpython.jit import JIT
+from xpython.peephole import Peephole
+from xpython.pyobj import (
+    BLOCK_EXCEPT_HANDLER,
+    BLOCK_FINALLY,
+    BLOCK_LOOP,
+    BLOCK_SETUP_EXCEPT,
+    BLOCK_WITH,
+    WHY_BREAK,
+    WHY_CALL,
+    WHY_CONTINUE,
+    WHY_EXCEPTION,
+    WHY_NAMES,
+    WHY_RERAISE,
+    WHY_RETURN,
+    WHY_SILENCED,
+    WHY_YIELD,
+    Block,
+    Frame,
+    Traceback,
+    TracebackRecord,
+)
+from xpython.quicken import Quickener
+from xpython.register import RegisterTranslator
+from xpython.superinstructions import Fuser
+from xpython.threaded import Threader
+from xpython.verify import Verifier
+
+# The engines that PyVM can run code with. See xpython.threaded and
+# xpython.register.
+ENGINES = ("classic", "threaded", "register")
 
 PY2 = not PYTHON3
 log = logging.getLogger(__name__)
@@ -31,6 +70,9 @@ if PYTHON3:
 else:
     byteint = ord
 
+# The most returned frames PyVM.free_frame() keeps for a code object.
+FRAME_FREE_LIST_SIZE = 8
+
 LINE_NUMBER_WIDTH = 4
 LINE_NUMBER_WIDTH_FMT = "L. %%-%dd@" % LINE_NUMBER_WIDTH
 LINE_NUMBER_SPACES = " " * (LINE_NUMBER_WIDTH + len("L. ")) + "@"
@@ -58,9 +100,16 @@ class PyVMUncaughtException(Exception):
 
     def __init__(self, name, args, traceback=None):
         self.__name__ = name
-        self.traceback = traceback
+        self._traceback = traceback
         self.args = args
 
+    @property
+    def traceback(self):
+        tb = self._traceback
+        if isinstance(tb, TracebackRecord):
+            tb = self._traceback = tb.to_traceback()
+        return tb
+
     def __getattr__(self, name):
         if name == "__traceback__":
             return self.traceback
@@ -119,7 +168,9 @@ def format_instruction(
         argrepr = ""
     elif byte_code in opc.COMPARE_OPS:
         argrepr = opc.cmp_op[int_arg]
-    elif isinstance(arguments, list) and arguments:
+    elif byte_code in opc.LOCAL_OPS and code is not None:
+        argrepr = code.co_varnames[int_arg]
+    elif isinstance(arguments, (list, tuple)) and arguments:
         argrepr = arguments[0]
     else:
         argrepr = arguments
@@ -142,15 +193,42 @@ class PyVM(object):
         is_pypy=IS_PYPY,
         vmtest_testing=False,
         format_instruction_func=format_instruction,
+        max_decoded_instructions=DEFAULT_MAX_INSTRUCTIONS,
+        inline_calls=True,
+        quicken=True,
+        call_sites=True,
+        intrinsics=True,
+        frame_free_lists=True,
+        superinstructions=True,
+        engine="classic",
+        jit=True,
+        aot=False,
+        peephole=False,
+        dataflow=True,
+        verify=True,
     ):
+        if engine not in ENGINES:
+            raise ValueError(f"engine should be one of {ENGINES}; got {engine!r}")
+
         # The call stack of frames.
         self.frames: List[Frame] = []
+
+        # When True, a call from interpreted code to an interpreted
+        # function pushes the function's frame and runs it in the
+        # caller's eval_frame() loop, rather than in a nested one.
+        self.inline_calls = inline_calls
+        # The frame a call instruction has set up to be run this way.
+        self.call_frame = None
+        # The number of returned frames kept for reuse for each code
+        # object, or 0 if they aren't; see free_frame().
+        self.frame_free_list_size = FRAME_FREE_LIST_SIZE if frame_free_lists else 0
         # The current frame.
         self.frame = None
         self.return_value = None
         self.last_exception = None
         self.last_traceback_limit = None
-        self.last_traceback = None
+        # Where the most recent exception has been; see traceback_here().
+        self.traceback_record = None
         self.version = python_version
         self.is_pypy = is_pypy
         self.format_instruction = format_instruction_func
@@ -171,6 +249,8 @@ class PyVM(object):
 
         self.in_exception_processing = False
 
+        self.check_logging()
+
         # This is somewhat hokey:
         # Give byteop routines a way to raise an error, without having
         # to import this file. We import from from byteops.
@@ -186,6 +266,104 @@ class PyVM(object):
         self.opc = get_opcode_module(python_version, variant)
         self.byteop = get_byteop(self, python_version, is_pypy)
 
+        # A list indexed by opcode of the byteop methods that implement
+        # each opcode. Operator opcodes like BINARY_ADD have their operator
+        # already bound.
+        self.dispatch_table = self.byteop.dispatch_table(self.opc)
+
+        if XPYTHON_STACKCHECK:
+            self.push = self.push_stackcheck
+
+        # With `aot`, functions whose bytecode can be translated into
+        # Python source, which may be for another version of Python, are
+        # translated before they are run and run natively; see
+        # xpython.aot.
+        self.aot = AOT(self) if aot else None
+
+        # With `verify`, code is checked before it is run, and bytecode
+        # that a compiler wouldn't produce is rejected; see
+        # xpython.verify.
+        self.verifier = Verifier(self) if verify else None
+
+        # Code objects are decoded once into a list of instructions
+        # which is then reused every time the code is run.
+        # With `peephole`, jumps to jumps are threaded, constant
+        # expressions are folded and unreachable code is dropped. This
+        # is mostly of use for bytecode from older compilers.
+        # With `dataflow`, a control-flow graph is built and used to
+        # drop checks that can't fail; see xpython.flowgraph.
+        # With `quicken`, hot arithmetic, comparison and subscript
+        # instructions are specialized for the operand types they see.
+        # With `call_sites`, each call instruction caches how to call
+        # the kinds of callable it sees; see xpython.callsite.
+        # With `intrinsics`, calls to hot built-in functions such as
+        # len() are run directly on the stack; see xpython.intrinsics.
+        # With `superinstructions`, common instruction sequences are
+        # run as one.
+        # With the "threaded" `engine`, code is also translated into
+        # closures which are run without going through dispatch().
+        # With the "register" `engine`, functions are translated into
+        # optimized register code which is run by its own loop.
+        # With `jit`, hot functions are translated to Python source which
+        # is compiled and run natively, when we are running bytecode for
+        # the Python running us.
+        #
+        # The passes run in the order they are listed below. The verifier
+        # comes first, so the others only see code that has passed. The
+        # peephole optimizer changes the flow of control, so it comes
+        # before the control-flow graph is built. Quickening, call sites
+        # and intrinsics replace instruction handlers. Intrinsics come
+        # after call sites, so that calls which aren't intrinsics still
+        # use their site. Superinstructions, the engines and the JIT are
+        # built on the handlers the earlier passes give, and look them up
+        # in `unfused` where those can still change.
+        self.engine = engine
+        passes = []
+        if verify:
+            passes.append(self.verifier)
+        if peephole:
+            passes.append(Peephole(self))
+        if dataflow:
+            passes.append(FlowAnalyzer(self))
+        if quicken:
+            passes.append(Quickener(self))
+        if call_sites:
+            passes.append(CallSites(self))
+        if intrinsics:
+            passes.append(Intrinsics(self))
+        if superinstructions:
+            passes.append(Fuser(self))
+        if engine == "threaded":
+            passes.append(Threader(self))
+        elif engine == "register":
+            passes.append(RegisterTranslator(self))
+        if jit:
+            passes.append(JIT(self))
+        self.decode_cache = DecodeCache(
+            self.opc,
+            self.version,
+            get_handler=self.get_handler,
+            max_instructions=max_decoded_instructions,
+            passes=passes,
+        )
+
+    def control_flow_graph(self, code) -> ControlFlowGraph:
+        """Return the ControlFlowGraph for `code`, building it if that
+        hasn't been done yet. This is for tracers, debuggers and other
+        tools; see xpython.flowgraph."""
+        decoded = self.decode_cache.get(code)
+        if decoded.cfg is None:
+            decoded.cfg = ControlFlowGraph(
+                self.opc, self.version, code, decoded.unfused
+            )
+        return decoded.cfg
+
+    def get_handler(self, opcode: int, bytecode_name: str):
+        """Return the byteop method that implements `opcode`, or None if
+        there is none.
+        """
+        return self.dispatch_table[opcode]
+
     ##############################################
     # Frame operations. First the frame stack....
     ##############################################
@@ -194,15 +372,16 @@ class PyVM(object):
         Default to the top of the stack, but `i` can be a count from the top
         instead.
         """
-        return self.frame.stack[-1 - i]
+        frame = self.frame
+        return frame.stack[frame.stack_pointer - 1 - i]
 
     def peek(self, n):
         if n <= 0:
             raise PyVMError("Peek value must be greater than 0")
-        try:
-            return self.frame.stack[-n]
-        except Exception:
+        frame = self.frame
+        if n > frame.stack_pointer:
             return 0
+        return frame.stack[frame.stack_pointer - n]
 
     def pop(self, i=0):
         """Pop a value from the stack.
@@ -211,7 +390,21 @@ class PyVM(object):
         instead.
 
         """
-        return self.frame.stack.pop(-1 - i)
+        frame = self.frame
+        stack = frame.stack
+        sp = frame.stack_pointer - 1
+        if sp < 0:
+            raise IndexError("pop from empty stack")
+        if i:
+            pos = sp - i
+            val = stack[pos]
+            stack[pos:sp] = stack[pos + 1 : sp + 1]
+        else:
+            val = stack[sp]
+        # Drop the reference so the value can be freed.
+        stack[sp] = None
+        frame.stack_pointer = sp
+        return val
 
     def popn(self, n):
         """Pop a number of values from the value stack.
@@ -220,30 +413,67 @@ class PyVM(object):
 
         """
         if n:
-            ret = self.frame.stack[-n:]
-            self.frame.stack[-n:] = []
+            frame = self.frame
+            stack = frame.stack
+            sp = frame.stack_pointer
+            base = sp - n
+            if base < 0:
+                raise IndexError("pop from empty stack")
+            ret = stack[base:sp]
+            for i in range(base, sp):
+                stack[i] = None
+            frame.stack_pointer = base
             return ret
         else:
             return []
 
-    def push(self, *vals):
+    def push(self, val, *vals):
         """Push values onto the value stack."""
-        new_size = len(self.frame.stack) + len(vals)
-
-        if XPYTHON_STACKCHECK:
-            if new_size > self.frame.f_code.co_stacksize:
-                print(f"***Warning: exceeding declared max stacksize; have {new_size}, "
-                      f"max size: {self.f_code.co_stacksize}")
-
-        self.frame.stack.extend(vals)
+        frame = self.frame
+        sp = frame.stack_pointer
+        try:
+            frame.stack[sp] = val
+        except IndexError:
+            # More was pushed than co_stacksize says. Grow the stack.
+            frame.stack.append(val)
+        frame.stack_pointer = sp + 1
+        for val in vals:
+            self.push(val)
+
+    def push_stackcheck(self, val, *vals):
+        """Like push(), but warn if the frame's co_stacksize is exceeded.
+        This replaces push() when XPYTHON_STACKCHECK is set in the
+        environment. Code whose control-flow graph shows that it never
+        needs more than co_stacksize isn't checked.
+        """
+        frame = self.frame
+        decoded = self.decode_cache.peek(frame.f_code)
+        if decoded is None or decoded.cfg is None or not decoded.cfg.stack_bounded:
+            new_size = frame.stack_pointer + 1 + len(vals)
+            if new_size > frame.f_code.co_stacksize:
+                print(
+                    f"***Warning: exceeding declared max stacksize; have {new_size}, "
+                    f"max size: {frame.f_code.co_stacksize}"
+                )
+        PyVM.push(self, val, *vals)
 
     def set(self, i: int, value):
-        """Set a value at stack position i."""
-        self.frame.stack[-i] = value
+        """Set a value at stack position i, counting from 1 at the top."""
+        frame = self.frame
+        frame.stack[frame.stack_pointer - i] = value
+
+    def stack_truncate(self, level: int):
+        """Pop and discard values until the stack has `level` entries."""
+        frame = self.frame
+        stack = frame.stack
+        for i in range(level, frame.stack_pointer):
+            stack[i] = None
+        frame.stack_pointer = level
 
     def top(self):
         """Return the value at the top of the stack, with no changes."""
-        return self.frame.stack[-1]
+        frame = self.frame
+        return frame.stack[frame.stack_pointer - 1]
 
     # end of frame stack operations
     # onto frame block operations..
@@ -253,7 +483,7 @@ class PyVM(object):
 
     def push_block(self, type, handler=None, level=None):
         if level is None:
-            level = len(self.frame.stack)
+            level = self.frame.stack_pointer
         self.frame.block_stack.append(Block(type, handler, level))
 
     def top_block(self):
@@ -283,18 +513,30 @@ class PyVM(object):
         self.frame.fallthrough = False
 
     def make_frame(
-        self, code, callargs={}, f_globals=None, f_locals=None, closure=None
+        self,
+        code,
+        callargs={},
+        f_globals=None,
+        f_locals=None,
+        closure=None,
+        fastlocals=None,
     ):
+        """Make a frame to run `code`. The arguments of a function call
+        can be given either as a dictionary, `callargs`, or as a list
+        of the initial values of all fast locals, `fastlocals`. See
+        `pyobj.BindingPlan`.
+        """
         # The callargs default is safe because we never modify the dict.
         # pylint: disable=dangerous-default-value
 
-        log.debug(
-            "make_frame: code=%r, callargs=%s, f_globals=%r, f_locals=%r",
-            code,
-            repper(callargs),
-            (type(f_globals), id(f_globals)),
-            (type(f_locals), id(f_locals)),
-        )
+        if self.log_debug:
+            log.debug(
+                "make_frame: code=%r, callargs=%s, f_globals=%r, f_locals=%r",
+                code,
+                repper(callargs),
+                (type(f_globals), id(f_globals)),
+                (type(f_locals), id(f_locals)),
+            )
         if f_globals is not None:
             f_globals = f_globals
             if f_locals is None:
@@ -313,24 +555,64 @@ class PyVM(object):
             }
 
         # Implement NEWLOCALS flag. See Objects/frameobject.c in CPython.
-        if code.co_flags & CO_NEWLOCALS:
-            f_locals = {"__locals__": {}}
-
-        f_locals.update(callargs)
-        frame = Frame(
-            f_code=code,
-            f_globals=f_globals,
-            f_locals=f_locals,
-            f_back=self.frame,
-            version=self.version,
-            closure=closure,
-        )
+        # Frame() moves the locals of optimized code into fast locals.
+        if fastlocals is not None and not callargs and (
+            code.co_flags & (CO_NEWLOCALS | CO_OPTIMIZED)
+            == (CO_NEWLOCALS | CO_OPTIMIZED)
+        ):
+            # The frame makes its f_locals dictionary if it is asked for.
+            f_locals = None
+        elif code.co_flags & CO_NEWLOCALS:
+            f_locals = dict(callargs)
+            if "__locals__" in code.co_varnames:
+                # A Python 3.2 or 3.3 class body; see STORE_LOCALS.
+                f_locals.setdefault("__locals__", {})
+        else:
+            f_locals.update(callargs)
+        decoded = self.decode_cache.get(code)
+        if f_locals is None and decoded.free_frames:
+            frame = decoded.free_frames.pop()
+            frame.reuse(f_globals, self.frame, fastlocals)
+        else:
+            frame = Frame(
+                f_code=code,
+                f_globals=f_globals,
+                f_locals=f_locals,
+                f_back=self.frame,
+                version=self.version,
+                closure=closure,
+                line_table=decoded.line_table,
+                fastlocals=fastlocals,
+            )
+
+        if self.log_debug:
+            log.debug("%r", frame)
+        return frame
 
-        # THINK ABOUT: should this go into making the frame?
-        frame.linestarts = dict(self.opc.findlinestarts(code, dup_lines=True))
+    def free_frame(self, frame):
+        """Keep `frame`, which has returned, for make_frame() to reuse
+        for another call of its code. This saves making a new Frame and
+        its stack each time a function is called.
 
-        log.debug("%r", frame)
-        return frame
+        Only frames of optimized code without cells are kept, and not
+        those that have escaped: taken by a generator, a traceback,
+        locals() or a tracer. There are at most
+        `frame_free_list_size` of them for a code object.
+        """
+        if (
+            frame.escaped
+            or frame.fastlocals is None
+            or frame.cells is not None
+            or frame.generator is not None
+            or frame.f_trace is not None
+        ):
+            return
+        decoded = self.decode_cache.peek(frame.f_code)
+        if decoded is not None:
+            free_frames = decoded.free_frames
+            if len(free_frames) < self.frame_free_list_size:
+                frame.retire()
+                free_frames.append(frame)
 
     def push_frame(self, frame):
         self.frames.append(frame)
@@ -356,9 +638,34 @@ class PyVM(object):
             if line:
                 print("    " + line.strip())
 
+    def traceback_here(self, frame, exception=None) -> TracebackRecord:
+        """Note that an exception is passing through `frame`. This is
+        analogous to CPython's PyTraceBack_Here().
+
+        `exception` is the exception value, which defaults to that of
+        `self.last_exception`. Entries for the same exception accumulate
+        in one TracebackRecord; a different exception starts a new one.
+        """
+        if exception is None:
+            exception = self.last_exception[1]
+        record = self.traceback_record
+        if record is None or record.exception is not exception:
+            record = self.traceback_record = TracebackRecord(exception)
+        record.add(frame)
+        frame.escape()
+        return record
+
+    @property
+    def last_traceback(self) -> Optional[Traceback]:
+        """The Traceback for the most recent exception. It is built from
+        `traceback_record` the first time it is asked for."""
+        record = self.traceback_record
+        return None if record is None else record.to_traceback()
+
     def resume_frame(self, frame):
         frame.f_back = self.frame
-        log.debug("resume_frame: %r", frame)
+        if self.log_debug:
+            log.debug("resume_frame: %r", frame)
 
         # Make sure we advance to the next instruction after where we left off.
         if frame.f_lasti == -1:
@@ -378,9 +685,31 @@ class PyVM(object):
     # End Frame operations.
     ##############################################
 
+    def check_logging(self):
+        """Note which of our log levels are enabled.
+
+        The per-instruction and per-call logging checks these flags
+        rather than asking `logging` each time, so that when logging is
+        off it costs next to nothing. This is called by `run_code()`, so
+        a change in log level takes effect at the next run.
+        """
+        # INFO logs each instruction; DEBUG adds stacks, frames and calls.
+        self.log_info = log.isEnabledFor(logging.INFO)
+        self.log_debug = log.isEnabledFor(logging.DEBUG)
+
     # This is the main entry point
     def run_code(self, code, f_globals=None, f_locals=None, toplevel=True):
         """run code using f_globals and f_locals in our VM"""
+        self.check_logging()
+        verifier = self.verifier
+        if verifier is not None and verifier not in self.decode_cache.passes:
+            # Nothing would check the code, or let go of it, once it is
+            # decoded.
+            verifier = None
+        if verifier is not None:
+            verifier.verify_tree(code)
+        if self.aot is not None:
+            self.aot.translate_tree(code)
         frame = self.make_frame(code, f_globals=f_globals, f_locals=f_locals)
         try:
             val = self.eval_frame(frame)
@@ -397,26 +726,31 @@ class PyVM(object):
                     tail = "\n".join(le1.args)
                 print(tail)
             raise
+        finally:
+            if toplevel and verifier is not None:
+                verifier.forget()
 
         # Frame ran to normal completion... check some invariants
         if toplevel:
             if self.frames:  # pragma: no cover
                 raise PyVMError("Frames left over!")
-            if self.frame and self.frame.stack:  # pragma: no cover
-                raise PyVMError(f"Data left on stack! {self.frame.stack!r}")
+            if self.frame and self.frame.stack_pointer:  # pragma: no cover
+                raise PyVMError(
+                    f"Data left on stack! {self.frame.stack_values()!r}"
+                )
 
         return val
 
     def unwind_block(self, block):
-        if block.type == "except-handler":
+        if block.type == BLOCK_EXCEPT_HANDLER:
             offset = 3
         else:
             offset = 0
 
-        while len(self.frame.stack) > block.level + offset:
-            self.pop()
+        if self.frame.stack_pointer > block.level + offset:
+            self.stack_truncate(block.level + offset)
 
-        if block.type == "except-handler":
+        if block.type == BLOCK_EXCEPT_HANDLER:
             tb, value, exctype = self.popn(3)
             self.last_exception = exctype, value, tb
 
@@ -428,95 +762,48 @@ class PyVM(object):
         """
 
         f = self.frame
-        f_code = f.f_code
-        co_code = f_code.co_code
-        extended_arg = 0
-
-        # Note: There is never more than one argument.
-        # The list size is used to indicate whether an argument
-        # exists or not.
-        # FIMXE: remove and use int_arg as a indicator of whether
-        # the argument exists.
-        arguments = []
-        int_arg = None
-
-        while True:
+        if replay:
+            inst = decode_instruction(
+                self.opc, self.version, f.f_code, f.f_lasti, f.linestarts, byte_code
+            )
+            f.fallthrough = True
+        else:
+            instructions = self.decode_cache.get(f.f_code).instructions
             if f.fallthrough:
-                if not replay:
-                    f.f_lasti = next_offset(byte_code, self.opc, f.f_lasti)
+                f.f_lasti = self.next_instruction_offset(instructions, f.f_lasti)
             else:
                 # Jump instructions must set this False.
                 f.fallthrough = True
-            offset = f.f_lasti
-            line_number = self.frame.linestarts.get(offset, None)
-            if line_number is not None:
-                f.f_lineno = line_number
-            if not replay:
-                byte_code = byteint(co_code[offset])
-            bytecode_name = self.opc.opname[byte_code]
-            arg_offset = offset + 1
-            arg = None
-
-            if op_has_argument(byte_code, self.opc):
-                if self.version >= (3, 6):
-                    int_arg = code2num(co_code, arg_offset) | extended_arg
-                    # Note: Python 3.6.0a1 is 2, for 3.6.a3 and beyond we have 1
-                    arg_offset += 1
-                    if byte_code == self.opc.EXTENDED_ARG:
-                        extended_arg = int_arg << 8
-                        continue
-                    else:
-                        extended_arg = 0
-                else:
-                    int_arg = (
-                        code2num(co_code, arg_offset)
-                        + code2num(co_code, arg_offset + 1) * 256
-                        + extended_arg
-                    )
-                    arg_offset += 2
-                    if byte_code == self.opc.EXTENDED_ARG:
-                        extended_arg = int_arg * 65536
-                        continue
-                    else:
-                        extended_arg = 0
-
-                if byte_code in self.opc.CONST_OPS:
-                    arg = f_code.co_consts[int_arg]
-                    if isinstance(arg, UnicodeForPython3):
-                        arg = str(arg)
-                elif byte_code in self.opc.FREE_OPS:
-                    if int_arg < len(f_code.co_cellvars):
-                        arg = f_code.co_cellvars[int_arg]
-                    else:
-                        var_idx = int_arg - len(f.f_code.co_cellvars)
-                        arg = f_code.co_freevars[var_idx]
-                elif byte_code in self.opc.NAME_OPS:
-                    arg = f_code.co_names[int_arg]
-                    if isinstance(arg, UnicodeForPython3):
-                        arg = str(arg)
-                elif byte_code in self.opc.JREL_OPS:
-                    # Many relative jumps are conditional,
-                    # so setting f.fallthrough is wrong.
-                    if self.version >= (3, 10, 0):
-                        int_arg += int_arg
-                    arg = arg_offset + int_arg
-                elif byte_code in self.opc.JABS_OPS:
-                    # We probably could set fallthough, since many (all?)
-                    # of these are unconditional, but we'll make the jump do
-                    # the work of setting.
-                    if self.version >= (3, 10, 0):
-                        int_arg += int_arg
-                    arg = int_arg
-                elif byte_code in self.opc.LOCAL_OPS:
-                    arg = f_code.co_varnames[int_arg]
-                    if isinstance(arg, UnicodeForPython3):
-                        arg = str(arg)
-                else:
-                    arg = int_arg
-                arguments = [arg]
-            break
+            inst = instructions[f.f_lasti]
+            if inst is None:
+                raise PyVMError(
+                    f"No instruction at offset {f.f_lasti} of {f.f_code.co_name}"
+                )
+            f.f_lasti = inst.offset
+
+        line_number = inst.line_number
+        if line_number is not None:
+            f.f_lineno = line_number
+
+        return (
+            inst.opname,
+            inst.opcode,
+            inst.int_arg,
+            list(inst.arguments),
+            inst.offset,
+            line_number,
+        )
 
-        return bytecode_name, byte_code, int_arg, arguments, offset, line_number
+    def next_instruction_offset(self, instructions: list, offset: int) -> int:
+        """Return the offset of the instruction after the one at `offset`."""
+        inst = instructions[offset]
+        if inst is not None:
+            return inst.next_offset
+        # `offset` isn't the start of an instruction. This happens when
+        # an instruction is restarted by jumping to just before it,
+        # as YIELD_FROM does. Do what the bytecode says.
+        co_code = self.frame.f_code.co_code
+        return next_offset(byteint(co_code[offset]), self.opc, offset)
 
     def log(self, bytecode_name, int_arg, arguments, offset, line_number):
         """Log arguments, block stack, and data stack for each opcode."""
@@ -528,44 +815,34 @@ class PyVM(object):
             arguments,
             offset,
             line_number,
-            log.isEnabledFor(logging.DEBUG),
+            self.log_debug,
             vm=self,
         )
         indent = "    " * (len(self.frames) - 1)
-        stack_rep = repper(self.frame.stack)
-        block_stack_rep = repper(self.frame.block_stack)
-
-        log.debug(f"  {indent}frame.stack: {stack_rep}")
-        log.debug(f"  {indent}blocks     : {block_stack_rep}")
-        log.info(f"{indent}{op}")
+        if self.log_debug:
+            log.debug("  %sframe.stack: %s", indent, repper(self.frame.stack_values()))
+            log.debug("  %sblocks     : %s", indent, repper(self.frame.block_stack))
+        log.info("%s%s", indent, op)
 
-    def dispatch(self, bytecode_name, int_arg, arguments, offset, line_number):
+    def dispatch(
+        self, bytecode_name, int_arg, arguments, offset, line_number, bytecode_fn=None
+    ):
         """Dispatch by bytecode_name to the corresponding methods.
-        Exceptions are caught and set on the virtual machine."""
+        Exceptions are caught and set on the virtual machine.
+
+        If `bytecode_fn` is given, it is the already-resolved method for
+        `bytecode_name`, and is called directly. Otherwise it is looked up
+        in `self.dispatch_table`.
+        """
 
         why = None
         self.in_exception_processing = False
-        byteop = self.byteop
         try:
-            if bytecode_name.startswith("UNARY_"):
-                byteop.unaryOperator(bytecode_name[6:])
-            elif bytecode_name.startswith("BINARY_"):
-                if self.version < (3, 11):
-                    byteop.binaryOperator(bytecode_name[7:])
-                else:
-                    byteop.binaryOperator(_nb_ops[int_arg][0][3:])
-
-            elif bytecode_name.startswith("INPLACE_"):
-                byteop.inplaceOperator(bytecode_name[8:])
-            elif "SLICE+" in bytecode_name:
-                self.sliceOperator(bytecode_name)
-            else:
-                # dispatch
-                if hasattr(byteop, bytecode_name):
-                    bytecode_fn = getattr(byteop, bytecode_name, None)
-                else:
-                    bytecode_fn = None
-                if not bytecode_fn:  # pragma: no cover
+            if bytecode_fn is None:
+                opcode = self.opc.opmap.get(bytecode_name)
+                if opcode is not None:
+                    bytecode_fn = self.dispatch_table[opcode]
+                if bytecode_fn is None:  # pragma: no cover
                     raise PyVMError(
                         "Unknown bytecode type: %s\n\t%s"
                         % (
@@ -582,7 +859,7 @@ class PyVM(object):
                             bytecode_name,
                         )
                     )
-                why = bytecode_fn(*arguments)
+            why = bytecode_fn(*arguments)
 
         except Exception:
             # Deal with exceptions encountered while executing the op.
@@ -590,97 +867,141 @@ class PyVM(object):
 
             # FIXME: dry code
             if not self.in_exception_processing:
-                if self.last_exception[0] != SystemExit:
+                if self.log_info and self.last_exception[0] != SystemExit:
                     log.info(
-                        (
-                            "exception in the execution of "
-                            "instruction:\n\t%s"
-                            % self.format_instruction(
-                                self.frame,
-                                self.opc,
-                                bytecode_name,
-                                int_arg,
-                                arguments,
-                                offset,
-                                line_number,
-                                False,
-                            )
-                        )
+                        "exception in the execution of instruction:\n\t%s",
+                        self.format_instruction(
+                            self.frame,
+                            self.opc,
+                            bytecode_name,
+                            int_arg,
+                            arguments,
+                            offset,
+                            line_number,
+                            False,
+                        ),
                     )
-                if not self.last_traceback:
-                    self.last_traceback = traceback_from_frame(self.frame)
                 self.in_exception_processing = True
 
-            why = "exception"
+            # The exception may have come up from an interpreted function
+            # run in a nested eval_frame(); either way it has now reached
+            # this frame.
+            self.traceback_here(self.frame)
+
+            why = WHY_EXCEPTION
 
         return why
 
-    def manage_block_stack(self, why):
+    def run_threaded(self, threaded, offset: int):
+        """Run the current frame's threaded code `threaded` starting at
+        `offset` until we come to an instruction that has no threaded
+        form. The frame is left set to run that instruction next.
+
+        Exceptions are caught and set on the virtual machine, as in
+        dispatch(), and WHY_EXCEPTION is returned. Otherwise the return
+        value is None.
+        """
+        self.in_exception_processing = False
+        try:
+            op = threaded[offset]
+            while op is not None:
+                offset = op()
+                op = threaded[offset]
+        except Exception:
+            # The frame's f_lasti is that of the instruction that raised.
+            self.last_exception = sys.exc_info()
+            self.in_exception_processing = True
+            self.traceback_here(self.frame)
+            return WHY_EXCEPTION
+        frame = self.frame
+        frame.f_lasti = offset
+        frame.fallthrough = False
+        return None
+
+    def run_registers(self, registers, offset: int):
+        """Run the current frame's register code `registers` starting at
+        `offset`; see RegisterCode.run(). Unless the code returns, the
+        frame's f_lasti is left at the instruction to run next.
+
+        Exceptions are caught and set on the virtual machine, as in
+        dispatch(), and WHY_EXCEPTION is returned.
+        """
+        self.in_exception_processing = False
+        try:
+            return registers.run(self.frame, offset)
+        except Exception:
+            # The frame's f_lasti is that of the instruction that raised.
+            self.last_exception = sys.exc_info()
+            self.in_exception_processing = True
+            self.traceback_here(self.frame)
+            return WHY_EXCEPTION
+
+    def manage_block_stack(self, why: int) -> Optional[int]:
         """Manage a frame's block stack.
         Manipulate the block stack and data stack for looping,
-        exception handling, or returning."""
-        assert why != "yield"
+        exception handling, or returning.
 
-        block = self.frame.block_stack[-1]
-        if block.type == "loop" and why == "continue":
-            self.jump(self.return_value)
-            why = None
-            return why
+        `why` is one of the WHY_ values in xpython.pyobj. The WHY_ value
+        to go on unwinding the block stack with is returned, or None if
+        control has been passed to the block's handler."""
+        assert why != WHY_YIELD
 
-        if not (block.type == "except-handler" and why == "silenced"):
+        block = self.frame.block_stack[-1]
+        kind = block.type
+        if kind == BLOCK_LOOP:
+            if why == WHY_CONTINUE:
+                self.jump(self.return_value)
+                return None
             self.pop_block()
             self.unwind_block(block)
-
-        if block.type == "loop" and why == "break":
-            why = None
-            self.jump(block.handler)
+            if why == WHY_BREAK:
+                self.jump(block.handler)
+                return None
             return why
 
+        if kind == BLOCK_EXCEPT_HANDLER and why == WHY_SILENCED:
+            # 3.5+ WITH_CLEANUP_FINISH
+            # Nothing needs to be done here.
+            return None
+
+        self.pop_block()
+        self.unwind_block(block)
+
         if self.version < (3, 0):
             if (
-                block.type == "finally"
-                or (block.type == "setup-except" and why == "exception")
-                or block.type == "with"
+                kind == BLOCK_FINALLY
+                or kind == BLOCK_WITH
+                or (kind == BLOCK_SETUP_EXCEPT and why == WHY_EXCEPTION)
             ):
-                if why == "exception":
+                if why == WHY_EXCEPTION:
                     exctype, value, tb = self.last_exception
                     self.push(tb, value, exctype)
                 else:
-                    if why in ("return", "continue"):
+                    if why == WHY_RETURN or why == WHY_CONTINUE:
                         self.push(self.return_value)
-                    self.push(why)
-
-                why = None
-                self.jump(block.handler)
-                return why
-
-        else:
-            if why == "exception" and block.type in ["setup-except", "finally"]:
-                self.push_block("except-handler")
-                exctype, value, tb = self.last_exception
-                self.push(tb, value, exctype)
-                # PyErr_Normalize_Exception goes here
-                self.push(tb, value, exctype)
-                why = None
+                    self.push(WHY_NAMES[why])
                 self.jump(block.handler)
-                return why
+                return None
 
-            elif block.type == "finally":
-                if why in ("return", "continue"):
-                    self.push(self.return_value)
-                self.push(why)
+        elif why == WHY_EXCEPTION and (
+            kind == BLOCK_SETUP_EXCEPT or kind == BLOCK_FINALLY
+        ):
+            self.push_block(BLOCK_EXCEPT_HANDLER)
+            exctype, value, tb = self.last_exception
+            self.push(tb, value, exctype)
+            # PyErr_Normalize_Exception goes here
+            self.push(tb, value, exctype)
+            self.jump(block.handler)
+            return None
 
-                why = None
-                self.jump(block.handler)
-                return why
-            elif block.type == "except-handler" and why == "silenced":
-                # 3.5+ WITH_CLEANUP_FINISH
-                # Nothing needs to be done here.
-                return None
-            elif why == "return":
-                # 3.8+ END_FINALLY
-                pass
+        elif kind == BLOCK_FINALLY:
+            if why == WHY_RETURN or why == WHY_CONTINUE:
+                self.push(self.return_value)
+            self.push(WHY_NAMES[why])
+            self.jump(block.handler)
+            return None
 
+        # 3.8+ END_FINALLY's WHY_RETURN gets here.
         return why
 
     # Interpreter main loop
@@ -698,63 +1019,152 @@ class PyVM(object):
             frame.f_lasti = 0
             # Don't increment before fetching next instruction.
             frame.fallthrough = False
-            byte_code = None
-        else:
-            byte_code = byteint(self.f_code.co_code[frame.f_lasti])
-            # byte_code == opcode["YIELD_VALUE"]?
 
+        # Whether to log each instruction is decided once, not per
+        # instruction; see check_logging(). Superinstructions, threaded
+        # and register code aren't used when instructions are logged, so
+        # that each instruction that runs is logged.
+        log_info = self.log_info
+        decoded = self.decode_cache.get(frame.f_code)
+        instructions = decoded.unfused if log_info else decoded.instructions
+        threaded = None if log_info else decoded.threaded
+        registers = None if log_info else decoded.registers
+
+        # Calls to interpreted functions may be run in this loop rather
+        # than in a nested eval_frame(); see inline_calls. `entry_frame`
+        # is the frame we were called to run, and `frame` is the frame
+        # currently running.
+        entry_frame = frame
         self.push_frame(frame)
         offset = 0
         while True:
-            (
-                bytecode_name,
-                byte_code,
-                int_arg,
-                arguments,
-                offset,
-                line_number,
-            ) = self.parse_byte_and_args(byte_code)
-            if log.isEnabledFor(logging.INFO):
-                self.log(bytecode_name, int_arg, arguments, offset, line_number)
-
-            # When unwinding the block stack, we need to keep track of why we
-            # are doing it.
-            why = self.dispatch(bytecode_name, int_arg, arguments, offset, line_number)
-            if why == "exception":
+            if frame.fallthrough:
+                inst = instructions[frame.f_lasti]
+                if inst is not None:
+                    offset = inst.next_offset
+                else:
+                    offset = self.next_instruction_offset(instructions, frame.f_lasti)
+            else:
+                # Jump instructions must set this False.
+                offset = frame.f_lasti
+                frame.fallthrough = True
+            if threaded is not None and threaded[offset] is not None:
+                why = self.run_threaded(threaded, offset)
+                if why is None:
+                    # We have come to an instruction that has to be run
+                    # through dispatch().
+                    continue
+            else:
+                why = None
+                if registers is not None and registers.blocks[offset] is not None:
+                    why = self.run_registers(registers, offset)
+                    # Unless it returned or raised, run the instruction
+                    # the register code stopped at.
+                    offset = frame.f_lasti
+                if why is None:
+                    inst = instructions[offset]
+                    if inst is None:
+                        raise PyVMError(
+                            f"No instruction at offset {offset} of "
+                            f"{frame.f_code.co_name}"
+                        )
+                    (
+                        byte_code,
+                        bytecode_name,
+                        bytecode_fn,
+                        int_arg,
+                        arguments,
+                        offset,
+                        _,
+                        line_number,
+                    ) = inst
+                    frame.f_lasti = offset
+                    if line_number is not None:
+                        frame.f_lineno = line_number
+
+                    if log_info:
+                        self.log(
+                            bytecode_name, int_arg, arguments, offset, line_number
+                        )
+
+                    # When unwinding the block stack, we need to keep track of
+                    # why we are doing it.
+                    why = self.dispatch(
+                        bytecode_name,
+                        int_arg,
+                        arguments,
+                        offset,
+                        line_number,
+                        bytecode_fn,
+                    )
+                    if why == WHY_CALL:
+                        # Start running the called function's frame.
+                        frame = self.call_frame
+                        self.call_frame = None
+                        frame.f_lasti = 0
+                        frame.fallthrough = False
+                        self.push_frame(frame)
+                        decoded = self.decode_cache.get(frame.f_code)
+                        instructions = (
+                            decoded.unfused if log_info else decoded.instructions
+                        )
+                        threaded = None if log_info else decoded.threaded
+                        registers = None if log_info else decoded.registers
+                        continue
+
+            if why == WHY_EXCEPTION:
                 # TODO: ceval calls PyTraceBack_Here, not sure what that does.
 
                 # Deal with exceptions encountered while executing the op.
                 if not self.in_exception_processing:
                     # FIXME: DRY code
-                    if self.last_exception[0] != SystemExit:
+                    if log_info and self.last_exception[0] != SystemExit:
                         log.info(
-                            (
-                                "exception in the execution of "
-                                "instruction:\n\t%s"
-                                % self.format_instruction(
-                                    frame,
-                                    self.opc,
-                                    bytecode_name,
-                                    int_arg,
-                                    arguments,
-                                    offset,
-                                    line_number,
-                                    False,
-                                )
-                            )
+                            "exception in the execution of instruction:\n\t%s",
+                            self.format_instruction(
+                                frame,
+                                self.opc,
+                                bytecode_name,
+                                int_arg,
+                                arguments,
+                                offset,
+                                line_number,
+                                False,
+                            ),
                         )
-                    if self.last_traceback is None:
-                        self.last_traceback = traceback_from_frame(frame)
+                    self.traceback_here(frame)
                     self.in_exception_processing = True
 
-            elif why == "reraise":
-                why = "exception"
+            elif why == WHY_RERAISE:
+                why = WHY_EXCEPTION
 
-            if why != "yield":
+            if why != WHY_YIELD:
                 while why and frame.block_stack:
                     # Deal with any block management we need to do.
                     why = self.manage_block_stack(why)
 
+            if why and frame is not entry_frame:
+                # A function called from this loop has finished. Go back
+                # to its caller, passing on the return value or exception.
+                while why and frame is not entry_frame:
+                    self.pop_frame()
+                    returned = frame
+                    frame = self.frame
+                    if why == WHY_EXCEPTION:
+                        self.traceback_here(frame)
+                        while why and frame.block_stack:
+                            why = self.manage_block_stack(why)
+                    else:
+                        if why == WHY_RETURN:
+                            self.free_frame(returned)
+                        self.in_exception_processing = False
+                        self.push(self.return_value)
+                        why = None
+                decoded = self.decode_cache.get(frame.f_code)
+                instructions = decoded.unfused if log_info else decoded.instructions
+                threaded = None if log_info else decoded.threaded
+                registers = None if log_info else decoded.registers
+
             if why:
                 break
 
@@ -762,10 +1172,10 @@ class PyVM(object):
 
         self.pop_frame()
 
-        if why == "exception":
+        if why == WHY_EXCEPTION:
             last_exception = self.last_exception
             if last_exception and last_exception[0]:
-                if isinstance(last_exception[2], Traceback):
+                if isinstance(last_exception[2], (Traceback, TracebackRecord)):
                     if not self.frame:
                         if isinstance(last_exception, tuple):
                             self.last_exception = PyVMUncaughtException.from_tuple(
@@ -784,29 +1194,6 @@ class PyVM(object):
         self.in_exception_processing = False
         return self.return_value
 
-    # Operators
-
-    def sliceOperator(self, op):
-        start = 0
-        end = None  # we will take this to mean end
-        op, count = op[:-2], int(op[-1])
-        if count == 1:
-            start = self.pop()
-        elif count == 2:
-            end = self.pop()
-        elif count == 3:
-            end = self.pop()
-            start = self.pop()
-        slice_len = self.pop()
-        if end is None:
-            end = len(slice_len)
-        if op.startswith("STORE_"):
-            slice_len[start:end] = self.pop()
-        elif op.startswith("DELETE_"):
-            del slice_len[start:end]
-        else:
-            self.push(slice_len[start:end])
-
 
 if __name__ == "__main__":
     # Simplest of tests
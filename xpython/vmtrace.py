@@ -8,7 +8,7 @@ from xdis import IS_PYPY, PYTHON_VERSION_TRIPLE, codeType2Portable
 # We will add a new "DEBUG" opcode
 from xdis.opcodes.base import def_op
 
-from xpython.pyobj import Frame, traceback_from_frame
+from xpython.pyobj import WHY_EXCEPTION, WHY_RERAISE, WHY_RETURN, WHY_YIELD, Frame
 from xpython.vm import PyVM, PyVMError, byteint, format_instruction
 
 log = logging.getLogger(__name__)
@@ -90,6 +90,15 @@ class PyVMTraced(PyVM):
         )
         self.event_flags = event_flags
         self.callback = callback
+        # Our eval_frame() reports call and return events for each
+        # frame, so each call needs its own eval_frame().
+        self.inline_calls = False
+        # We dispatch through dispatch_table rather than the decoded
+        # instructions' handlers, so there is no point quickening or
+        # fusing them.
+        self.decode_cache.passes = ()
+        # The callback can keep any frame it is shown.
+        self.frame_free_list_size = 0
         # Add a new opcode to allow us high-speed breakpoints
 
         # FIXME: older xdis uses  "self.opc.l" instead of "self.opc.loc"
@@ -97,6 +106,7 @@ class PyVMTraced(PyVM):
             if hasattr(self.opc, "l"):
                 self.opc.loc = self.opc.l
         def_op(self.opc.loc, "BRKPT", BREAKPOINT_OP, 0, 0)
+        self.dispatch_table = self.byteop.dispatch_table(self.opc)
 
     def add_breakpoint(self, frame: Frame, offset: int):
         """
@@ -110,6 +120,8 @@ class PyVMTraced(PyVM):
         # Convert its bytecode bytes to a list, update the list and replace this back in
         # the code.
         code = codeType2Portable(frame.f_code, self.version)
+        if frame.brkpt is None:
+            frame.brkpt = {}
         frame.brkpt[offset] = code.co_code[offset]
         bytecode = list(code.co_code)
         bytecode[offset] = BREAKPOINT_OP
@@ -175,6 +187,7 @@ class PyVMTraced(PyVM):
                         [],
                         self,
                     )
+                    frame.locals_to_fast()
                 pass
         else:
             byte_code = byteint(frame.f_code.co_code[frame.f_lasti])
@@ -190,6 +203,7 @@ class PyVMTraced(PyVM):
                     [],
                     self,
                 )
+                frame.locals_to_fast()
                 pass
             # byte_code == opcode["YIELD_VALUE"]?
 
@@ -201,11 +215,8 @@ class PyVMTraced(PyVM):
             elif result == "return":
                 return self.return_value
 
-        self.frame.linestarts = dict(
-            self.opc.findlinestarts(frame.f_code, dup_lines=True)
-        )
-
         opoffset = 0
+        log_info = self.log_info
         while True:
             (
                 byte_name,
@@ -216,7 +227,7 @@ class PyVMTraced(PyVM):
                 line_number,
             ) = self.parse_byte_and_args(byte_code)
 
-            if log.isEnabledFor(logging.INFO):
+            if log_info:
                 self.log(byte_name, intArg, arguments, opoffset, line_number)
 
             if (
@@ -234,6 +245,7 @@ class PyVMTraced(PyVM):
                     arguments,
                     self,
                 )
+                frame.locals_to_fast()
             elif frame.f_trace and frame.event_flags & PyVMEVENT_INSTRUCTION:
                 result = frame.f_trace(
                     "instruction",
@@ -245,6 +257,7 @@ class PyVMTraced(PyVM):
                     arguments,
                     self,
                 )
+                frame.locals_to_fast()
             else:
                 result = True
 
@@ -262,7 +275,7 @@ class PyVMTraced(PyVM):
                     continue
                 elif result == "return":
                     # Immediate return with value
-                    why = result
+                    why = WHY_RETURN
                     break
                 elif result == "finish":
                     # Continue execution without tracing
@@ -272,16 +285,16 @@ class PyVMTraced(PyVM):
             # are doing it.
             why = self.dispatch(byte_name, intArg, arguments, opoffset, line_number)
 
-            if why == "exception":
+            if why == WHY_EXCEPTION:
                 # Deal with exceptions encountered while executing the op.
                 if not self.in_exception_processing:
-                    self.last_traceback = traceback_from_frame(self.frame)
+                    self.traceback_here(self.frame)
                     self.in_exception_processing = True
 
-            elif why == "reraise":
-                why = "exception"
+            elif why == WHY_RERAISE:
+                why = WHY_EXCEPTION
 
-            if why != "yield":
+            if why != WHY_YIELD:
                 while why and frame.block_stack:
                     # Deal with any block management we need to do.
                     why = self.manage_block_stack(why)
@@ -292,7 +305,7 @@ class PyVMTraced(PyVM):
             pass  # while True
 
         callback = frame.f_trace or self.callback
-        if why == "exception":
+        if why == WHY_EXCEPTION:
             if (
                 callback
                 and frame
@@ -323,7 +336,7 @@ class PyVMTraced(PyVM):
 
         self.pop_frame()
 
-        if why == "exception":
+        if why == WHY_EXCEPTION:
             if self.last_exception and self.last_exception[0]:
                 # For now, we are dropping the traceback;
                 # ".with_excpetion(self.last_exception[2])